@@ -1,41 +1,201 @@
-import json
+import time
+
+_PROCESS_STARTED = time.perf_counter()
+
+import hmac
 import os
-import joblib
-import numpy as np
-import pandas as pd
-import xgboost as xgb
-from flask import Flask, request, jsonify, render_template
+import threading
+from datetime import datetime
+
+from flask import Flask, Response, request, jsonify, render_template
 from flask_cors import CORS
 
+from inference import (DEFAULT_BUNDLE_DIR, NATIVE_BATCH_ROWS as DEFAULT_NATIVE_BATCH_ROWS, load_model_bundle, parse_case,
+                       parse_tier_hint, peak_rss_mb)
+from metrics import (DEFAULT_DIR as METRICS_DEFAULT_DIR, Counter, Histogram, MultiProcessCollector, StageTimer,
+                     collect, render)
+from micro_batch import MicroBatcher
+from profiling import ProfilingMiddleware, SamplingProfiler
+import topology
+
 app = Flask(__name__, template_folder='templates')
 CORS(app)
 
-# --- LOAD ARTIFACTS ---
-model = None
-le = None
-model_features = None
-metrics = None
+# --- CONFIGURATION ---
 APP_VERSION = "4.2.1"
 GIT_COMMIT = os.environ.get("RENDER_GIT_COMMIT")
+MAX_BATCH_SIZE = int(os.environ.get("MAX_BATCH_SIZE", 1000))
+# Fast-start bundle written by train_model.py; legacy .pkl artifacts are used when it is absent
+BUNDLE_DIR = os.environ.get("MODEL_BUNDLE_DIR", DEFAULT_BUNDLE_DIR)
+# "xgboost" (default) or "native" (flattened NumPy evaluator from tree_engine.py)
+INFERENCE_ENGINE = os.environ.get("INFERENCE_ENGINE", "xgboost").lower()
+# With the native engine, batches of more rows than this are scored by XGBoost (0 keeps every batch native)
+NATIVE_BATCH_ROWS = int(os.environ.get("NATIVE_BATCH_ROWS", DEFAULT_NATIVE_BATCH_ROWS))
+# Opt-in: route requests that name no tier to per-species shards when the bundle has them (loaded on first use)
+SPECIES_SHARDS = os.environ.get("SPECIES_SHARDS", "0").lower() in ("1", "true", "yes")
+# Max cached confidence vectors; 0 disables the prediction cache
+PREDICTION_CACHE_SIZE = int(os.environ.get("PREDICTION_CACHE_SIZE", 4096))
+# Coalesce concurrent /predict rows into one model call (0 disables; needs a threaded server)
+MICRO_BATCH_SIZE = int(os.environ.get("MICRO_BATCH_SIZE", 0))
+MICRO_BATCH_WAIT_MS = float(os.environ.get("MICRO_BATCH_WAIT_MS", 2.0))
+# Shared secret for /admin/* (admin endpoints are disabled when unset)
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")
+# Seconds between checks of the bundle manifest for a new model (0 disables the watcher)
+MODEL_WATCH_INTERVAL = float(os.environ.get("MODEL_WATCH_INTERVAL", 0))
+
+# XGBoost threads per worker: MODEL_THREADS, or the usable CPUs split evenly across gunicorn workers (see topology.py)
+MODEL_THREADS = topology.model_threads()
+
+# Shared directory for per-worker metric snapshots so /metrics covers every gunicorn worker ("" = this process only)
+METRICS_DIR = os.environ.get("METRICS_DIR", METRICS_DEFAULT_DIR)
+
+# Fraction of /predict* requests to profile (0 = off; `X-Profile: 1` with the admin token also works when ADMIN_TOKEN is set)
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", 0))
+PROFILE_INTERVAL_MS = float(os.environ.get("PROFILE_INTERVAL_MS", 1.0))
+# Aggregated collapsed stacks are written here every PROFILE_FLUSH_SECONDS
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "profiles")
+PROFILE_FLUSH_SECONDS = float(os.environ.get("PROFILE_FLUSH_SECONDS", 60))
+
+micro_batcher = MicroBatcher(MICRO_BATCH_SIZE, MICRO_BATCH_WAIT_MS) if MICRO_BATCH_SIZE > 1 else None
+
+# --- METRICS ---
+metrics_collector = MultiProcessCollector(METRICS_DIR) if METRICS_DIR else None
+REQUESTS = Counter('avital_requests_total', 'Prediction requests by endpoint and HTTP status.', ('endpoint', 'status'))
+REQUEST_SECONDS = Histogram('avital_request_duration_seconds', 'Prediction request handling time.', ('endpoint',))
+STAGE_SECONDS = Histogram(
+    'avital_request_stage_seconds',
+    'Time per request stage: parse, validate, features, predict, postprocess, serialize.',
+    ('endpoint', 'stage'),
+)
+PREDICTIONS = Counter('avital_predictions_total', 'Reported diagnoses by disease and tier.', ('disease', 'tier'))
+FALLBACKS = Counter(
+    'avital_prediction_fallbacks_total',
+    'Post-processing branches taken: pattern_match, unknown_infection, low_confidence.',
+    ('branch',),
+)
+ERRORS = Counter('avital_errors_total', 'Failed requests and batch items by endpoint and reason.', ('endpoint', 'reason'))
+BATCH_CASES = Histogram('avital_batch_cases', 'Cases per /predict/batch request.', (),
+                        buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000))
+
+# --- PROFILING ---
+profiler = SamplingProfiler(PROFILE_DIR, PROFILE_SAMPLE_RATE, PROFILE_INTERVAL_MS, PROFILE_FLUSH_SECONDS)
+if PROFILE_SAMPLE_RATE > 0 or ADMIN_TOKEN:
+    # Not installed at all when profiling can't be triggered
+    app.wsgi_app = ProfilingMiddleware(app.wsgi_app, profiler, admin_token=ADMIN_TOKEN)
+
+# --- LOAD ARTIFACTS ---
+# The serving bundle is swapped as a whole; requests read this reference once and keep it
+current_bundle = None
+_reload_lock = threading.RLock()
+reload_state = {
+    'reloads': 0,
+    'in_progress': False,
+    'last_reload_at': None,
+    'last_error': None,
+}
 
 def load_system():
-    global model, le, model_features, metrics
-    try:
-        print("[*] Loading Neural Network Weights...")
-        model = joblib.load('animal_model.pkl')
-        le = joblib.load('label_encoder.pkl')
-        model_features = joblib.load('model_features.pkl')
+    """Load, warm and smoke-test a new bundle, then swap it in. The old bundle keeps serving on failure."""
+    global current_bundle
+    with _reload_lock:
+        reload_state['in_progress'] = True
         try:
-            with open('training_metrics.json', 'r', encoding='utf-8') as handle:
-                metrics = json.load(handle)
-        except Exception:
-            metrics = None
-        commit_note = f" (commit {GIT_COMMIT[:7]})" if GIT_COMMIT else ""
-        print(f"[+] System Online. Features aligned: {len(model_features)}{commit_note}")
-        return True
-    except Exception as e:
-        print(f"[!] CRITICAL ERROR: {e}")
+            print("[*] Loading Neural Network Weights...")
+            bundle = load_model_bundle(BUNDLE_DIR, INFERENCE_ENGINE, PREDICTION_CACHE_SIZE, SPECIES_SHARDS,
+                                       nthread=MODEL_THREADS, native_batch_rows=NATIVE_BATCH_ROWS)
+            bundle.smoke_test()
+            if current_bundle is None:
+                bundle.load_info['ready_seconds'] = round(time.perf_counter() - _PROCESS_STARTED, 4)
+            else:
+                reload_state['reloads'] += 1
+            current_bundle = bundle
+            reload_state['last_reload_at'] = datetime.utcnow().isoformat() + "Z"
+            reload_state['last_error'] = None
+            commit_note = f" (commit {GIT_COMMIT[:7]})" if GIT_COMMIT else ""
+            print(f"[+] System Online. Features aligned: {len(bundle.features)}{commit_note} "
+                  f"[{bundle.load_info['format']} {bundle.version or ''}, {bundle.load_info['load_seconds']:.2f}s]")
+            return True
+        except Exception as e:
+            reload_state['last_error'] = str(e).splitlines()[0] if str(e) else repr(e)
+            print(f"[!] CRITICAL ERROR: {e}")
+            return False
+        finally:
+            reload_state['in_progress'] = False
+
+def get_bundle():
+    """The serving bundle, loading it on first use; None if loading fails."""
+    bundle = current_bundle
+    if bundle is None:
+        with _reload_lock:
+            if current_bundle is None:
+                load_system()
+            bundle = current_bundle
+    return bundle
+
+def reload_in_background():
+    """Start a reload thread unless one is already running; returns whether one was started."""
+    if reload_state['in_progress']:
         return False
+    threading.Thread(target=load_system, name='model-reload', daemon=True).start()
+    return True
+
+def _manifest_signature():
+    try:
+        stat = os.stat(os.path.join(BUNDLE_DIR, 'manifest.json'))
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+def _watch_manifest():
+    seen = _manifest_signature()
+    while True:
+        time.sleep(MODEL_WATCH_INTERVAL)
+        signature = _manifest_signature()
+        if signature is not None and signature != seen:
+            print("[*] Model manifest changed, reloading...")
+            # A broken manifest is not retried until it changes again
+            seen = signature
+            load_system()
+
+_watcher_pid = None
+
+@app.before_request
+def ensure_watcher():
+    # Started per process so pre-forked gunicorn workers each get their own watcher
+    global _watcher_pid
+    if MODEL_WATCH_INTERVAL > 0 and _watcher_pid != os.getpid():
+        _watcher_pid = os.getpid()
+        threading.Thread(target=_watch_manifest, name='model-watcher', daemon=True).start()
+
+@app.before_request
+def ensure_metrics_flusher():
+    if metrics_collector is not None:
+        metrics_collector.ensure_started()
+
+def finish(endpoint, timer, body, status=200, reason=None):
+    """Serialize a prediction response and record its stage timings, status and error reason."""
+    with timer.stage('serialize'):
+        response = jsonify(body)
+    for stage, seconds in timer.stages.items():
+        STAGE_SECONDS.observe(seconds, endpoint=endpoint, stage=stage)
+    REQUEST_SECONDS.observe(timer.elapsed(), endpoint=endpoint)
+    REQUESTS.inc(endpoint=endpoint, status=status)
+    if reason:
+        ERRORS.inc(endpoint=endpoint, reason=reason)
+    return response, status
+
+def record_outcomes(results, tier):
+    """Count reported diagnoses and which summarize_predictions() branch produced them."""
+    for result in results:
+        if result.get('status') != 'success':
+            continue
+        PREDICTIONS.inc(disease=result['prediction'], tier=tier)
+        if result['prediction'] == 'UNKNOWN INFECTION':
+            FALLBACKS.inc(branch='unknown_infection')
+        elif '(Pattern Match)' in result['reasoning']:
+            FALLBACKS.inc(branch='pattern_match')
+        if '[Low Confidence]' in result['reasoning']:
+            FALLBACKS.inc(branch='low_confidence')
 
 # Initialize
 success = load_system()
@@ -48,144 +208,174 @@ def home():
 
 @app.route('/status', methods=['GET'])
 def status():
+    bundle = current_bundle
     return jsonify({
         'status': 'online', 
-        'model_loaded': model is not None,
+        'model_loaded': bundle is not None,
+        'model_version': bundle.version if bundle else None,
+        'engine': bundle.engine if bundle else None,
+        'startup': bundle.load_info if bundle else {},
+        'peak_rss_mb': peak_rss_mb(),
+        'reload': reload_state,
+        'prediction_cache': bundle.cache.stats() if bundle else None,
+        'default_tier': bundle.default_tier if bundle else None,
+        'tiers': {name: tier.describe() for name, tier in bundle.tiers.items()} if bundle else {},
+        'shards': {species: shard.describe() for species, shard in bundle.shards.items()} if bundle else {},
+        'micro_batching': micro_batcher.stats() if micro_batcher else None,
+        'topology': topology.layout(),
         'version': APP_VERSION,
         'commit': GIT_COMMIT,
-        'metrics': metrics or {}
+        'metrics': (bundle.metrics if bundle else None) or {}
     })
 
+def admin_denied():
+    if not ADMIN_TOKEN:
+        return jsonify({'status': 'error', 'message': 'Admin endpoints are disabled'}), 404
+    if not hmac.compare_digest(request.headers.get('X-Admin-Token', ''), ADMIN_TOKEN):
+        return jsonify({'status': 'error', 'message': 'Invalid admin token'}), 401
+    return None
+
+@app.route('/admin/reload', methods=['POST'])
+def admin_reload():
+    denied = admin_denied()
+    if denied:
+        return denied
+
+    if request.args.get('wait', '').lower() in ('1', 'true', 'yes'):
+        if not load_system():
+            return jsonify({'status': 'error', 'message': reload_state['last_error']}), 500
+        return jsonify({'status': 'success', 'model_version': current_bundle.version})
+
+    if not reload_in_background():
+        return jsonify({'status': 'error', 'message': 'Reload already in progress'}), 409
+    return jsonify({'status': 'accepted'}), 202
+
+@app.route('/admin/profile', methods=['GET'])
+def admin_profile():
+    # Profiles are per worker process: this answers for the worker that handled the request
+    denied = admin_denied()
+    if denied:
+        return denied
+    if request.args.get('format') == 'collapsed':
+        stacks = profiler.collapsed()
+        body = "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+        return Response(body, mimetype='text/plain; charset=utf-8')
+
+    try:
+        top = max(1, min(int(request.args.get('top', 20)), 500))
+    except ValueError:
+        return jsonify({'status': 'error', 'message': "'top' must be an integer"}), 400
+    result = dict(profiler.stats(), status='success', pid=os.getpid(), top=profiler.top_functions(top))
+    if request.args.get('reset', '').lower() in ('1', 'true', 'yes'):
+        profiler.reset()
+    return jsonify(result)
+
 @app.route('/predict', methods=['POST'])
 def predict():
-    if model is None:
-        if not load_system():
-            return jsonify({'status': 'error', 'message': 'System Initialization Failed'}), 503
+    timer = StageTimer()
+    bundle = get_bundle()
+    if bundle is None:
+        return finish('predict', timer, {'status': 'error', 'message': 'System Initialization Failed'}, 503,
+                      'unavailable')
 
     try:
-        data = request.json
+        with timer.stage('parse'):
+            data = request.json
         if data is None:
-            return jsonify({'status': 'error', 'message': 'Missing JSON body'}), 400
-        
-        # User Input: 
-        # {
-        #   "species": "Dog",
-        #   "temp": 39.5,
-        #   "hr": 120,
-        #   "resp": 30,
-        #   "activity": 50,
-        #   "symptoms": ["Vomiting", "Diarrhea"]
-        # }
-        
-        # 1. Initialize empty feature vector with correct columns
-        input_data = {col: 0 for col in model_features}
-        
-        # 2. Fill Vitals
+            return finish('predict', timer, {'status': 'error', 'message': 'Missing JSON body'}, 400, 'bad_request')
+
         try:
-            input_data['Body_Temperature'] = float(data.get('temp', 38.0))
-            input_data['Heart_Rate'] = int(data.get('hr', 80))
-            input_data['Respiratory_Rate'] = int(data.get('resp', 20))
-            input_data['Activity_Level'] = int(data.get('activity', 100))
-        except (TypeError, ValueError):
-            return jsonify({'status': 'error', 'message': 'Vitals must be numeric values'}), 400
-        
-        # 3. Fill One-Hot Species
-        species = data.get('species', 'Dog')
-        if not isinstance(species, str):
-            return jsonify({'status': 'error', 'message': 'Species must be a string'}), 400
-        species_col = f"Animal_Type_{species}"
-        if species_col in input_data:
-            input_data[species_col] = 1
-        
-        # 4. Fill Symptoms
-        active_symptoms = data.get('symptoms', [])
-        if not isinstance(active_symptoms, list):
-            return jsonify({'status': 'error', 'message': 'Symptoms must be a list'}), 400
-        for sym in active_symptoms:
-            if sym in input_data:
-                input_data[sym] = 1
-                
-        # 5. Create DataFrame for Prediction (ensure correct column order)
-        feature_list = list(model_features)
-        df_input = pd.DataFrame([input_data], columns=feature_list)
-        
-        # 6. Predict (use DMatrix to guarantee feature names are present)
-        dmatrix = xgb.DMatrix(df_input, feature_names=feature_list)
-        confidence_array = model.get_booster().predict(dmatrix)[0]
-        pred_idx = int(np.argmax(confidence_array))
-        
-        # Get sorted predictions
-        top_indices = np.argsort(confidence_array)[::-1]
-        
-        # Top 1
-        top_pred_name = le.inverse_transform([top_indices[0]])[0]
-        top_conf = confidence_array[top_indices[0]] * 100
-
-        top_predictions = []
-        for idx in top_indices[:3]:
-            top_predictions.append({
-                "disease": le.inverse_transform([idx])[0],
-                "confidence": f"{confidence_array[idx] * 100:.1f}%"
-            })
-        
-        # Logic: Find the first NON-HEALTHY prediction if symptoms are present
-        final_prediction = top_pred_name
-        final_conf = top_conf
-        note = ""
-        
-        if active_symptoms:
-            # If Model thinks it's healthy but we see symptoms, dig deeper
-            if "HEALTHY" in top_pred_name.upper():
-                # Loop through top 3 predictions to find a disease
-                found_disease = False
-                for i in range(1, 4): # Check 2nd, 3rd, 4th
-                    if i >= len(top_indices): break
-                    
-                    alt_name = le.inverse_transform([top_indices[i]])[0]
-                    alt_conf = confidence_array[top_indices[i]] * 100
-                    
-                    if "HEALTHY" not in alt_name.upper() and alt_conf > 10.0:
-                        final_prediction = alt_name
-                        final_conf = alt_conf
-                        note = " (Pattern Match)"
-                        found_disease = True
-                        break
-                
-                if not found_disease:
-                    final_prediction = "Unknown Infection"
-                    final_conf = 0.1 # Non-zero to show it exists but is low
-                    note = " (Vitals check out, but symptoms persist)"
-
-        # Normalize Confidence Display
-        # If it's really low, don't say 0%, say the value but warn
-        if final_conf < 30.0 and final_prediction != "Unknown Infection":
-            note += " [Low Confidence]"
-
-        # 7. Generate "Why" (Reasoning)
-        reasoning = []
-        if active_symptoms:
-            reasoning.append(f"Symptoms: {', '.join(active_symptoms)}")
-        else:
-            reasoning.append("No active symptoms")
-            
-        if input_data['Body_Temperature'] > 40.0:
-            reasoning.append("High Fever")
-        
-        why_text = " | ".join(reasoning) + note
-        
-        print(f"[>] Diagnosis: {final_prediction.upper()} ({final_conf:.1f}%)")
-
-        return jsonify({
+            with timer.stage('validate'):
+                case = parse_case(data)
+                # Optional "tier" or "latency_budget_ms" picks the model variant
+                hint = parse_tier_hint(data)
+                tier = bundle.select_tier(*hint)
+        except ValueError as e:
+            return finish('predict', timer, {'status': 'error', 'message': str(e)}, 400, 'invalid_case')
+
+        confidences = bundle.score_cases([case], micro_batcher, tier, timer, use_shards=hint == (None, None))
+        with timer.stage('postprocess'):
+            result = bundle.summarize_predictions(confidences, [case])[0]
+            result['tier'] = tier.name
+        record_outcomes([result], tier.name)
+
+        print(f"[>] Diagnosis: {result['prediction']} ({result['confidence']})")
+        return finish('predict', timer, result)
+
+    except Exception as e:
+        print(f"[!] Inference Error: {e}")
+        return finish('predict', timer, {'status': 'error', 'message': str(e)}, 500, 'inference')
+
+@app.route('/predict/batch', methods=['POST'])
+def predict_batch():
+    timer = StageTimer()
+    bundle = get_bundle()
+    if bundle is None:
+        return finish('predict_batch', timer, {'status': 'error', 'message': 'System Initialization Failed'}, 503,
+                      'unavailable')
+
+    try:
+        with timer.stage('parse'):
+            data = request.json
+        if data is None:
+            return finish('predict_batch', timer, {'status': 'error', 'message': 'Missing JSON body'}, 400,
+                          'bad_request')
+
+        # Accept either a bare array of cases or {"cases": [...]}
+        items = data.get('cases') if isinstance(data, dict) else data
+        if not isinstance(items, list):
+            return finish('predict_batch', timer, {'status': 'error', 'message': 'Cases must be a list'}, 400,
+                          'bad_request')
+        try:
+            hint = parse_tier_hint(data)
+            tier = bundle.select_tier(*hint)
+        except ValueError as e:
+            return finish('predict_batch', timer, {'status': 'error', 'message': str(e)}, 400, 'bad_request')
+        if len(items) > MAX_BATCH_SIZE:
+            return finish('predict_batch', timer, {
+                'status': 'error',
+                'message': f'Batch too large ({len(items)} cases, limit {MAX_BATCH_SIZE})',
+            }, 413, 'too_large')
+        BATCH_CASES.observe(len(items))
+
+        # Invalid cases get a per-item error; the rest are scored together
+        results = [None] * len(items)
+        cases, positions = [], []
+        with timer.stage('validate'):
+            for pos, item in enumerate(items):
+                try:
+                    cases.append(parse_case(item))
+                    positions.append(pos)
+                except ValueError as e:
+                    results[pos] = {'status': 'error', 'message': str(e)}
+        if len(cases) < len(items):
+            ERRORS.inc(len(items) - len(cases), endpoint='predict_batch', reason='invalid_item')
+
+        if cases:
+            confidences = bundle.score_cases(cases, tier=tier, timer=timer, use_shards=hint == (None, None))
+            with timer.stage('postprocess'):
+                summaries = bundle.summarize_predictions(confidences, cases)
+                for pos, result in zip(positions, summaries):
+                    results[pos] = result
+            record_outcomes(summaries, tier.name)
+
+        print(f"[>] Batch Diagnosis: {len(cases)}/{len(items)} cases scored")
+        return finish('predict_batch', timer, {
             'status': 'success',
-            'prediction': str(final_prediction).upper(),
-            'confidence': f"{final_conf:.1f}%",
-            'reasoning': why_text,
-            'top_predictions': top_predictions
+            'tier': tier.name,
+            'count': len(results),
+            'errors': len(items) - len(cases),
+            'results': results,
         })
 
     except Exception as e:
-        print(f"[!] Inference Error: {e}")
-        return jsonify({'status': 'error', 'message': str(e)}), 500
+        print(f"[!] Batch Inference Error: {e}")
+        return finish('predict_batch', timer, {'status': 'error', 'message': str(e)}, 500, 'inference')
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    # Prometheus text format, summed over every worker writing to METRICS_DIR
+    return Response(render(collect(metrics_collector)), mimetype='text/plain; version=0.0.4; charset=utf-8')
 
 if __name__ == '__main__':
     print("[+] System V4.1 Loaded... Starting Server...")
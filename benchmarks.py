@@ -0,0 +1,558 @@
+"""In-process benchmarks for every serving and offline stage, with JSON baselines.
+
+    python benchmarks.py run --output baseline.json
+    python benchmarks.py run --compare baseline.json        # exits 1 on a regression
+    python benchmarks.py compare baseline.json benchmark_results.json
+    python benchmarks.py topology --workers 1,2,4 --threads 1,2,4   # gunicorn worker/thread sweep
+
+Serving stages run in this process against the bundle in model_bundle/ (no
+HTTP); the Flask round trips go through the test client. Offline stages that
+own a whole process (cold start, training) run as child processes so their
+wall time and peak RSS are measured in isolation. The topology sweep starts
+a local gunicorn server per combination and load-tests it over HTTP.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+RESULTS_PATH = "benchmark_results.json"
+TOPOLOGY_PATH = "topology_sweep.json"
+REGRESSION_THRESHOLD = 0.10
+BATCH_ROWS = 256
+# Target wall time of one timing sample; calls are repeated until a sample takes this long
+SAMPLE_SECONDS = 0.05
+SAMPLES = 7
+
+_context = {}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the serving and offline pipeline stages.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("run", help="Run the benchmarks and write a JSON report.")
+    run.add_argument("--only", help="Comma-separated benchmark names or prefixes (e.g. 'serve.,offline.train').")
+    run.add_argument("--skip-offline", action="store_true", help="Only run the serving benchmarks.")
+    run.add_argument("--output", default=RESULTS_PATH, help="Where to write the report.")
+    run.add_argument("--compare", help="Baseline report to compare against after the run.")
+    run.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD,
+                     help="Relative slowdown that counts as a regression (0.10 = 10%%).")
+    run.add_argument("--gen-rows", type=int, default=1_000_000, help="Rows for the data generation benchmark.")
+    run.add_argument("--normalize-rows", type=int, default=200_000, help="Rows for the normalization benchmark.")
+    run.add_argument("--train-rows", type=int, default=20_000, help="Rows for the training benchmark.")
+    run.add_argument("--cold-starts", type=int, default=3, help="Cold start runs (the median is reported).")
+
+    compare = sub.add_parser("compare", help="Compare two reports and flag regressions.")
+    compare.add_argument("baseline")
+    compare.add_argument("current")
+    compare.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD)
+
+    sweep = sub.add_parser("topology", help="Load-test gunicorn worker x model thread combinations.")
+    sweep.add_argument("--workers", help="Comma-separated worker counts (default: powers of two up to the CPUs).")
+    sweep.add_argument("--threads", help="Comma-separated model threads per worker (default: as --workers).")
+    sweep.add_argument("--oversubscribe", action="store_true",
+                       help="Also run combinations that use more threads than CPUs.")
+    sweep.add_argument("--pin", action="store_true", help="Run the servers with PIN_WORKERS=1.")
+    sweep.add_argument("--server-threads", type=int, default=4, help="gunicorn request threads per worker.")
+    sweep.add_argument("--concurrency", type=int, default=None, help="Load test connections (default: 2 x CPUs, min 4).")
+    sweep.add_argument("--batch-size", type=int, default=1, help="Cases per request; >1 uses /predict/batch.")
+    sweep.add_argument("--duration", type=float, default=10.0, help="Measured seconds per combination.")
+    sweep.add_argument("--warmup", type=float, default=2.0, help="Unmeasured seconds per combination.")
+    sweep.add_argument("--p99-slack", type=float, default=1.25,
+                       help="Recommend the highest throughput whose p99 is within this factor of the best p99.")
+    sweep.add_argument("--output", default=TOPOLOGY_PATH, help="Where to write the sweep report.")
+    return parser.parse_args()
+
+
+# --- MEASUREMENT ---
+
+def time_calls(fn):
+    """Median seconds per call of `fn` over SAMPLES samples of enough calls to fill SAMPLE_SECONDS each."""
+    fn()
+    number = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(number):
+            fn()
+        elapsed = time.perf_counter() - started
+        if elapsed >= SAMPLE_SECONDS or number >= 1 << 20:
+            break
+        number *= 2
+    samples = []
+    for _ in range(SAMPLES):
+        started = time.perf_counter()
+        for _ in range(number):
+            fn()
+        samples.append((time.perf_counter() - started) / number)
+    samples = np.array(samples)
+    return {
+        "value": round(float(np.median(samples)) * 1000, 5),
+        "unit": "ms",
+        "better": "lower",
+        "min_ms": round(float(samples.min()) * 1000, 5),
+        "max_ms": round(float(samples.max()) * 1000, 5),
+        "calls_per_sample": number,
+    }
+
+
+def run_child(cmd, cwd=None, env=None):
+    """(wall seconds, peak RSS in MB or None, stdout) of a child process."""
+    started = time.perf_counter()
+    proc = subprocess.Popen(cmd, cwd=cwd, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    if hasattr(os, "wait4"):
+        # wait4 reports this child's own peak RSS, unlike RUSAGE_CHILDREN which keeps the max over all children
+        output = proc.stdout.read()
+        _, status, usage = os.wait4(proc.pid, 0)
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        peak = round(usage.ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+    else:
+        output, _ = proc.communicate()
+        peak = None
+    elapsed = time.perf_counter() - started
+    if proc.returncode != 0:
+        raise RuntimeError(f"{' '.join(cmd)} failed ({proc.returncode}):\n{output[-2000:]}")
+    return elapsed, peak, output
+
+
+def rate(rows, seconds, unit="rows/s"):
+    return {"value": round(rows / seconds, 1), "unit": unit, "better": "higher", "seconds": round(seconds, 3)}
+
+
+# --- SERVING ---
+
+def serving():
+    """Bundle, parsed cases and their keys shared by the serving benchmarks (built once)."""
+    if not _context:
+        from inference import DEFAULT_BUNDLE_DIR, load_model_bundle, parse_case
+        from test_system import build_payloads
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            bundle = load_model_bundle(DEFAULT_BUNDLE_DIR, "xgboost", cache_size=0)
+        cases = [parse_case(payload) for payload in build_payloads(BATCH_ROWS, seed=42)]
+        keys = [bundle.case_key(case) for case in cases]
+        X = bundle.build_feature_matrix(keys)
+        _context.update(bundle=bundle, cases=cases, keys=keys, X=X, confidences=bundle.score_matrix(X))
+    return _context
+
+
+def cycle(items):
+    state = {"i": 0}
+
+    def next_item():
+        state["i"] = (state["i"] + 1) % len(items)
+        return items[state["i"]]
+    return next_item
+
+
+def bench_features_single(args):
+    ctx = serving()
+    bundle, next_case = ctx["bundle"], cycle(ctx["cases"])
+    return time_calls(lambda: bundle.build_feature_matrix([bundle.case_key(next_case())]))
+
+
+def bench_features_batch(args):
+    ctx = serving()
+    bundle, cases = ctx["bundle"], ctx["cases"]
+    return time_calls(lambda: bundle.build_feature_matrix([bundle.case_key(case) for case in cases]))
+
+
+def _scorer(engine):
+    ctx = serving()
+    if engine == "xgboost":
+        return ctx["bundle"].scorer
+    if "native" not in ctx:
+        from inference import DEFAULT_BUNDLE_DIR, load_model_bundle
+        with contextlib.redirect_stdout(io.StringIO()):
+            ctx["native"] = load_model_bundle(DEFAULT_BUNDLE_DIR, "native", cache_size=0)
+    if ctx["native"].engine != "native":
+        raise RuntimeError("native engine unavailable for this bundle")
+    return ctx["native"].scorer
+
+
+def bench_score(engine, batch):
+    def bench(args):
+        X, scorer = serving()["X"], _scorer(engine)
+        if batch:
+            return time_calls(lambda: scorer(X))
+        rows = cycle([X[i:i + 1] for i in range(len(X))])
+        return time_calls(lambda: scorer(rows()))
+    return bench
+
+
+def bench_score_shard(args):
+    ctx = serving()
+    bundle = ctx["bundle"]
+    if not bundle.shards:
+        raise RuntimeError("bundle has no species shards")
+    tier = bundle.tiers[bundle.default_tier]
+    with contextlib.redirect_stdout(io.StringIO()):
+        rows = [(bundle.scorer_for(tier, key[0], use_shards=True), ctx["X"][i:i + 1]) for i, key in enumerate(ctx["keys"])]
+    next_row = cycle(rows)
+
+    def score():
+        scorer, row = next_row()
+        scorer(row)
+    return time_calls(score)
+
+
+def bench_decode_single(args):
+    ctx = serving()
+    bundle = ctx["bundle"]
+    rows = cycle([(ctx["confidences"][i:i + 1], [case]) for i, case in enumerate(ctx["cases"])])
+    return time_calls(lambda: bundle.summarize_predictions(*rows()))
+
+
+def bench_decode_batch(args):
+    ctx = serving()
+    return time_calls(lambda: ctx["bundle"].summarize_predictions(ctx["confidences"], ctx["cases"]))
+
+
+def flask_client():
+    if "client" not in _context:
+        # Measure the model path, not the prediction cache; no background threads
+        os.environ["PREDICTION_CACHE_SIZE"] = "0"
+        os.environ["MICRO_BATCH_SIZE"] = "0"
+        os.environ["MODEL_WATCH_INTERVAL"] = "0"
+        with contextlib.redirect_stdout(io.StringIO()):
+            import app
+        _context["client"] = app.app.test_client()
+    return _context["client"]
+
+
+def bench_flask_predict(args):
+    from test_system import build_payloads
+    client, payloads = flask_client(), cycle(build_payloads(BATCH_ROWS, seed=42))
+
+    def post():
+        with contextlib.redirect_stdout(io.StringIO()):
+            response = client.post("/predict", json=payloads())
+        if response.status_code != 200:
+            raise RuntimeError(f"/predict returned {response.status_code}")
+    return time_calls(post)
+
+
+def bench_flask_batch(args):
+    from test_system import build_payloads
+    client, body = flask_client(), {"cases": build_payloads(64, seed=42)}
+
+    def post():
+        with contextlib.redirect_stdout(io.StringIO()):
+            response = client.post("/predict/batch", json=body)
+        if response.status_code != 200:
+            raise RuntimeError(f"/predict/batch returned {response.status_code}")
+    return time_calls(post)
+
+
+# --- OFFLINE ---
+
+COLD_START = """
+import contextlib, io, json, time
+started = time.perf_counter()
+with contextlib.redirect_stdout(io.StringIO()):
+    import app
+bundle = app.current_bundle
+print(json.dumps({"import_seconds": time.perf_counter() - started, "load_seconds": bundle.load_info["load_seconds"]}))
+"""
+
+
+def bench_cold_start(args):
+    env = dict(os.environ, MODEL_WATCH_INTERVAL="0")
+    runs = []
+    for _ in range(args.cold_starts):
+        elapsed, peak, output = run_child([sys.executable, "-c", COLD_START], cwd=HERE, env=env)
+        runs.append((elapsed, peak, json.loads(output.strip().splitlines()[-1])))
+    runs.sort(key=lambda run: run[0])
+    elapsed, peak, info = runs[len(runs) // 2]
+    return {
+        "value": round(elapsed, 4),
+        "unit": "s",
+        "better": "lower",
+        "import_app_seconds": round(info["import_seconds"], 4),
+        "bundle_load_seconds": info["load_seconds"],
+        "peak_rss_mb": peak,
+    }
+
+
+def bench_generate(args):
+    from generate_data import generate_enhanced_dataset
+    with tempfile.TemporaryDirectory() as tmp:
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            generate_enhanced_dataset(args.gen_rows, output_path=os.path.join(tmp, "data.csv"), seed=7)
+        return dict(rate(args.gen_rows, time.perf_counter() - started), rows=args.gen_rows)
+
+
+def bench_normalize(args):
+    from data_ingest import normalize_dataset
+    from feature_schema import SYMPTOMS
+    from generate_data import DEFAULT_CHUNK_ROWS, iter_chunks
+
+    frame = next(iter_chunks(args.normalize_rows, seed=7, chunk_rows=max(args.normalize_rows, DEFAULT_CHUNK_ROWS)))
+    frame = frame.astype({"Animal_Type": str, "Disease_Prediction": str})
+    source = {"name": "benchmark", "symptom_columns": list(SYMPTOMS)}
+    wide = time_calls(lambda: normalize_dataset(frame, source))
+    packed = time_calls(lambda: normalize_dataset(frame, source, packed=True))
+    return {
+        "value": round(len(frame) / wide["value"] * 1000, 1),
+        "unit": "rows/s",
+        "better": "higher",
+        "packed_rows_per_s": round(len(frame) / packed["value"] * 1000, 1),
+        "rows": len(frame),
+    }
+
+
+def bench_train(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        dataset = os.path.join(tmp, "data.csv")
+        run_child([sys.executable, os.path.join(HERE, "generate_data.py"), "--rows", str(args.train_rows),
+                   "--seed", "7", "--output", dataset], cwd=tmp)
+        # Own working directory so the run's pickles and bundle never touch the repo's artifacts
+        elapsed, peak, _ = run_child([sys.executable, os.path.join(HERE, "train_model.py"), "--dataset", dataset,
+                                      "--tiers", "full", "--no-cache"], cwd=tmp)
+    return {
+        "value": round(elapsed, 3),
+        "unit": "s",
+        "better": "lower",
+        "rows": args.train_rows,
+        "peak_rss_mb": peak,
+    }
+
+
+BENCHMARKS = {
+    "serve.features.single": bench_features_single,
+    f"serve.features.batch{BATCH_ROWS}": bench_features_batch,
+    "serve.score.xgboost.single": bench_score("xgboost", False),
+    f"serve.score.xgboost.batch{BATCH_ROWS}": bench_score("xgboost", True),
+    "serve.score.native.single": bench_score("native", False),
+    f"serve.score.native.batch{BATCH_ROWS}": bench_score("native", True),
+    "serve.score.shard.single": bench_score_shard,
+    "serve.decode.single": bench_decode_single,
+    f"serve.decode.batch{BATCH_ROWS}": bench_decode_batch,
+    "serve.flask.predict": bench_flask_predict,
+    "serve.flask.batch64": bench_flask_batch,
+    "offline.cold_start": bench_cold_start,
+    "offline.generate": bench_generate,
+    "offline.normalize": bench_normalize,
+    "offline.train": bench_train,
+}
+
+
+def selected(only, skip_offline):
+    names = list(BENCHMARKS)
+    if only:
+        patterns = [p.strip() for p in only.split(",") if p.strip()]
+        names = [name for name in names if any(name == p or name.startswith(p) for p in patterns)]
+    if skip_offline:
+        names = [name for name in names if not name.startswith("offline.")]
+    return names
+
+
+def git_commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5,
+                             cwd=HERE)
+        return out.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def machine_info():
+    import xgboost
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "xgboost": xgboost.__version__,
+    }
+
+
+def run(args):
+    os.chdir(HERE)
+    names = selected(args.only, args.skip_offline)
+    results = {}
+    for name in names:
+        print(f"[*] {name}...")
+        try:
+            results[name] = BENCHMARKS[name](args)
+        except Exception as e:
+            print(f"[!] {name} skipped: {e}")
+            results[name] = {"error": str(e).splitlines()[0] if str(e) else repr(e)}
+            continue
+        result = results[name]
+        print(f"   -> {result['value']:,} {result['unit']}")
+
+    report = {
+        "commit": git_commit(),
+        "created_at": datetime.utcnow().isoformat() + "Z",
+        "machine": machine_info(),
+        "config": {key: getattr(args, key) for key in ("gen_rows", "normalize_rows", "train_rows", "cold_starts")},
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as handle:
+        json.dump(report, handle, indent=2)
+    print(f"[+] Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as handle:
+            baseline = json.load(handle)
+        return 1 if compare(baseline, report, args.threshold) else 0
+    return 0
+
+
+def compare(baseline, current, threshold):
+    """Print the change per benchmark; returns the names that regressed by more than `threshold`."""
+    print(f"\n[*] {baseline.get('commit')} -> {current.get('commit')} (regression threshold {threshold * 100:.0f}%)")
+    if baseline.get("machine") != current.get("machine"):
+        print("[!] Reports come from different machines or library versions")
+    if baseline.get("config") != current.get("config"):
+        print("[!] Reports were run with different settings")
+    regressions = []
+    for name, new in current.get("results", {}).items():
+        old = baseline.get("results", {}).get(name)
+        if not old or "value" not in old or "value" not in new or not old["value"]:
+            continue
+        change = new["value"] / old["value"] - 1
+        # Positive `worse` means slower (or lower throughput)
+        worse = change if new["better"] == "lower" else -change
+        flag = ""
+        if worse > threshold:
+            flag = "  [REGRESSION]"
+            regressions.append(name)
+        elif worse < -threshold:
+            flag = "  [faster]"
+        print(f"  {name:<32} {old['value']:>12,} -> {new['value']:>12,} {new['unit']:<7} {change * 100:+7.1f}%{flag}")
+    if regressions:
+        print(f"[!] {len(regressions)} regression(s): {', '.join(regressions)}")
+    else:
+        print("[+] No regressions")
+    return regressions
+
+
+# --- TOPOLOGY SWEEP ---
+
+def _counts(spec, cpus):
+    if spec:
+        return sorted({int(value) for value in spec.split(",") if value.strip()})
+    counts, n = [], 1
+    while n < cpus:
+        counts.append(n)
+        n *= 2
+    return counts + [cpus]
+
+
+def recommend(results, p99_slack):
+    """Highest throughput among the combinations whose p99 is within `p99_slack` of the lowest p99."""
+    ok = [r for r in results if r.get("throughput_rps") and r.get("p99_ms")]
+    if not ok:
+        return None
+    best_p99 = min(r["p99_ms"] for r in ok)
+    return max((r for r in ok if r["p99_ms"] <= best_p99 * p99_slack), key=lambda r: r["throughput_rps"])
+
+
+def sweep_topology(args):
+    """Start gunicorn with each worker/thread combination, load-test it and recommend one."""
+    from topology import THREAD_ENV_VARS, available_cpus
+    from test_system import run_load_test, start_local_server, stop_local_server
+
+    os.chdir(HERE)
+    cpus, source = available_cpus()
+    combos = [(w, t) for w in _counts(args.workers, cpus) for t in _counts(args.threads, cpus)]
+    skipped = [combo for combo in combos if combo[0] * combo[1] > cpus and not args.oversubscribe]
+    combos = [combo for combo in combos if combo not in skipped]
+    concurrency = args.concurrency or max(4, 2 * cpus)
+    print(f"[*] {cpus} usable CPUs ({source}); {len(combos)} combination(s), {args.duration:g}s each, "
+          f"{concurrency} connections")
+    if skipped:
+        print(f"   -> Skipped {len(skipped)} oversubscribed combination(s) (use --oversubscribe to include them)")
+
+    load_args = argparse.Namespace(
+        mode="closed", rate=None, arrival=None, concurrency=concurrency, duration=args.duration,
+        warmup=args.warmup, requests=0, batch_size=args.batch_size, payloads=1000, seed=42, timeout=30.0, local=True,
+    )
+    results = []
+    for workers, threads in combos:
+        print(f"\n[*] {workers} worker(s) x {threads} model thread(s)")
+        env = dict(os.environ, WEB_CONCURRENCY=str(workers), MODEL_THREADS=str(threads),
+                   PIN_WORKERS="1" if args.pin else "0", PREDICTION_CACHE_SIZE="0", METRICS_DIR="")
+        # Left to topology.configure_worker() so they follow MODEL_THREADS
+        for name in THREAD_ENV_VARS:
+            env.pop(name, None)
+        entry = {"workers": workers, "model_threads": threads, "thread_budget": workers * threads}
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                proc, base_url = start_local_server("gunicorn", workers, args.server_threads, None, env=env)
+            try:
+                report = run_load_test(load_args, base_url)
+            finally:
+                stop_local_server(proc)
+        except Exception as e:
+            print(f"[!] Skipped: {e}")
+            results.append(dict(entry, error=str(e).splitlines()[0] if str(e) else repr(e)))
+            continue
+        entry.update(
+            throughput_rps=report["throughput_rps"],
+            cases_per_s=report["cases_per_s"],
+            error_rate=report["error_rate"],
+            p50_ms=report["latency_ms"]["p50"],
+            p99_ms=report["latency_ms"]["p99"],
+        )
+        results.append(entry)
+        print(f"   -> {entry['throughput_rps']} req/s, p50 {entry['p50_ms']:.2f} ms, p99 {entry['p99_ms']:.2f} ms")
+
+    print(f"\n{'workers':>8} {'threads':>8} {'req/s':>10} {'p50 ms':>9} {'p99 ms':>9}")
+    for r in results:
+        if "error" in r:
+            print(f"{r['workers']:>8} {r['model_threads']:>8}   failed: {r['error']}")
+        else:
+            print(f"{r['workers']:>8} {r['model_threads']:>8} {r['throughput_rps']:>10} {r['p50_ms']:>9.2f} "
+                  f"{r['p99_ms']:>9.2f}")
+    best = recommend(results, args.p99_slack)
+    if best:
+        print(f"[+] Recommended: WEB_CONCURRENCY={best['workers']} MODEL_THREADS={best['model_threads']} "
+              f"({best['throughput_rps']} req/s, p99 {best['p99_ms']:.2f} ms)")
+    else:
+        print("[!] No combination completed")
+
+    report = {
+        "commit": git_commit(),
+        "created_at": datetime.utcnow().isoformat() + "Z",
+        "machine": dict(machine_info(), available_cpus=cpus, cpu_source=source),
+        "config": {key: getattr(args, key) for key in ("server_threads", "batch_size", "duration", "warmup", "pin",
+                                                       "p99_slack")},
+        "concurrency": concurrency,
+        "results": results,
+        "recommended": best,
+    }
+    with open(args.output, "w", encoding="utf-8") as handle:
+        json.dump(report, handle, indent=2)
+    print(f"   -> Report written to {args.output}")
+    return 0 if best else 1
+
+
+def main():
+    args = parse_args()
+    if args.command == "run":
+        return run(args)
+    if args.command == "topology":
+        return sweep_topology(args)
+    with open(args.baseline, "r", encoding="utf-8") as handle:
+        baseline = json.load(handle)
+    with open(args.current, "r", encoding="utf-8") as handle:
+        current = json.load(handle)
+    return 1 if compare(baseline, current, args.threshold) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,333 @@
+"""Offline bulk scoring of case files in the enhanced_animal_disease.csv layout.
+
+    python bulk_score.py archive.csv --output scored.csv
+    python bulk_score.py archive_parts/ --output scored.parquet --workers 8 --threads-per-worker 1
+
+Uses the same artifacts as the API's load_system() (model bundle, engine,
+species shards) and the same decision rules as /predict, including the
+HEALTHY pattern-match and Unknown Infection fallbacks. The input is read in
+chunks; the parent process parses each chunk into compact key columns, a pool
+of worker processes (each capped at a fixed number of threads) scores them,
+and results are written in input order as they come back, so memory stays
+bounded by the chunks in flight.
+"""
+import argparse
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from feature_schema import MASK_COLUMN, SYMPTOMS, VITAL_COLUMNS, pack_symptom_columns
+from inference import CASE_DEFAULTS, DEFAULT_BUNDLE_DIR, load_model_bundle
+from topology import THREAD_ENV_VARS, available_cpus
+
+SPECIES_COLUMN = "Animal_Type"
+DEFAULT_CHUNK_ROWS = 50_000
+# Key column defaults, in VITAL_COLUMNS order
+VITAL_DEFAULTS = (CASE_DEFAULTS['temp'], CASE_DEFAULTS['hr'], CASE_DEFAULTS['resp'], CASE_DEFAULTS['activity'])
+
+# Per-process model state, set by init_worker()
+_bundle = None
+_tier = None
+_use_shards = False
+
+
+def input_files(path):
+    """A CSV or Parquet file, or the part files of a partitioned dataset directory."""
+    path = Path(path)
+    if path.is_dir():
+        files = sorted(p for p in path.rglob("part-*") if p.suffix in (".csv", ".parquet"))
+        if not files:
+            raise FileNotFoundError(f"No part-*.csv or part-*.parquet files under '{path}'")
+        return files
+    if not path.exists():
+        raise FileNotFoundError(str(path))
+    return [path]
+
+
+def iter_chunks(path, chunk_rows, keep=()):
+    wanted = {SPECIES_COLUMN, MASK_COLUMN, *VITAL_COLUMNS, *SYMPTOMS, *keep}
+    for file in input_files(path):
+        if file.suffix == ".parquet":
+            try:
+                import pyarrow.parquet as pq
+            except ImportError as e:
+                raise RuntimeError("Parquet input requires pyarrow (pip install pyarrow)") from e
+            handle = pq.ParquetFile(file)
+            columns = [name for name in handle.schema_arrow.names if name in wanted]
+            for batch in handle.iter_batches(batch_size=chunk_rows, columns=columns):
+                yield batch.to_pandas()
+        else:
+            yield from pd.read_csv(file, chunksize=chunk_rows, usecols=lambda c: c in wanted)
+
+
+def encode_chunk(frame, offset=0, keep=()):
+    """Compact key columns for one chunk: species codes, symptom masks, scaled vitals and a validity flag.
+
+    Blank fields take the /predict defaults; rows with a non-numeric vital are
+    reported as errors, as /predict would reject them.
+    """
+    species = frame[SPECIES_COLUMN] if SPECIES_COLUMN in frame else pd.Series(index=frame.index, dtype=object)
+    species = pd.Categorical(species.fillna(CASE_DEFAULTS['species']).astype(str))
+
+    if MASK_COLUMN in frame:
+        masks = frame[MASK_COLUMN].fillna(0).to_numpy(dtype=np.uint64)
+    else:
+        present = [name for name in SYMPTOMS if name in frame]
+        masks = pack_symptom_columns(frame[present].fillna(0))
+
+    vitals = np.empty((len(frame), len(VITAL_COLUMNS)), dtype=np.float64)
+    valid = np.ones(len(frame), dtype=bool)
+    for i, (column, default) in enumerate(zip(VITAL_COLUMNS, VITAL_DEFAULTS)):
+        if column not in frame:
+            vitals[:, i] = default
+            continue
+        raw = frame[column]
+        values = pd.to_numeric(raw, errors='coerce')
+        valid &= ~(values.isna() & raw.notna()).to_numpy()
+        vitals[:, i] = values.fillna(default).to_numpy(dtype=np.float64)
+    # Same canonical key as ModelBundle.case_key: temp in 0.1 °C, integer hr/resp/activity
+    vitals[:, 0] = np.round(vitals[:, 0] * 10)
+    vitals[:, 1:] = np.trunc(vitals[:, 1:])
+    vitals[~valid] = 0
+
+    return {
+        'offset': offset,
+        'keep': {column: frame[column].to_numpy() if column in frame else None for column in keep},
+        'categories': list(species.categories),
+        'codes': species.codes.astype(np.int32),
+        'masks': masks,
+        'vitals': vitals,
+        'valid': valid,
+    }
+
+
+def init_worker(bundle_dir, engine, shards, nthread, tier_name):
+    global _bundle, _tier, _use_shards
+    _bundle = load_model_bundle(bundle_dir, engine, shards=shards, nthread=nthread)
+    _tier = _bundle.select_tier(tier_name)
+    # As in the API, an explicit tier is never routed to a shard
+    _use_shards = shards and tier_name is None
+
+
+def score_chunk(chunk):
+    """Scores the valid rows of an encoded chunk, one model call per species shard."""
+    rows = np.flatnonzero(chunk['valid'])
+    lookup = np.array([_bundle.species_index.get(name, -1) for name in chunk['categories']] + [-1], dtype=np.intp)
+    # Categorical code -1 (missing) maps to the trailing -1
+    species_ids = lookup[chunk['codes'][rows]]
+    masks = chunk['masks'][rows]
+    X = _bundle.assemble_matrix(species_ids, masks, chunk['vitals'][rows])
+
+    confidences = np.empty((len(rows), len(_bundle.class_names)), dtype=np.float32)
+    for species_id in np.unique(species_ids):
+        subset = np.flatnonzero(species_ids == species_id)
+        confidences[subset] = _bundle.scorer_for(_tier, species_id, _use_shards)(X[subset])
+
+    ranked = _bundle.rank_predictions(confidences, masks != 0)
+    ranked['top_indices'] = ranked['top_indices'][:, :3].astype(np.int16)
+    ranked['top_conf'] = ranked['top_conf'][:, :3].astype(np.float32)
+    ranked['rows'] = rows
+    return ranked
+
+
+def result_frame(chunk, ranked, class_names):
+    """Output rows for one chunk, in input order."""
+    n = len(chunk['valid'])
+    rows = ranked['rows']
+    out = pd.DataFrame({'row': np.arange(chunk['offset'], chunk['offset'] + n)})
+    out[SPECIES_COLUMN] = np.asarray(chunk['categories'] + [''], dtype=object)[chunk['codes']]
+    for column, values in chunk['keep'].items():
+        out[column] = values
+
+    status = np.full(n, 'error', dtype=object)
+    status[rows] = 'success'
+    out['status'] = status
+
+    names = np.append(np.char.upper(class_names), 'UNKNOWN INFECTION').astype(object)
+    prediction = np.full(n, '', dtype=object)
+    prediction[rows] = names[ranked['prediction']]
+    out['prediction'] = prediction
+    confidence = np.full(n, np.nan)
+    confidence[rows] = np.round(ranked['confidence'].astype(np.float64), 1)
+    out['confidence'] = confidence
+    for flag in ('pattern_match', 'unknown_infection', 'low_confidence'):
+        values = np.zeros(n, dtype=bool)
+        values[rows] = ranked[flag]
+        out[flag] = values
+
+    top_names = np.asarray(class_names, dtype=object)
+    for rank in range(ranked['top_indices'].shape[1]):
+        disease = np.full(n, '', dtype=object)
+        disease[rows] = top_names[ranked['top_indices'][:, rank]]
+        conf = np.full(n, np.nan)
+        conf[rows] = np.round(ranked['top_conf'][:, rank].astype(np.float64), 1)
+        out[f'top{rank + 1}_disease'] = disease
+        out[f'top{rank + 1}_confidence'] = conf
+    return out
+
+
+def process_chunk(chunk, fmt):
+    """Worker task: (summary counts, output columns, rendered rows) for one encoded chunk.
+
+    CSV rows are rendered here rather than in the parent, which would otherwise
+    become the bottleneck as workers are added.
+    """
+    ranked = score_chunk(chunk)
+    out = result_frame(chunk, ranked, _bundle.class_names)
+    counts = {flag: int(ranked[flag].sum()) for flag in ('pattern_match', 'unknown_infection', 'low_confidence')}
+    counts['rows'] = len(out)
+    counts['errors'] = len(out) - len(ranked['rows'])
+    data = out.to_csv(index=False, header=False) if fmt == 'csv' else out
+    return counts, list(out.columns), data
+
+
+class CsvOutput:
+    def __init__(self, path):
+        self.handle = open(path, 'w', encoding='utf-8', newline='')
+        self.header = True
+
+    def write(self, columns, text):
+        if self.header:
+            self.handle.write(",".join(columns) + "\n")
+            self.header = False
+        self.handle.write(text)
+
+    def close(self):
+        self.handle.close()
+
+
+class ParquetOutput:
+    def __init__(self, path):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise RuntimeError("Parquet output requires pyarrow (pip install pyarrow) or use a .csv output") from e
+        self.pa = pa
+        self.pq = pq
+        self.path = path
+        self.writer = None
+
+    def write(self, columns, frame):
+        table = self.pa.Table.from_pandas(frame, preserve_index=False)
+        if self.writer is None:
+            self.writer = self.pq.ParquetWriter(self.path, table.schema)
+        self.writer.write_table(table)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+def open_output(path, fmt):
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    return ParquetOutput(path) if fmt == 'parquet' else CsvOutput(path)
+
+
+def bulk_score(input_path, output_path, workers=1, threads_per_worker=1, chunk_rows=DEFAULT_CHUNK_ROWS,
+               bundle_dir=DEFAULT_BUNDLE_DIR, engine='xgboost', shards=False, tier=None, keep=(), fmt=None):
+    """Score every row of `input_path` into `output_path`; returns summary counts."""
+    # Read by OpenMP/BLAS when a worker starts, so they are set before the pool is created
+    for name in THREAD_ENV_VARS:
+        os.environ[name] = str(threads_per_worker)
+    fmt = fmt or ('parquet' if str(output_path).endswith('.parquet') else 'csv')
+    output = open_output(output_path, fmt)
+    init_args = (bundle_dir, engine, shards, threads_per_worker, tier)
+    # The parent only reads, parses and writes; scoring happens in the workers (or inline with one worker)
+    if workers > 1:
+        pool = ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=init_args)
+    else:
+        pool = None
+        init_worker(*init_args)
+
+    started = time.perf_counter()
+    totals = {'rows': 0, 'errors': 0, 'pattern_match': 0, 'unknown_infection': 0, 'low_confidence': 0}
+    pending = deque()
+
+    def drain_one():
+        result = pending.popleft()
+        counts, columns, data = result.result() if pool is not None else result
+        output.write(columns, data)
+        for key, value in counts.items():
+            totals[key] += value
+        elapsed = time.perf_counter() - started
+        print(f"[*] {totals['rows']:,} rows scored ({totals['rows'] / elapsed:,.0f} rows/s)")
+
+    offset = 0
+    try:
+        for frame in iter_chunks(input_path, chunk_rows, keep):
+            chunk = encode_chunk(frame, offset, keep)
+            offset += len(frame)
+            pending.append(pool.submit(process_chunk, chunk, fmt) if pool is not None else process_chunk(chunk, fmt))
+            # Two chunks per worker keep every worker busy without reading ahead unboundedly
+            while len(pending) >= 2 * workers:
+                drain_one()
+        while pending:
+            drain_one()
+    finally:
+        output.close()
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+    totals['seconds'] = round(time.perf_counter() - started, 2)
+    totals['rows_per_second'] = round(totals['rows'] / totals['seconds']) if totals['seconds'] else None
+    return totals
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Score a case file with the serving model, without HTTP.")
+    parser.add_argument("input", help="CSV or Parquet file, or a directory of part-* files, in the training layout.")
+    parser.add_argument("--output", default="scored_cases.csv", help="Output file (.csv or .parquet).")
+    parser.add_argument("--format", choices=("csv", "parquet"), default=None,
+                        help="Output format (default: from the --output extension).")
+    parser.add_argument("--threads-per-worker", type=int, default=1,
+                        help="Model threads per worker process (default: 1).")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Scoring processes (default: usable CPUs / --threads-per-worker).")
+    parser.add_argument("--chunk-rows", type=int, default=DEFAULT_CHUNK_ROWS, help="Rows per scoring task.")
+    parser.add_argument("--bundle-dir", default=os.environ.get("MODEL_BUNDLE_DIR", DEFAULT_BUNDLE_DIR))
+    parser.add_argument("--engine", choices=("xgboost", "native"),
+                        default=os.environ.get("INFERENCE_ENGINE", "xgboost").lower())
+    parser.add_argument("--tier", default=None, help="Model tier (default: the bundle's default tier).")
+    parser.add_argument("--shards", action=argparse.BooleanOptionalAction,
+                        default=os.environ.get("SPECIES_SHARDS", "0").lower() in ("1", "true", "yes"),
+                        help="Score rows with their species shard when --tier is not given (default: SPECIES_SHARDS).")
+    parser.add_argument("--keep", nargs="*", default=[],
+                        help="Input columns copied to the output, e.g. an id column or Disease_Prediction.")
+    args = parser.parse_args()
+    if args.threads_per_worker < 1:
+        parser.error("--threads-per-worker must be at least 1")
+    if args.workers is None:
+        args.workers = max(1, available_cpus()[0] // args.threads_per_worker)
+    return args
+
+
+def main():
+    args = parse_args()
+    print(f"[*] Scoring {args.input} with {args.workers} worker(s) x {args.threads_per_worker} thread(s)")
+    totals = bulk_score(
+        args.input,
+        args.output,
+        workers=args.workers,
+        threads_per_worker=args.threads_per_worker,
+        chunk_rows=args.chunk_rows,
+        bundle_dir=args.bundle_dir,
+        engine=args.engine,
+        shards=args.shards,
+        tier=args.tier,
+        keep=args.keep,
+        fmt=args.format,
+    )
+    print(f"[+] Scored {totals['rows']:,} rows in {totals['seconds']}s ({totals['rows_per_second']:,} rows/s) "
+          f"-> {args.output}")
+    print(f"   -> {totals['errors']} invalid rows, {totals['unknown_infection']} unknown infection, "
+          f"{totals['pattern_match']} pattern match, {totals['low_confidence']} low confidence")
+
+
+if __name__ == "__main__":
+    main()
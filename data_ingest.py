@@ -1,8 +1,20 @@
+import argparse
+import hashlib
 import json
+import os
+import re
+import shutil
+import urllib.error
+import urllib.request
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+from urllib.parse import urlparse
+from urllib.request import url2pathname
 
 import pandas as pd
 
+from feature_schema import MASK_COLUMN, SYMPTOM_BITS, SYMPTOMS, to_packed, validate_symptoms
+
 REQUIRED_COLUMNS = {
     "Animal_Type",
     "Disease_Prediction",
@@ -12,6 +24,25 @@ REQUIRED_COLUMNS = {
     "Activity_Level",
 }
 
+# Streaming output schema: one fixed, compact dtype per column across every chunk and source
+COMPACT_DTYPES = {
+    "Animal_Type": "category",
+    "Disease_Prediction": "category",
+    "Body_Temperature": "float32",
+    "Heart_Rate": "float32",
+    "Respiratory_Rate": "float32",
+    "Activity_Level": "float32",
+}
+DEFAULT_CHUNK_ROWS = 200_000
+
+DEFAULT_CACHE_DIR = ".ingest_cache"
+# Bump when normalize_dataset() changes so cached normalized frames are rebuilt
+NORMALIZE_VERSION = 1
+# Source config keys that affect the normalized frame (name and url do not)
+NORMALIZE_KEYS = ("column_map", "symptom_columns", "defaults")
+# Remote schemes fetched with urllib; any other (s3://, gs://, ...) goes through fsspec
+URLLIB_SCHEMES = ("http", "https", "ftp")
+
 
 def load_sources(config_path: Path):
     if not config_path.exists():
@@ -23,7 +54,30 @@ def load_sources(config_path: Path):
         return json.load(handle)
 
 
-def normalize_dataset(df: pd.DataFrame, source: dict) -> pd.DataFrame:
+def drop_unknown_symptoms(sources, strict: bool = False):
+    """Sources without the symptom columns the registry doesn't know, with a warning each (ValueError if `strict`)."""
+    if strict:
+        validate_symptoms({symptom for source in sources for symptom in source.get("symptom_columns", [])})
+        return sources
+    cleaned = []
+    for source in sources:
+        listed = source.get("symptom_columns", [])
+        unknown = [symptom for symptom in listed if symptom not in SYMPTOM_BITS]
+        if unknown:
+            print(f"[!] Source '{source.get('name', 'unknown')}': dropping symptom column(s) {unknown} "
+                  "not in feature_schema.SYMPTOMS")
+            source = dict(source, symptom_columns=[symptom for symptom in listed if symptom in SYMPTOM_BITS])
+        cleaned.append(source)
+    return cleaned
+
+
+def normalize_dataset(df: pd.DataFrame, source: dict, packed: bool = False, strict: bool = False) -> pd.DataFrame:
+    """One source's frame in the combined schema; unknown symptom columns are dropped (ValueError if `strict`).
+
+    ingest_sources() and stream_sources() clean their sources up front, so the warning is printed once per source
+    rather than once per chunk.
+    """
+    [source] = drop_unknown_symptoms([source], strict=strict)
     column_map = source.get("column_map", {})
     df = df.rename(columns=column_map)
 
@@ -41,29 +95,373 @@ def normalize_dataset(df: pd.DataFrame, source: dict) -> pd.DataFrame:
 
     keep_columns = list(REQUIRED_COLUMNS) + symptom_columns
     df = df[keep_columns].copy()
+    if symptom_columns:
+        df[symptom_columns] = df[symptom_columns].fillna(0).astype("uint8")
+    if packed:
+        df = to_packed(df)
     return df
 
 
-def ingest_sources(sources):
-    frames = []
+def _write_atomic(path: Path, data: bytes) -> None:
+    tmp_path = path.with_name(path.name + f".{os.getpid()}.tmp")
+    tmp_path.write_bytes(data)
+    os.replace(tmp_path, path)
+
+
+def _read_entry(path: Path) -> dict:
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+
+def local_source_path(url: str):
+    """Filesystem path for file:// URLs and plain paths; None for remote URLs."""
+    parsed = urlparse(url)
+    if parsed.scheme == "file":
+        return Path(url2pathname(parsed.path))
+    # An empty or single-letter scheme is a POSIX path or a Windows drive
+    if len(parsed.scheme) <= 1:
+        return Path(url)
+    return None
+
+
+def require_fsspec(url: str) -> None:
+    """RuntimeError naming the packages to install when an object-store URL's fsspec backend is missing."""
+    scheme = urlparse(url).scheme
+    try:
+        import fsspec
+        fsspec.get_filesystem_class(scheme)
+    except ImportError as e:
+        raise RuntimeError(
+            f"{scheme}:// sources need fsspec and its {scheme} backend (e.g. pip install fsspec s3fs gcsfs): {e}"
+        ) from e
+    except ValueError as e:
+        raise RuntimeError(f"Unsupported source URL scheme '{scheme}://' in {url}") from e
+
+
+def check_source_urls(sources) -> None:
+    """Fail before ingesting anything when a source needs an fsspec backend that is not installed."""
     for source in sources:
-        name = source.get("name", "unknown")
         url = source.get("url")
-        if not url:
-            raise ValueError(f"Source '{name}' is missing a URL.")
-        print(f"[+] Loading source: {name}")
-        df = pd.read_csv(url)
-        frames.append(normalize_dataset(df, source))
-    return pd.concat(frames, ignore_index=True)
+        if url and local_source_path(url) is None and urlparse(url).scheme not in URLLIB_SCHEMES:
+            require_fsspec(url)
+
+
+def _store_download(url: str, raw_dir: Path, entry_path: Path, tmp_path: Path, sha: str, validators: dict):
+    """Move a finished download into the content-addressed raw cache and record it under the URL's entry."""
+    # Keep the suffix so pandas still infers compression (.csv.gz, .zip, ...)
+    blob = raw_dir / (sha + ("".join(Path(urlparse(url).path).suffixes) or ".csv"))
+    os.replace(tmp_path, blob)
+    entry = {"url": url, "sha256": sha, "file": blob.name, **validators}
+    _write_atomic(entry_path, json.dumps(entry).encode("utf-8"))
+    return blob, sha
+
+
+def fetch_object(url: str, raw_dir: Path, entry_path: Path, entry: dict):
+    """fetch_source() for object-store URLs: downloaded with fsspec, re-fetched when the object's version changes."""
+    cached = raw_dir / entry["file"] if entry.get("file") else None
+    if cached is not None and not cached.exists():
+        cached, entry = None, {}
+    require_fsspec(url)
+    import fsspec
+    fs, path = fsspec.core.url_to_fs(url)
+    try:
+        info = fs.info(path)
+        # S3 reports ETag, GCS etag/md5Hash; size and modification time cover the rest
+        version = "|".join(str(info.get(key)) for key in ("ETag", "etag", "md5Hash", "size", "mtime", "LastModified",
+                                                          "updated", "created") if info.get(key) is not None)
+        if cached is not None and entry.get("version") == version:
+            return cached, entry["sha256"]
+        digest = hashlib.sha256()
+        tmp_path = raw_dir / f"download.{os.getpid()}.tmp"
+        with fs.open(path, "rb") as response, tmp_path.open("wb") as handle:
+            for block in iter(lambda: response.read(1 << 20), b""):
+                digest.update(block)
+                handle.write(block)
+    except FileNotFoundError:
+        raise
+    except OSError as e:
+        if cached is None:
+            raise
+        print(f"[!] {url} unreachable ({e}); using cached copy")
+        return cached, entry["sha256"]
+    return _store_download(url, raw_dir, entry_path, tmp_path, digest.hexdigest(), {"version": version})
+
+
+def fetch_source(url: str, cache_dir: Path):
+    """Local path and sha256 of a source's raw bytes.
+
+    Local files are hashed in place and only rehashed when their size or mtime
+    changes. Remote files are downloaded into the content-addressed raw cache
+    and revalidated with ETag/Last-Modified; if the server is unreachable the
+    last cached copy is used, so a warm cache works offline. Object-store URLs
+    (s3://, gs://, ...) are fetched through fsspec (see fetch_object).
+    """
+    raw_dir = cache_dir / "raw"
+    raw_dir.mkdir(parents=True, exist_ok=True)
+    entry_path = raw_dir / f"{hashlib.sha256(url.encode('utf-8')).hexdigest()[:24]}.json"
+    entry = _read_entry(entry_path)
+
+    local_path = local_source_path(url)
+    if local_path is not None:
+        stat = local_path.stat()
+        if entry.get("size") == stat.st_size and entry.get("mtime_ns") == stat.st_mtime_ns:
+            return local_path, entry["sha256"]
+        digest = hashlib.sha256()
+        with local_path.open("rb") as handle:
+            for block in iter(lambda: handle.read(1 << 20), b""):
+                digest.update(block)
+        entry = {"url": url, "sha256": digest.hexdigest(), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+        _write_atomic(entry_path, json.dumps(entry).encode("utf-8"))
+        return local_path, entry["sha256"]
+    if urlparse(url).scheme not in URLLIB_SCHEMES:
+        return fetch_object(url, raw_dir, entry_path, entry)
+
+    cached = raw_dir / entry["file"] if entry.get("file") else None
+    if cached is not None and not cached.exists():
+        cached, entry = None, {}
+    request = urllib.request.Request(url)
+    if cached is not None:
+        if entry.get("etag"):
+            request.add_header("If-None-Match", entry["etag"])
+        if entry.get("last_modified"):
+            request.add_header("If-Modified-Since", entry["last_modified"])
+    try:
+        with urllib.request.urlopen(request, timeout=60) as response:
+            digest = hashlib.sha256()
+            tmp_path = raw_dir / f"download.{os.getpid()}.tmp"
+            with tmp_path.open("wb") as handle:
+                for block in iter(lambda: response.read(1 << 20), b""):
+                    digest.update(block)
+                    handle.write(block)
+            headers = response.headers
+    except urllib.error.HTTPError as e:
+        if e.code == 304 and cached is not None:
+            return cached, entry["sha256"]
+        raise
+    except urllib.error.URLError as e:
+        if cached is None:
+            raise
+        print(f"[!] {url} unreachable ({e.reason}); using cached copy")
+        return cached, entry["sha256"]
+
+    return _store_download(url, raw_dir, entry_path, tmp_path, digest.hexdigest(), {
+        "etag": headers.get("ETag"),
+        "last_modified": headers.get("Last-Modified"),
+    })
+
+
+def normalized_cache_key(source: dict, raw_sha: str, packed: bool) -> str:
+    config = {key: source.get(key) for key in NORMALIZE_KEYS}
+    payload = {"raw": raw_sha, "config": config, "packed": packed, "version": NORMALIZE_VERSION}
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def load_source(source: dict, packed: bool = False, cache_dir=None):
+    """Read and normalize one source, reusing the cached result when its bytes and mapping are unchanged.
+
+    Returns (frame, cache_status) where status is "hit", "miss" or None when caching is off.
+    """
+    name = source.get("name", "unknown")
+    url = source.get("url")
+    if not url:
+        raise ValueError(f"Source '{name}' is missing a URL.")
+    if cache_dir is None:
+        return normalize_dataset(pd.read_csv(url), source, packed=packed), None
+
+    cache_dir = Path(cache_dir)
+    path, raw_sha = fetch_source(url, cache_dir)
+    normalized_dir = cache_dir / "normalized"
+    normalized_dir.mkdir(parents=True, exist_ok=True)
+    cached = normalized_dir / f"{normalized_cache_key(source, raw_sha, packed)}.pkl"
+    if cached.exists():
+        return pd.read_pickle(cached), "hit"
+
+    df = normalize_dataset(pd.read_csv(path), source, packed=packed)
+    tmp_path = cached.with_name(cached.name + f".{os.getpid()}.tmp")
+    df.to_pickle(tmp_path)
+    os.replace(tmp_path, cached)
+    return df, "miss"
+
+
+def ingest_sources(sources, packed: bool = False, workers: int = 1, cache_dir=None, strict: bool = False):
+    """Load, normalize and merge every source, `workers` sources at a time (see drop_unknown_symptoms for `strict`)."""
+    sources = drop_unknown_symptoms(sources, strict=strict)
+    check_source_urls(sources)
+    workers = max(1, min(workers, len(sources)))
+    if workers == 1:
+        loaded = (load_source(source, packed, cache_dir) for source in sources)
+    else:
+        pool = ProcessPoolExecutor(max_workers=workers)
+        loaded = pool.map(load_source, sources, [packed] * len(sources), [cache_dir] * len(sources))
+
+    frames = []
+    try:
+        for source, (df, cache_status) in zip(sources, loaded):
+            note = f" (cache {cache_status})" if cache_status else ""
+            print(f"[+] Loading source: {source.get('name', 'unknown')}{note}")
+            frames.append(df)
+    finally:
+        if workers > 1:
+            pool.shutdown(cancel_futures=True)
+    combined = pd.concat(frames, ignore_index=True)
+    if not packed:
+        # Sources may list different symptoms; absent ones are simply not observed
+        symptom_columns = [col for col in combined.columns if col not in REQUIRED_COLUMNS]
+        combined[symptom_columns] = combined[symptom_columns].fillna(0).astype("uint8")
+    return combined
+
+
+def stream_symptoms(sources):
+    """Registry-ordered union of the symptoms any source provides: the wide streaming schema."""
+    listed = {symptom for source in sources for symptom in source.get("symptom_columns", [])}
+    validate_symptoms(listed)
+    return [symptom for symptom in SYMPTOMS if symptom in listed]
+
+
+def compact_frame(df: pd.DataFrame, symptom_columns, packed: bool = False) -> pd.DataFrame:
+    """Cast a normalized chunk to the compact schema: categories, float32 vitals, uint8 symptoms."""
+    if packed:
+        columns = [*COMPACT_DTYPES, MASK_COLUMN]
+        df = df.astype({MASK_COLUMN: "uint64"})
+    else:
+        columns = [*COMPACT_DTYPES, *symptom_columns]
+        missing = [symptom for symptom in symptom_columns if symptom not in df.columns]
+        df = df.assign(**{symptom: 0 for symptom in missing})
+        df = df.astype({symptom: "uint8" for symptom in symptom_columns})
+    return df.astype(COMPACT_DTYPES)[columns]
+
+
+def write_part(df: pd.DataFrame, directory: Path, part: int, fmt: str) -> None:
+    directory.mkdir(parents=True, exist_ok=True)
+    if fmt == "parquet":
+        df.to_parquet(directory / f"part-{part:05d}.parquet", index=False)
+    else:
+        df.to_csv(directory / f"part-{part:05d}.csv", index=False)
+
+
+def stream_sources(
+    sources,
+    output_dir: Path,
+    packed: bool = False,
+    chunk_rows: int = DEFAULT_CHUNK_ROWS,
+    fmt: str = "csv",
+    cache_dir=None,
+    strict: bool = False,
+) -> int:
+    """Normalize each source chunk by chunk into a dataset partitioned by source; returns the row count.
+
+    Only one chunk is held in memory at a time. Parts are written to a staging
+    directory that replaces `output_dir` once every source has been ingested.
+    """
+    if fmt == "parquet":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError as e:
+            raise RuntimeError("Parquet output requires pyarrow (pip install pyarrow) or use --format csv") from e
+
+    sources = drop_unknown_symptoms(sources, strict=strict)
+    check_source_urls(sources)
+    symptom_columns = stream_symptoms(sources)
+    staging = output_dir.with_name(output_dir.name + ".partial")
+    shutil.rmtree(staging, ignore_errors=True)
+    total = 0
+    try:
+        for source in sources:
+            name = source.get("name", "unknown")
+            url = source.get("url")
+            if not url:
+                raise ValueError(f"Source '{name}' is missing a URL.")
+            if cache_dir is not None:
+                url, _ = fetch_source(url, Path(cache_dir))
+            print(f"[+] Streaming source: {name}")
+            partition = staging / f"source={re.sub(r'[^A-Za-z0-9_.-]+', '_', name)}"
+            rows = parts = 0
+            for chunk in pd.read_csv(url, chunksize=chunk_rows):
+                chunk = compact_frame(normalize_dataset(chunk, source, packed=packed), symptom_columns, packed)
+                write_part(chunk, partition, parts, fmt)
+                rows += len(chunk)
+                parts += 1
+            print(f"    {rows} rows in {parts} part(s)")
+            total += rows
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    previous = output_dir.with_name(output_dir.name + ".old")
+    if output_dir.exists():
+        output_dir.rename(previous)
+    staging.rename(output_dir)
+    shutil.rmtree(previous, ignore_errors=True)
+    return total
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Ingest and merge external veterinary datasets.")
+    parser.add_argument("--config", default="data_sources.json", help="Path to the sources config.")
+    parser.add_argument(
+        "--packed",
+        action="store_true",
+        help=f"Write symptoms as a single {MASK_COLUMN} bitmask column instead of one column each.",
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Read sources in chunks and write a partitioned dataset instead of one in-memory CSV.",
+    )
+    parser.add_argument("--chunk-rows", type=int, default=DEFAULT_CHUNK_ROWS, help="Rows per chunk with --stream.")
+    parser.add_argument(
+        "--format",
+        choices=("csv", "parquet"),
+        default="csv",
+        help="File format of the --stream partitions (default: csv; parquet requires pyarrow).",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Sources loaded and normalized in parallel (default: CPU count).",
+    )
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, help="Local cache of raw and normalized sources.")
+    parser.add_argument("--no-cache", action="store_true", help="Re-read and re-normalize every source.")
+    parser.add_argument(
+        "--strict-symptoms",
+        action="store_true",
+        help="Fail on symptom columns missing from feature_schema.SYMPTOMS instead of dropping them.",
+    )
+    parser.add_argument(
+        "--output",
+        default=None,
+        help="Output path (default: data/combined_dataset.csv, or the data/combined_dataset/ directory with --stream).",
+    )
+    return parser.parse_args()
 
 
 def main():
-    config_path = Path("data_sources.json")
+    args = parse_args()
+    config_path = Path(args.config)
     sources = load_sources(config_path)
-    combined = ingest_sources(sources)
-    output_dir = Path("data")
-    output_dir.mkdir(exist_ok=True)
-    output_path = output_dir / "combined_dataset.csv"
+    cache_dir = None if args.no_cache else Path(args.cache_dir)
+    if args.stream:
+        output_path = Path(args.output or "data/combined_dataset")
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        rows = stream_sources(
+            sources,
+            output_path,
+            packed=args.packed,
+            chunk_rows=args.chunk_rows,
+            fmt=args.format,
+            cache_dir=cache_dir,
+            strict=args.strict_symptoms,
+        )
+        print(f"[[OK]] Streamed {rows} rows to partitioned dataset {output_path}")
+        return
+
+    combined = ingest_sources(sources, packed=args.packed, workers=args.workers, cache_dir=cache_dir,
+                              strict=args.strict_symptoms)
+    output_path = Path(args.output or "data/combined_dataset.csv")
+    output_path.parent.mkdir(parents=True, exist_ok=True)
     combined.to_csv(output_path, index=False)
     print(f"[[OK]] Combined dataset saved to {output_path}")
 
@@ -0,0 +1,91 @@
+"""Shared feature schema: vitals, the symptom registry and its bitmask encoding.
+
+Every symptom owns a fixed bit in a uint64 mask. Datasets, training frames and
+the serving path carry that single mask column and only expand it into one
+0/1 model feature per symptom at the last step.
+"""
+import numpy as np
+
+VITAL_COLUMNS = ('Body_Temperature', 'Heart_Rate', 'Respiratory_Rate', 'Activity_Level')
+SPECIES_PREFIX = 'Animal_Type_'
+MASK_COLUMN = 'Symptom_Mask'
+
+# Fixed one-hot species order (sorted, matching the layout the bundled model was trained with).
+# Chunked training encodes every chunk against this list instead of discovering levels from the data.
+SPECIES = ('Cat', 'Cow', 'Dog', 'Fox', 'Goat', 'Horse', 'Pig', 'Sheep')
+
+# Bit positions are part of the on-disk format: append new symptoms, never reorder
+SYMPTOMS = (
+    # GI
+    'Vomiting', 'Diarrhea', 'Appetite_Loss', 'Bloat_Distension', 'Dehydration',
+    # Respiratory
+    'Coughing', 'Sneezing', 'Nasal_Discharge', 'Resp_Distress',
+    # Systemic/Pain
+    'Lethargy', 'Fever_Chills', 'Weight_Loss', 'Pale_Gums', 'Jaundice',
+    # Musculoskeletal/Derm
+    'Lameness', 'Swelling', 'Stiff_Joints', 'Skin_Lesions', 'Hair_Loss', 'Blisters', 'Pustules',
+    # Neurological
+    'Seizures', 'Tremors', 'Uncoordinated', 'Aggression', 'Restlessness', 'Rolling', 'Hard_Pads',
+    # Head/Face
+    'Eye_Discharge', 'Excess_Saliva', 'Swollen_Lymph_Nodes', 'Sweating',
+    # Urinary
+    'Straining_Urinate', 'Red_Urine',
+)
+assert len(SYMPTOMS) <= 64, "Symptom registry no longer fits a uint64 mask"
+
+SYMPTOM_BITS = {name: bit for bit, name in enumerate(SYMPTOMS)}
+_SHIFTS = np.arange(len(SYMPTOMS), dtype=np.uint64)
+
+
+def encode_symptoms(names):
+    """Bitmask for an iterable of symptom names; unknown names are ignored."""
+    mask = 0
+    for name in names:
+        bit = SYMPTOM_BITS.get(name) if isinstance(name, str) else None
+        if bit is not None:
+            mask |= 1 << bit
+    return mask
+
+
+def decode_symptoms(mask):
+    return [name for bit, name in enumerate(SYMPTOMS) if mask >> bit & 1]
+
+
+def validate_symptoms(names):
+    unknown = [name for name in names if name not in SYMPTOM_BITS]
+    if unknown:
+        raise ValueError(f"Unknown symptom column(s) {unknown}; add them to feature_schema.SYMPTOMS")
+
+
+def pack_symptom_columns(df):
+    """uint64 masks from the wide 0/1 symptom columns present in `df`."""
+    mask = np.zeros(len(df), dtype=np.uint64)
+    for name in SYMPTOMS:
+        if name in df.columns:
+            flags = df[name].to_numpy() != 0
+            mask |= flags.astype(np.uint64) << np.uint64(SYMPTOM_BITS[name])
+    return mask
+
+
+def unpack_symptom_mask(masks, dtype=np.uint8):
+    """(n_rows x len(SYMPTOMS)) 0/1 matrix in registry order."""
+    masks = np.asarray(masks, dtype=np.uint64).reshape(-1, 1)
+    return ((masks >> _SHIFTS) & np.uint64(1)).astype(dtype)
+
+
+def to_packed(df):
+    """Replace wide symptom columns with a single Symptom_Mask column."""
+    if MASK_COLUMN in df.columns:
+        return df
+    mask = pack_symptom_columns(df)
+    df = df.drop(columns=[name for name in SYMPTOMS if name in df.columns])
+    df[MASK_COLUMN] = mask
+    return df
+
+
+def to_wide(df, symptoms=SYMPTOMS):
+    """Inverse of `to_packed`: one uint8 column per registry symptom."""
+    if MASK_COLUMN not in df.columns:
+        return df
+    flags = unpack_symptom_mask(df[MASK_COLUMN].to_numpy())
+    return df.drop(columns=MASK_COLUMN).assign(**{name: flags[:, SYMPTOM_BITS[name]] for name in symptoms})
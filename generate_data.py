@@ -1,265 +1,385 @@
-import pandas as pd
+"""Synthetic veterinary dataset generator.
+
+Rows are sampled in NumPy-vectorized chunks. Each chunk draws from its own
+stream spawned from one `SeedSequence`, so a given `--seed` and `--chunk-rows`
+reproduce the same dataset however many worker processes generate it.
+"""
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+
 import numpy as np
-import random
+import pandas as pd
 
-def generate_enhanced_dataset(num_samples=8000):
-    print("Generating Comprehensive Veterinary Dataset (v4 - Specialist Level)...")
+from feature_schema import MASK_COLUMN, SYMPTOM_BITS, SYMPTOMS, VITAL_COLUMNS, to_wide
+
+DEFAULT_CHUNK_ROWS = 100_000
+
+# --- COMPREHENSIVE DISEASE DATABASE ---
+DISEASES = {
+    # --- CANINE (DOG) ---
+    'K9 Parvovirus': {
+        'species': ['Dog', 'Fox'], # Added wild dog proxy
+        'symptoms': {'Vomiting': 0.95, 'Diarrhea': 0.95, 'Appetite_Loss': 0.95, 'Lethargy': 0.95, 'Dehydration': 0.9, 'Red_Urine': 0.1}, # Bloody diarrhea proxy
+        'vitals': {'temp': (39.5, 41.5), 'hr': (120, 180), 'resp': (30, 60), 'act': (0, 10)}
+    },
+    'K9 Distemper': {
+        'species': ['Dog'],
+        'symptoms': {'Coughing': 0.9, 'Eye_Discharge': 0.95, 'Nasal_Discharge': 0.95, 'Seizures': 0.4, 'Tremors': 0.5, 'Hard_Pads': 0.3},
+        'vitals': {'temp': (39.5, 41.0), 'hr': (100, 150), 'resp': (30, 50), 'act': (10, 40)}
+    },
+    'Rabies': {
+        'species': ['Dog', 'Cat', 'Cow', 'Horse', 'Fox'],
+        'symptoms': {'Aggression': 0.9, 'Excess_Saliva': 0.95, 'Seizures': 0.7, 'Uncoordinated': 0.8, 'Appetite_Loss': 0.5},
+        'vitals': {'temp': (39.5, 41.0), 'hr': (100, 160), 'resp': (40, 80), 'act': (80, 100)} # Agitated
+    },
+    'Heartworm Disease': {
+        'species': ['Dog'],
+        'symptoms': {'Coughing': 0.9, 'Resp_Distress': 0.8, 'Lethargy': 0.7, 'Weight_Loss': 0.6},
+        'vitals': {'temp': 'NORMAL', 'hr': (100, 140), 'resp': (40, 70), 'act': (20, 50)}
+    },
+    'Lyme Disease': {
+        'species': ['Dog', 'Horse'],
+        'symptoms': {'Lameness': 0.9, 'Stiff_Joints': 0.95, 'Lethargy': 0.7, 'Fever_Chills': 0.8},
+        'vitals': {'temp': (39.5, 40.5), 'hr': 'NORMAL', 'resp': 'NORMAL', 'act': (30, 60)}
+    },
     
-    # --- EXPANDED SYMPTOM LIST (30 Clinical Signs) ---
-    # This covers Systemic, GI, Neuro, Resp, Derm, and Urinary systems
-    all_symptoms = [
-        # GI
-        'Vomiting', 'Diarrhea', 'Appetite_Loss', 'Bloat_Distension', 'Dehydration',
-        # Respiratory
-        'Coughing', 'Sneezing', 'Nasal_Discharge', 'Resp_Distress', 
-        # Systemic/Pain
-        'Lethargy', 'Fever_Chills', 'Weight_Loss', 'Pale_Gums', 'Jaundice',
-        # Musculoskeletal/Derm
-        'Lameness', 'Swelling', 'Stiff_Joints', 'Skin_Lesions', 'Hair_Loss', 'Blisters', 'Pustules',
-        # Neurological
-        'Seizures', 'Tremors', 'Uncoordinated', 'Aggression', 'Restlessness', 'Rolling', 'Hard_Pads',
-        # Head/Face
-        'Eye_Discharge', 'Excess_Saliva', 'Swollen_Lymph_Nodes', 'Sweating',
-        # Urinary
-        'Straining_Urinate', 'Red_Urine'
-    ]
-
-    # --- COMPREHENSIVE DISEASE DATABASE ---
-    diseases = {
-        # --- CANINE (DOG) ---
-        'K9 Parvovirus': {
-            'species': ['Dog', 'Fox'], # Added wild dog proxy
-            'symptoms': {'Vomiting': 0.95, 'Diarrhea': 0.95, 'Appetite_Loss': 0.95, 'Lethargy': 0.95, 'Dehydration': 0.9, 'Red_Urine': 0.1}, # Bloody diarrhea proxy
-            'vitals': {'temp': (39.5, 41.5), 'hr': (120, 180), 'resp': (30, 60), 'act': (0, 10)}
-        },
-        'K9 Distemper': {
-            'species': ['Dog'],
-            'symptoms': {'Coughing': 0.9, 'Eye_Discharge': 0.95, 'Nasal_Discharge': 0.95, 'Seizures': 0.4, 'Tremors': 0.5, 'Hard_Pads': 0.3},
-            'vitals': {'temp': (39.5, 41.0), 'hr': (100, 150), 'resp': (30, 50), 'act': (10, 40)}
-        },
-        'Rabies': {
-            'species': ['Dog', 'Cat', 'Cow', 'Horse', 'Fox'],
-            'symptoms': {'Aggression': 0.9, 'Excess_Saliva': 0.95, 'Seizures': 0.7, 'Uncoordinated': 0.8, 'Appetite_Loss': 0.5},
-            'vitals': {'temp': (39.5, 41.0), 'hr': (100, 160), 'resp': (40, 80), 'act': (80, 100)} # Agitated
-        },
-        'Heartworm Disease': {
-            'species': ['Dog'],
-            'symptoms': {'Coughing': 0.9, 'Resp_Distress': 0.8, 'Lethargy': 0.7, 'Weight_Loss': 0.6},
-            'vitals': {'temp': 'NORMAL', 'hr': (100, 140), 'resp': (40, 70), 'act': (20, 50)}
-        },
-        'Lyme Disease': {
-            'species': ['Dog', 'Horse'],
-            'symptoms': {'Lameness': 0.9, 'Stiff_Joints': 0.95, 'Lethargy': 0.7, 'Fever_Chills': 0.8},
-            'vitals': {'temp': (39.5, 40.5), 'hr': 'NORMAL', 'resp': 'NORMAL', 'act': (30, 60)}
-        },
-        
-        # --- FELINE (CAT) ---
-        'Feline Panleukopenia': {
-            'species': ['Cat'],
-            'symptoms': {'Vomiting': 0.95, 'Diarrhea': 0.9, 'Appetite_Loss': 0.95, 'Lethargy': 0.95, 'Dehydration': 0.8},
-            'vitals': {'temp': (39.5, 41.5), 'hr': (160, 240), 'resp': (40, 80), 'act': (0, 20)}
-        },
-        'Feline FLUTD (Urinary)': {
-            'species': ['Cat'],
-            'symptoms': {'Straining_Urinate': 1.0, 'Red_Urine': 0.9, 'Aggression': 0.4, 'Lethargy': 0.3},
-            'vitals': {'temp': 'NORMAL', 'hr': (140, 200), 'resp': 'NORMAL', 'act': (50, 80)} # Pain stress
-        },
-        'Cat Flu (URI)': { 
-            'species': ['Cat'],
-            'symptoms': {'Sneezing': 0.95, 'Eye_Discharge': 0.9, 'Nasal_Discharge': 0.9, 'Appetite_Loss': 0.5},
-            'vitals': {'temp': (39.0, 40.0), 'hr': (140, 180), 'resp': (30, 50), 'act': (40, 70)}
-        },
-
-        # --- BOVINE (COW) ---
-        'Bovine Mastitis': {
-            'species': ['Cow', 'Goat', 'Sheep'],
-            'symptoms': {'Swelling': 0.95, 'Appetite_Loss': 0.6, 'Lethargy': 0.6, 'Fever_Chills': 0.7},
-            'vitals': {'temp': (39.5, 41.5), 'hr': (80, 110), 'resp': (30, 60), 'act': (20, 50)}
-        },
-        'Foot and Mouth': {
-            'species': ['Cow', 'Pig', 'Sheep', 'Goat'],
-            'symptoms': {'Lameness': 0.95, 'Excess_Saliva': 0.95, 'Blisters': 1.0, 'Appetite_Loss': 0.9},
-            'vitals': {'temp': (40.0, 42.0), 'hr': (90, 120), 'resp': (40, 70), 'act': (10, 30)}
-        },
-        'Milk Fever (Hypocalcemia)': {
-            'species': ['Cow'],
-            'symptoms': {'Tremors': 0.8, 'Uncoordinated': 0.9, 'Lethargy': 1.0, 'Bloat_Distension': 0.3},
-            'vitals': {'temp': (36.0, 37.8), 'hr': (80, 120), 'resp': (10, 30), 'act': (0, 10)} # LOW TEMP
-        },
-        'Bloat': {
-            'species': ['Cow', 'Sheep', 'Goat'],
-            'symptoms': {'Bloat_Distension': 1.0, 'Resp_Distress': 0.8, 'Restlessness': 0.7, 'Appetite_Loss': 1.0},
-            'vitals': {'temp': 'NORMAL', 'hr': (100, 140), 'resp': (60, 90), 'act': (20, 40)}
-        },
-
-        # --- EQUINE (HORSE) ---
-        'Strangles': {
-            'species': ['Horse'],
-            'symptoms': {'Coughing': 0.3, 'Nasal_Discharge': 0.95, 'Swollen_Lymph_Nodes': 1.0, 'Lethargy': 0.8},
-            'vitals': {'temp': (39.5, 41.0), 'hr': (45, 65), 'resp': (20, 35), 'act': (20, 40)}
-        },
-        'Colic': {
-            'species': ['Horse'],
-            'symptoms': {'Rolling': 1.0, 'Sweating': 0.9, 'Appetite_Loss': 1.0, 'Restlessness': 1.0, 'Bloat_Distension': 0.4},
-            'vitals': {'temp': (37.5, 39.0), 'hr': (50, 100), 'resp': (25, 60), 'act': (40, 60)} 
-        },
-        'Laminitis': {
-            'species': ['Horse'],
-            'symptoms': {'Lameness': 1.0, 'Stiff_Joints': 0.8, 'Sweating': 0.5, 'Restlessness': 0.6},
-            'vitals': {'temp': (37.5, 39.0), 'hr': (50, 80), 'resp': (20, 50), 'act': (10, 30)}
-        },
-        'Tetanus': {
-            'species': ['Horse', 'Dog', 'Sheep'],
-            'symptoms': {'Stiff_Joints': 1.0, 'Tremors': 0.8, 'Excess_Saliva': 0.5, 'Resp_Distress': 0.6},
-            'vitals': {'temp': (38.5, 40.0), 'hr': (80, 120), 'resp': (30, 60), 'act': (0, 10)} # Locked up
-        },
-
-        # --- PORCINE (PIG) ---
-        'Swine Erysipelas': {
-            'species': ['Pig'],
-            'symptoms': {'Skin_Lesions': 1.0, 'Fever_Chills': 0.9, 'Lameness': 0.7, 'Lethargy': 0.8},
-            'vitals': {'temp': (40.0, 42.0), 'hr': (90, 130), 'resp': (30, 60), 'act': (10, 30)}
-        },
-        'Gastroenteritis (General)': {
-            'species': ['Dog', 'Cat', 'Pig'],
-            'symptoms': {'Vomiting': 0.9, 'Diarrhea': 0.9, 'Appetite_Loss': 0.8},
-            'vitals': {'temp': (38.5, 40.0), 'hr': (100, 160), 'resp': (20, 40), 'act': (30, 60)}
-        },
-        
-        # --- GENERAL ---
-        'Internal Parasites': {
-            'species': ['Dog', 'Cat', 'Cow', 'Sheep', 'Goat', 'Horse'],
-            'symptoms': {'Weight_Loss': 0.9, 'Pale_Gums': 0.8, 'Diarrhea': 0.4, 'Lethargy': 0.5},
-            'vitals': 'NORMAL'
-        },
-        'Healthy': {
-            'species': ['Dog', 'Cat', 'Cow', 'Horse', 'Pig', 'Sheep', 'Goat'],
-            'symptoms': {}, 
-            'vitals': 'SPECIES_SPECIFIC'
-        }
-    }
+    # --- FELINE (CAT) ---
+    'Feline Panleukopenia': {
+        'species': ['Cat'],
+        'symptoms': {'Vomiting': 0.95, 'Diarrhea': 0.9, 'Appetite_Loss': 0.95, 'Lethargy': 0.95, 'Dehydration': 0.8},
+        'vitals': {'temp': (39.5, 41.5), 'hr': (160, 240), 'resp': (40, 80), 'act': (0, 20)}
+    },
+    'Feline FLUTD (Urinary)': {
+        'species': ['Cat'],
+        'symptoms': {'Straining_Urinate': 1.0, 'Red_Urine': 0.9, 'Aggression': 0.4, 'Lethargy': 0.3},
+        'vitals': {'temp': 'NORMAL', 'hr': (140, 200), 'resp': 'NORMAL', 'act': (50, 80)} # Pain stress
+    },
+    'Cat Flu (URI)': { 
+        'species': ['Cat'],
+        'symptoms': {'Sneezing': 0.95, 'Eye_Discharge': 0.9, 'Nasal_Discharge': 0.9, 'Appetite_Loss': 0.5},
+        'vitals': {'temp': (39.0, 40.0), 'hr': (140, 180), 'resp': (30, 50), 'act': (40, 70)}
+    },
+
+    # --- BOVINE (COW) ---
+    'Bovine Mastitis': {
+        'species': ['Cow', 'Goat', 'Sheep'],
+        'symptoms': {'Swelling': 0.95, 'Appetite_Loss': 0.6, 'Lethargy': 0.6, 'Fever_Chills': 0.7},
+        'vitals': {'temp': (39.5, 41.5), 'hr': (80, 110), 'resp': (30, 60), 'act': (20, 50)}
+    },
+    'Foot and Mouth': {
+        'species': ['Cow', 'Pig', 'Sheep', 'Goat'],
+        'symptoms': {'Lameness': 0.95, 'Excess_Saliva': 0.95, 'Blisters': 1.0, 'Appetite_Loss': 0.9},
+        'vitals': {'temp': (40.0, 42.0), 'hr': (90, 120), 'resp': (40, 70), 'act': (10, 30)}
+    },
+    'Milk Fever (Hypocalcemia)': {
+        'species': ['Cow'],
+        'symptoms': {'Tremors': 0.8, 'Uncoordinated': 0.9, 'Lethargy': 1.0, 'Bloat_Distension': 0.3},
+        'vitals': {'temp': (36.0, 37.8), 'hr': (80, 120), 'resp': (10, 30), 'act': (0, 10)} # LOW TEMP
+    },
+    'Bloat': {
+        'species': ['Cow', 'Sheep', 'Goat'],
+        'symptoms': {'Bloat_Distension': 1.0, 'Resp_Distress': 0.8, 'Restlessness': 0.7, 'Appetite_Loss': 1.0},
+        'vitals': {'temp': 'NORMAL', 'hr': (100, 140), 'resp': (60, 90), 'act': (20, 40)}
+    },
 
-    # Species "Normal" Vitals (Temp, HR, Resp)
-    species_vitals = {
-        'Dog': ((38.0, 39.0), (60, 100), (10, 30)),
-        'Cat': ((38.0, 39.2), (120, 180), (20, 40)),
-        'Cow': ((38.0, 39.0), (48, 84), (26, 50)),
-        'Horse': ((37.2, 38.3), (28, 44), (10, 24)),
-        'Pig': ((38.7, 39.8), (60, 80), (10, 20)),
-        'Sheep': ((39.0, 40.0), (70, 80), (15, 30)),
-        'Goat': ((38.5, 39.7), (70, 80), (15, 30)),
-        'Fox': ((38.5, 39.8), (80, 120), (20, 40)) # Added for robustness
+    # --- EQUINE (HORSE) ---
+    'Strangles': {
+        'species': ['Horse'],
+        'symptoms': {'Coughing': 0.3, 'Nasal_Discharge': 0.95, 'Swollen_Lymph_Nodes': 1.0, 'Lethargy': 0.8},
+        'vitals': {'temp': (39.5, 41.0), 'hr': (45, 65), 'resp': (20, 35), 'act': (20, 40)}
+    },
+    'Colic': {
+        'species': ['Horse'],
+        'symptoms': {'Rolling': 1.0, 'Sweating': 0.9, 'Appetite_Loss': 1.0, 'Restlessness': 1.0, 'Bloat_Distension': 0.4},
+        'vitals': {'temp': (37.5, 39.0), 'hr': (50, 100), 'resp': (25, 60), 'act': (40, 60)} 
+    },
+    'Laminitis': {
+        'species': ['Horse'],
+        'symptoms': {'Lameness': 1.0, 'Stiff_Joints': 0.8, 'Sweating': 0.5, 'Restlessness': 0.6},
+        'vitals': {'temp': (37.5, 39.0), 'hr': (50, 80), 'resp': (20, 50), 'act': (10, 30)}
+    },
+    'Tetanus': {
+        'species': ['Horse', 'Dog', 'Sheep'],
+        'symptoms': {'Stiff_Joints': 1.0, 'Tremors': 0.8, 'Excess_Saliva': 0.5, 'Resp_Distress': 0.6},
+        'vitals': {'temp': (38.5, 40.0), 'hr': (80, 120), 'resp': (30, 60), 'act': (0, 10)} # Locked up
+    },
+
+    # --- PORCINE (PIG) ---
+    'Swine Erysipelas': {
+        'species': ['Pig'],
+        'symptoms': {'Skin_Lesions': 1.0, 'Fever_Chills': 0.9, 'Lameness': 0.7, 'Lethargy': 0.8},
+        'vitals': {'temp': (40.0, 42.0), 'hr': (90, 130), 'resp': (30, 60), 'act': (10, 30)}
+    },
+    'Gastroenteritis (General)': {
+        'species': ['Dog', 'Cat', 'Pig'],
+        'symptoms': {'Vomiting': 0.9, 'Diarrhea': 0.9, 'Appetite_Loss': 0.8},
+        'vitals': {'temp': (38.5, 40.0), 'hr': (100, 160), 'resp': (20, 40), 'act': (30, 60)}
+    },
+    
+    # --- GENERAL ---
+    'Internal Parasites': {
+        'species': ['Dog', 'Cat', 'Cow', 'Sheep', 'Goat', 'Horse'],
+        'symptoms': {'Weight_Loss': 0.9, 'Pale_Gums': 0.8, 'Diarrhea': 0.4, 'Lethargy': 0.5},
+        'vitals': 'NORMAL'
+    },
+    'Healthy': {
+        'species': ['Dog', 'Cat', 'Cow', 'Horse', 'Pig', 'Sheep', 'Goat'],
+        'symptoms': {}, 
+        'vitals': 'SPECIES_SPECIFIC'
     }
+}
+
+# Species "Normal" Vitals (Temp, HR, Resp)
+SPECIES_VITALS = {
+    'Dog': ((38.0, 39.0), (60, 100), (10, 30)),
+    'Cat': ((38.0, 39.2), (120, 180), (20, 40)),
+    'Cow': ((38.0, 39.0), (48, 84), (26, 50)),
+    'Horse': ((37.2, 38.3), (28, 44), (10, 24)),
+    'Pig': ((38.7, 39.8), (60, 80), (10, 20)),
+    'Sheep': ((39.0, 40.0), (70, 80), (15, 30)),
+    'Goat': ((38.5, 39.7), (70, 80), (15, 30)),
+    'Fox': ((38.5, 39.8), (80, 120), (20, 40)) # Added for robustness
+}
 
-    data = []
-
-    for _ in range(num_samples):
-        # 1. Pick a disease
-        keys = list(diseases.keys())
-        weights = [1] * len(keys)
-        # Healthy still needs to be baseline
-        healthy_idx = keys.index('Healthy')
-        weights[healthy_idx] = 2 # Baseline, but not too dominant
-        
-        disease_name = random.choices(keys, weights=weights, k=1)[0]
-        info = diseases[disease_name]
-        
-        # 2. Pick a species
-        species = random.choice(info['species'])
-        
-        row = {
-            'Animal_Type': species,
-            'Disease_Prediction': disease_name
-        }
-
-        # 3. Generate Vitals
-        if species in species_vitals:
-            sp_vitals = species_vitals[species]
-        else:
-            sp_vitals = species_vitals['Dog'] # Fallback
-        
-        # Early Stage Logic
-        is_early = False
-        if disease_name != 'Healthy' and random.random() < 0.20:
-            is_early = True
-
-        if disease_name == 'Healthy' or is_early or info.get('vitals') == 'NORMAL':
-            # Use species normal
-            t_range, h_range, r_range = sp_vitals
-            row['Body_Temperature'] = round(random.uniform(*t_range), 1)
-            row['Heart_Rate'] = int(random.uniform(*h_range))
-            row['Respiratory_Rate'] = int(random.uniform(*r_range))
-            
-            if disease_name == 'Healthy':
-                row['Activity_Level'] = int(random.uniform(90, 100))
-            else:
-                row['Activity_Level'] = int(random.uniform(70, 95)) 
-        else:
-            # Severe Case
-            v = info['vitals']
-            
-            t_range = v.get('temp', sp_vitals[0])
-            if t_range == 'NORMAL': t_range = sp_vitals[0]
-            
-            h_range = v.get('hr', sp_vitals[1])
-            if h_range == 'NORMAL': h_range = sp_vitals[1]
-            
-            r_range = v.get('resp', sp_vitals[2])
-            if r_range == 'NORMAL': r_range = sp_vitals[2]
-            
-            a_range = v.get('act', (20, 60))
-
-            row['Body_Temperature'] = round(random.uniform(*t_range), 1)
-            row['Heart_Rate'] = int(random.uniform(*h_range))
-            row['Respiratory_Rate'] = int(random.uniform(*r_range))
-            row['Activity_Level'] = int(random.uniform(*a_range))
-        
-        # 4. Generate Symptoms
-        for sym in all_symptoms:
-            row[sym] = 0
+# Healthy still needs to be baseline, but not too dominant
+HEALTHY_WEIGHT = 2
+# Share of sick animals presenting early, with species-normal vitals and damped symptoms
+EARLY_STAGE_RATE = 0.20
 
+
+def compile_tables(diseases=DISEASES, species_vitals=SPECIES_VITALS):
+    """Turn the disease database into the arrays the vectorized sampler indexes into."""
+    names = list(diseases)
+    species_names = list(species_vitals)
+    species_pos = {name: i for i, name in enumerate(species_names)}
+    n_diseases, n_symptoms = len(names), len(SYMPTOMS)
+
+    weights = np.array([HEALTHY_WEIGHT if name == 'Healthy' else 1 for name in names], dtype=np.float64)
+    max_species = max(len(info['species']) for info in diseases.values())
+    species_table = np.zeros((n_diseases, max_species), dtype=np.intp)
+    species_count = np.zeros(n_diseases, dtype=np.intp)
+
+    # (disease, vital, lo/hi); NaN means "species normal"
+    severe = np.full((n_diseases, len(VITAL_COLUMNS), 2), np.nan)
+    normal_vitals = np.zeros(n_diseases, dtype=bool)
+    probs = np.zeros((n_diseases, n_symptoms))
+    early_probs = np.zeros((n_diseases, n_symptoms))
+    fallback = np.zeros(n_diseases, dtype=np.uint64)
+
+    for d, name in enumerate(names):
+        info = diseases[name]
+        species = [species_pos[s] for s in info['species']]
+        species_table[d, :len(species)] = species
+        species_count[d] = len(species)
+
+        vitals = info.get('vitals')
+        normal_vitals[d] = vitals == 'NORMAL'
+        if isinstance(vitals, dict):
+            for k, key in enumerate(('temp', 'hr', 'resp')):
+                if isinstance(vitals.get(key), tuple):
+                    severe[d, k] = vitals[key]
+            severe[d, 3] = vitals.get('act', (20, 60))
+
+        if name == 'Healthy':
+            continue
         disease_symptoms = info.get('symptoms', {})
         signature_syms = [sym for sym, prob in disease_symptoms.items() if prob >= 0.9]
+        probs[d] = 0.01
+        early_probs[d] = 0.005
+        for sym, prob in disease_symptoms.items():
+            prob = 0.98 if sym in signature_syms else prob
+            probs[d, SYMPTOM_BITS[sym]] = prob
+            early_probs[d, SYMPTOM_BITS[sym]] = prob * 0.6
+        # Ensure at least two symptoms for non-healthy cases
+        for sym in (signature_syms or list(disease_symptoms))[:2]:
+            fallback[d] |= np.uint64(1 << SYMPTOM_BITS[sym])
 
-        for sym in all_symptoms:
-            if disease_name == 'Healthy':
-                continue
+    species_ranges = np.array([species_vitals[name] for name in species_names], dtype=np.float64)
+    return {
+        'names': names,
+        'species_names': species_names,
+        'healthy': names.index('Healthy'),
+        'p': weights / weights.sum(),
+        'species_table': species_table,
+        'species_count': species_count,
+        'severe': severe,
+        'normal_vitals': normal_vitals,
+        'species_ranges': species_ranges,
+        'probs': probs,
+        'early_probs': early_probs,
+        'fallback': fallback,
+    }
 
-            if sym in disease_symptoms:
-                base_prob = disease_symptoms[sym]
-                if sym in signature_syms:
-                    prob = 0.98
-                else:
-                    prob = base_prob
-                if is_early:
-                    prob *= 0.6
-            else:
-                prob = 0.01 if not is_early else 0.005
 
-            if random.random() < prob:
-                row[sym] = 1
+_TABLES = compile_tables()
+_BIT_VALUES = np.left_shift(np.uint64(1), np.arange(len(SYMPTOMS), dtype=np.uint64))
 
-        # Ensure at least two symptoms for non-healthy cases
-        if disease_name != 'Healthy':
-            symptom_count = sum(row[sym] for sym in all_symptoms)
-            if symptom_count < 2:
-                fallback_syms = signature_syms or list(disease_symptoms.keys())
-                for sym in fallback_syms[:2]:
-                    row[sym] = 1
-        
-        # 5. Logical Inconsistencies Fix (Sanity Check)
-        # A dead animal (Act=0) shouldn't be "Healthy"
-        if row['Activity_Level'] < 30 and disease_name == 'Healthy':
-             row['Activity_Level'] = 80 # Force fix
-
-        data.append(row)
-
-    df = pd.DataFrame(data)
-    
-    # Save
-    df.to_csv('enhanced_animal_disease.csv', index=False)
-    print(f"Specialist dataset generated with {len(df)} samples.")
-    print(f"Covering {len(keys)} distinct conditions.")
+
+def generate_chunk(num_rows, seed, tables=_TABLES):
+    """One packed chunk of `num_rows` cases drawn from `seed` (an int or SeedSequence)."""
+    rng = np.random.default_rng(seed)
+    n = int(num_rows)
+
+    # 1. Pick a disease, then a species it affects
+    disease = rng.choice(len(tables['names']), size=n, p=tables['p'])
+    pick = (rng.random(n) * tables['species_count'][disease]).astype(np.intp)
+    species = tables['species_table'][disease, pick]
+
+    # 2. Early Stage Logic
+    healthy = disease == tables['healthy']
+    early = ~healthy & (rng.random(n) < EARLY_STAGE_RATE)
+    normal = healthy | early | tables['normal_vitals'][disease]
+
+    # 3. Generate Vitals: species normal for healthy/early cases, disease ranges for severe ones
+    ranges = tables['severe'][disease]
+    species_ranges = tables['species_ranges'][species]
+    use_species = normal[:, None, None] | np.isnan(ranges[:, :3, :1])
+    ranges[:, :3] = np.where(use_species, species_ranges, ranges[:, :3])
+    activity = np.where(healthy[:, None], (90.0, 100.0), (70.0, 95.0))
+    ranges[:, 3] = np.where(normal[:, None], activity, ranges[:, 3])
+    vitals = ranges[..., 0] + rng.random((n, len(VITAL_COLUMNS))) * (ranges[..., 1] - ranges[..., 0])
+
+    # 4. Generate Symptoms (one bit per registry symptom)
+    probs = np.where(early[:, None], tables['early_probs'][disease], tables['probs'][disease])
+    present = rng.random(probs.shape) < probs
+    mask = np.bitwise_or.reduce(np.where(present, _BIT_VALUES, np.uint64(0)), axis=1)
+    sparse = ~healthy & (present.sum(axis=1) < 2)
+    mask[sparse] |= tables['fallback'][disease[sparse]]
+
+    activity_level = vitals[:, 3].astype(np.int16)
+    # 5. Logical Inconsistencies Fix: a dead animal (Act=0) shouldn't be "Healthy"
+    activity_level[(activity_level < 30) & healthy] = 80
+
+    return pd.DataFrame({
+        'Animal_Type': pd.Categorical.from_codes(species, tables['species_names']),
+        'Disease_Prediction': pd.Categorical.from_codes(disease, tables['names']),
+        'Body_Temperature': vitals[:, 0].round(1),
+        'Heart_Rate': vitals[:, 1].astype(np.int16),
+        'Respiratory_Rate': vitals[:, 2].astype(np.int16),
+        'Activity_Level': activity_level,
+        MASK_COLUMN: mask,
+    })
+
+
+def _chunk_job(num_rows, seed, packed):
+    df = generate_chunk(num_rows, seed)
+    return df if packed else to_wide(df)
+
+
+def iter_chunks(num_samples, seed=None, chunk_rows=DEFAULT_CHUNK_ROWS, packed=False, workers=1):
+    """Yield dataset chunks in order; chunk i always comes from the i-th spawned seed stream."""
+    chunk_rows = max(1, int(chunk_rows))
+    sizes = [min(chunk_rows, num_samples - start) for start in range(0, num_samples, chunk_rows)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    if workers <= 1:
+        for size, child in zip(sizes, seeds):
+            yield _chunk_job(size, child, packed)
+        return
+
+    # Keep a bounded window of chunks in flight so a slow writer doesn't buffer the whole dataset
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = []
+        for size, child in zip(sizes, seeds):
+            pending.append(pool.submit(_chunk_job, size, child, packed))
+            if len(pending) >= 2 * workers:
+                yield pending.pop(0).result()
+        for future in pending:
+            yield future.result()
+
+
+def output_format(output_path, fmt=None):
+    fmt = (fmt or ('parquet' if output_path.endswith(('.parquet', '.pq')) else 'csv')).lower()
+    if fmt not in ('csv', 'parquet'):
+        raise ValueError(f"Unsupported output format: {fmt}")
+    return fmt
+
+
+def _write_csv(chunks, path):
+    rows = 0
+    for df in chunks:
+        df.to_csv(path, mode='a' if rows else 'w', header=not rows, index=False)
+        rows += len(df)
+    return rows
+
+
+def _write_parquet(chunks, path):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise RuntimeError("Parquet output requires pyarrow (pip install pyarrow)") from e
+    rows, writer = 0, None
+    try:
+        for df in chunks:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(path, table.schema)
+            writer.write_table(table)
+            rows += len(df)
+    finally:
+        if writer is not None:
+            writer.close()
+    return rows
+
+
+def write_chunks(chunks, output_path, fmt=None):
+    """Stream `chunks` to a CSV or Parquet file; the file only appears once complete. Returns the row count."""
+    fmt = output_format(output_path, fmt)
+    tmp_path = f"{output_path}.tmp"
+    try:
+        rows = _write_parquet(chunks, tmp_path) if fmt == 'parquet' else _write_csv(chunks, tmp_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, output_path)
+    return rows
+
+
+def generate_enhanced_dataset(num_samples=8000, packed=False, output_path='enhanced_animal_disease.csv',
+                              seed=None, chunk_rows=DEFAULT_CHUNK_ROWS, workers=1, fmt=None):
+    print("Generating Comprehensive Veterinary Dataset (v4 - Specialist Level)...")
+    if seed is None:
+        seed = np.random.SeedSequence().entropy
+        print(f"[*] Seed: {seed} (pass --seed to reproduce)")
+
+    chunks = iter_chunks(num_samples, seed=seed, chunk_rows=chunk_rows, packed=packed, workers=workers)
+    rows = write_chunks(chunks, output_path, fmt)
+
+    print(f"Specialist dataset generated with {rows} samples.")
+    print(f"Covering {len(DISEASES)} distinct conditions.")
+    return output_path
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Generate the synthetic veterinary dataset.")
+    parser.add_argument("--rows", type=int, default=8000, help="Number of cases to generate.")
+    parser.add_argument("--output", default="enhanced_animal_disease.csv", help="Output CSV or .parquet path.")
+    parser.add_argument(
+        "--packed",
+        action="store_true",
+        help=f"Store symptoms as a single {MASK_COLUMN} bitmask column instead of one column each.",
+    )
+    parser.add_argument("--seed", type=int, default=None, help="Seed for a reproducible dataset.")
+    parser.add_argument(
+        "--chunk-rows",
+        type=int,
+        default=DEFAULT_CHUNK_ROWS,
+        help="Rows per generated chunk (part of the reproducibility key together with --seed).",
+    )
+    parser.add_argument("--workers", type=int, default=1, help="Processes generating chunks in parallel.")
+    parser.add_argument("--format", choices=("csv", "parquet"), default=None,
+                        help="Output format (default: inferred from --output).")
+    return parser.parse_args()
 
 if __name__ == "__main__":
-    generate_enhanced_dataset()
+    args = parse_args()
+    generate_enhanced_dataset(
+        args.rows,
+        packed=args.packed,
+        output_path=args.output,
+        seed=args.seed,
+        chunk_rows=args.chunk_rows,
+        workers=args.workers,
+        fmt=args.format,
+    )
@@ -0,0 +1,29 @@
+"""gunicorn settings, picked up automatically from the working directory.
+
+Workers default to WEB_CONCURRENCY (1). Each worker gets a stable slot number;
+after the fork, topology.configure_worker() sizes its thread budget and, with
+PIN_WORKERS=1, binds it to its slice of cores before app.py loads the model.
+The master also starts a fresh /metrics snapshot group for its workers.
+"""
+import os
+
+import metrics
+import topology
+
+workers = int(os.environ.get("WEB_CONCURRENCY", 1))
+
+
+def pre_fork(server, worker):
+    # Runs in the master; a replacement worker takes over the slot of the one that exited
+    worker.slot = topology.free_slot(getattr(w, "slot", None) for w in server.WORKERS.values())
+
+
+def post_fork(server, worker):
+    topology.configure_worker(worker.slot, server.num_workers)
+
+
+def on_starting(server):
+    # Groups /metrics snapshots by this master, so separate servers never add up
+    metrics_dir = os.environ.get("METRICS_DIR", metrics.DEFAULT_DIR)
+    if metrics_dir:
+        metrics.start_server_group(metrics_dir)
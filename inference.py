@@ -0,0 +1,691 @@
+"""Model loading and scoring shared by the API and offline tools.
+
+`load_model_bundle()` turns the artifacts on disk (the fast-start bundle written
+by train_model.py, or the legacy joblib pickles) into a `ModelBundle`: one
+`ModelTier` (scorer plus prediction cache) per model variant, optional
+per-species `ModelShard`s that load on first use, the precompiled feature
+layout and class names, built once and otherwise never mutated. Callers grab one bundle per request
+and use it throughout, so swapping in a freshly loaded bundle is a single
+reference assignment.
+"""
+import contextlib
+import json
+import math
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from feature_schema import SPECIES_PREFIX, SYMPTOMS, VITAL_COLUMNS, encode_symptoms, unpack_symptom_mask
+from tree_engine import FlatForest, check_parity, compare_probabilities, parity_probe
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+DEFAULT_BUNDLE_DIR = "model_bundle"
+BUNDLE_FORMAT_VERSION = 1
+DEFAULT_TIER = "full"
+# Largest batch the native engine scores itself; XGBoost is faster beyond (0 keeps every batch native)
+NATIVE_BATCH_ROWS = 2
+# Reported on /status: which of the heavy training-side libraries this process has imported
+HEAVY_MODULES = ("xgboost", "sklearn", "joblib", "pandas", "scipy")
+
+# What /predict assumes for fields a case leaves out
+CASE_DEFAULTS = {'species': 'Dog', 'temp': 38.0, 'hr': 80, 'resp': 20, 'activity': 100}
+
+# Canonical case key: (species column, symptom mask, temp in 0.1 °C, hr, resp, activity)
+VITAL_SCALE = np.array([10.0, 1.0, 1.0, 1.0])
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def _untimed(name):
+    return contextlib.nullcontext()
+
+
+class PredictionCache:
+    """Thread-safe LRU of model confidence vectors keyed by canonical case."""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+def parse_case(data):
+    """Validate one /predict payload; raises ValueError with a client-facing message."""
+    # User Input:
+    # {
+    #   "species": "Dog",
+    #   "temp": 39.5,
+    #   "hr": 120,
+    #   "resp": 30,
+    #   "activity": 50,
+    #   "symptoms": ["Vomiting", "Diarrhea"]
+    # }
+    if not isinstance(data, dict):
+        raise ValueError('Case must be a JSON object')
+
+    vitals = {name: data.get(name, CASE_DEFAULTS[name]) for name in ('temp', 'hr', 'resp', 'activity')}
+    try:
+        numbers = [float(value) for value in vitals.values()]
+    except (TypeError, ValueError):
+        raise ValueError('Vitals must be numeric values')
+    except OverflowError:
+        # Integers beyond the float range
+        numbers = [math.inf]
+    # NaN and inf (JSON NaN, "inf", 1e400) would poison the cache key and the feature row
+    if not all(math.isfinite(number) for number in numbers):
+        raise ValueError('Vitals must be finite numbers')
+
+    try:
+        case = {
+            # Thermometers (and the training data) resolve 0.1 °C
+            'temp': round(float(vitals['temp']), 1),
+            'hr': int(vitals['hr']),
+            'resp': int(vitals['resp']),
+            'activity': int(vitals['activity']),
+        }
+    except (TypeError, ValueError):
+        raise ValueError('Vitals must be numeric values')
+
+    species = data.get('species', CASE_DEFAULTS['species'])
+    if not isinstance(species, str):
+        raise ValueError('Species must be a string')
+    case['species'] = species
+
+    active_symptoms = data.get('symptoms', [])
+    if not isinstance(active_symptoms, list):
+        raise ValueError('Symptoms must be a list')
+    if not all(isinstance(symptom, str) for symptom in active_symptoms):
+        raise ValueError('Symptoms must be strings')
+    case['symptoms'] = active_symptoms
+    return case
+
+
+def parse_tier_hint(data):
+    """(tier, latency budget in ms) requested by a payload; raises ValueError with a client-facing message."""
+    if not isinstance(data, dict):
+        return None, None
+    tier = data.get('tier')
+    if tier is not None and not isinstance(tier, str):
+        raise ValueError('Tier must be a string')
+    budget = data.get('latency_budget_ms')
+    if budget is not None:
+        try:
+            budget = float(budget)
+        except (TypeError, ValueError):
+            raise ValueError('latency_budget_ms must be a number')
+        if not budget > 0:
+            raise ValueError('latency_budget_ms must be positive')
+    return tier, budget
+
+
+class ModelTier:
+    """One servable model variant: scorer, prediction cache and its measured accuracy and latency."""
+
+    def __init__(self, name, engine, scorer, version=None, info=None, cache_size=0):
+        self.name = name
+        self.engine = engine
+        self.scorer = scorer
+        self.version = version
+        self.info = dict(info or {})
+        self.cache = PredictionCache(cache_size)
+
+    @property
+    def latency_ms(self):
+        return self.info.get('latency_p50_ms')
+
+    @property
+    def accuracy(self):
+        return (self.info.get('metrics') or {}).get('accuracy')
+
+    def describe(self):
+        return {
+            'engine': self.engine,
+            'version': self.version,
+            'num_trees': self.info.get('num_trees'),
+            'accuracy': self.accuracy,
+            'latency_p50_ms': self.latency_ms,
+            'latency_p95_ms': self.info.get('latency_p95_ms'),
+            'prediction_cache': self.cache.stats(),
+        }
+
+
+class ModelShard:
+    """Per-species model over only that species' classes, loaded on first use.
+
+    Its scorer expands the shard's probabilities into the bundle's full class
+    vector (zero for classes the species never has). A shard that fails to
+    load stays unloaded and its species is served by the global model.
+    """
+
+    def __init__(self, species, info, class_positions, num_classes, loader, cache_size=0):
+        self.species = species
+        self.info = dict(info)
+        self.class_positions = np.asarray(class_positions, dtype=np.intp)
+        self.num_classes = num_classes
+        self.engine = None
+        self.error = None
+        self._loader = loader
+        self._scorer = None
+        self._lock = threading.Lock()
+        # Kept apart from the tier caches: a shard answers differently from the global model
+        self.cache = PredictionCache(cache_size)
+
+    @property
+    def loaded(self):
+        return self._scorer is not None
+
+    def _expand(self, X):
+        local = np.asarray(self._local_scorer(X))
+        confidences = np.zeros((len(local), self.num_classes), dtype=local.dtype)
+        confidences[:, self.class_positions] = local
+        return confidences
+
+    def scorer(self):
+        """The shard's scoring function, or None if it could not be loaded."""
+        if self._scorer is None and self.error is None:
+            with self._lock:
+                if self._scorer is None and self.error is None:
+                    self._load()
+        return self._scorer
+
+    def _load(self):
+        started = time.perf_counter()
+        try:
+            self.engine, self._local_scorer = self._loader(self.info)
+            probe = parity_probe(self._loader.features)
+            confidences = self._expand(probe)
+            if not np.all(np.isfinite(confidences)) or not np.allclose(confidences.sum(axis=1), 1.0, atol=1e-3):
+                raise ValueError("smoke prediction returned invalid probabilities")
+        except Exception as e:
+            self.error = str(e).splitlines()[0] if str(e) else repr(e)
+            print(f"[!] Shard '{self.species}' unavailable, using the global model: {self.error}")
+            return
+        # Bound method created once, so the micro-batcher can group rows by scorer identity
+        self._scorer = self._expand
+        self.info['load_seconds'] = round(time.perf_counter() - started, 4)
+        print(f"[+] Shard '{self.species}' loaded ({self.info.get('num_trees')} trees, {self.engine})")
+
+    def describe(self):
+        return {
+            'loaded': self.loaded,
+            'error': self.error,
+            'engine': self.engine,
+            'version': self.info.get('version'),
+            'num_trees': self.info.get('num_trees'),
+            'classes': len(self.class_positions),
+            'accuracy': (self.info.get('metrics') or {}).get('accuracy'),
+            'latency_p50_ms': self.info.get('latency_p50_ms'),
+            'load_seconds': self.info.get('load_seconds'),
+            'prediction_cache': self.cache.stats(),
+        }
+
+
+class ModelBundle:
+    """All tiers of one loaded model plus everything derived from it; treat as immutable."""
+
+    def __init__(self, features, classes, tiers, default_tier=DEFAULT_TIER, metrics=None, version=None,
+                 load_info=None, shards=None):
+        self.features = list(features)
+        self.tiers = dict(tiers)
+        self.default_tier = default_tier if default_tier in self.tiers else next(iter(self.tiers))
+        self.metrics = metrics
+        self.version = version
+        self.load_info = dict(load_info or {})
+
+        self.feature_index = {col: i for i, col in enumerate(self.features)}
+        self.species_index = {
+            col[len(SPECIES_PREFIX):]: i for col, i in self.feature_index.items() if col.startswith(SPECIES_PREFIX)
+        }
+        # Registry bit -> model column (bits the model was not trained on are dropped)
+        symptom_columns = np.array([self.feature_index.get(name, -1) for name in SYMPTOMS], dtype=np.intp)
+        self.known_symptoms = symptom_columns >= 0
+        self.symptom_columns = symptom_columns[self.known_symptoms]
+        self.vital_columns = np.array([self.feature_index[col] for col in VITAL_COLUMNS], dtype=np.intp)
+        self.row_template = np.zeros(len(self.features), dtype=np.float32)
+        self.class_names = np.asarray(classes).astype(str)
+        self.healthy_classes = np.char.find(np.char.upper(self.class_names), 'HEALTHY') >= 0
+
+        # Species column -> shard; only requests that name no tier route through shards
+        self.shards = dict(shards or {})
+        self.shard_columns = {
+            self.species_index[species]: shard for species, shard in self.shards.items() if species in self.species_index
+        }
+
+    @property
+    def engine(self):
+        return self.tiers[self.default_tier].engine
+
+    @property
+    def scorer(self):
+        return self.tiers[self.default_tier].scorer
+
+    @property
+    def cache(self):
+        return self.tiers[self.default_tier].cache
+
+    def select_tier(self, name=None, latency_budget_ms=None):
+        """Tier for a request: by name, else the most accurate one within the latency budget, else the default.
+
+        If no tier meets the budget the fastest one is used.
+        """
+        if name is not None:
+            if name not in self.tiers:
+                raise ValueError(f"Unknown tier '{name}' (available: {', '.join(self.tiers)})")
+            return self.tiers[name]
+        if latency_budget_ms is not None:
+            timed = [tier for tier in self.tiers.values() if tier.latency_ms is not None]
+            fitting = [tier for tier in timed if tier.latency_ms <= latency_budget_ms]
+            if fitting:
+                return max(fitting, key=lambda tier: (tier.accuracy or 0.0, -tier.latency_ms))
+            if timed:
+                return min(timed, key=lambda tier: tier.latency_ms)
+        return self.tiers[self.default_tier]
+
+    def case_key(self, case):
+        """Canonical, hashable form of everything the model sees for a case.
+
+        `case` comes from parse_case(), so its vitals are finite and `temp` is already on the 0.1 °C grid.
+        """
+        return (
+            self.species_index.get(case['species'], -1),
+            encode_symptoms(case['symptoms']),
+            round(case['temp'] * 10),
+            case['hr'],
+            case['resp'],
+            case['activity'],
+        )
+
+    def build_feature_matrix(self, keys):
+        """One float32 row per case key, columns in `features` order."""
+        return self.assemble_matrix(
+            np.array([key[0] for key in keys], dtype=np.intp),
+            np.array([key[1] for key in keys], dtype=np.uint64),
+            np.array([key[2:] for key in keys], dtype=np.float64),
+        )
+
+    def assemble_matrix(self, species_ids, masks, vitals):
+        """Feature rows from key columns: species column (-1 = unknown), symptom masks, scaled vitals (n x 4)."""
+        X = np.empty((len(species_ids), len(self.row_template)), dtype=np.float32)
+        X[:] = self.row_template
+
+        X[:, self.vital_columns] = np.asarray(vitals, dtype=np.float64) / VITAL_SCALE
+
+        rows = np.flatnonzero(species_ids >= 0)
+        X[rows, species_ids[rows]] = 1
+
+        # Symptoms travel as a bitmask and are only expanded into columns here
+        X[:, self.symptom_columns] = unpack_symptom_mask(masks)[:, self.known_symptoms]
+        return X
+
+    def score_matrix(self, X, tier=None):
+        # In-place prediction (or the native engine): no DMatrix allocation, columns already in model order
+        return (tier or self.tiers[self.default_tier]).scorer(X)
+
+    def route(self, tier, species_column, use_shards=False):
+        """(scoring function, prediction cache) for one row: its species shard if `use_shards`, else the tier's."""
+        if use_shards:
+            shard = self.shard_columns.get(species_column)
+            if shard is not None:
+                scorer = shard.scorer()
+                if scorer is not None:
+                    return scorer, shard.cache
+        return tier.scorer, tier.cache
+
+    def scorer_for(self, tier, species_column, use_shards=False):
+        return self.route(tier, species_column, use_shards)[0]
+
+    def score_cases(self, cases, batcher=None, tier=None, timer=None, use_shards=False):
+        """Confidence matrix for parsed cases from `tier` (default tier if None), cached per model.
+
+        With `use_shards` (for requests that name no tier or latency budget),
+        rows of a species with a shard are scored by that shard instead. Rows
+        are scored in one call per model. With a `batcher`, single uncached
+        rows go through it so concurrent requests share one model call. A
+        `timer` (metrics.StageTimer) gets the time spent in the "features" and
+        "predict" stages.
+        """
+        stage = timer.stage if timer is not None else _untimed
+        tier = tier or self.tiers[self.default_tier]
+        with stage("features"):
+            keys = [self.case_key(case) for case in cases]
+            routes = [self.route(tier, key[0], use_shards) for key in keys]
+            confidences = [cache.get(key) for key, (_, cache) in zip(keys, routes)]
+            missing = [i for i, conf in enumerate(confidences) if conf is None]
+        if missing:
+            groups = {}
+            for i in missing:
+                groups.setdefault(routes[i][0], []).append(i)
+            for scorer, rows in groups.items():
+                with stage("features"):
+                    X = self.build_feature_matrix([keys[i] for i in rows])
+                with stage("predict"):
+                    if batcher is not None and len(missing) == 1:
+                        scored = [batcher.submit(X[0], scorer)]
+                    else:
+                        scored = scorer(X)
+                for i, row in zip(rows, scored):
+                    # Copy so a cached row doesn't pin the whole batch matrix in memory
+                    row = row.copy()
+                    row.flags.writeable = False
+                    routes[i][1].put(keys[i], row)
+                    confidences[i] = row
+        return np.stack(confidences)
+
+    def rank_predictions(self, confidences, has_symptoms):
+        """The /predict decision for every row of a (cases x classes) probability matrix, as arrays.
+
+        Returns top-4 class indices and confidences (%), the reported class
+        index (-1 for Unknown Infection) and confidence, and per-row flags for
+        the pattern-match, unknown-infection and low-confidence branches.
+        """
+        depth = min(4, confidences.shape[1])
+
+        # Top 4 per row: the top 3 are reported, ranks 2-4 feed the HEALTHY fallback
+        top_indices = np.argpartition(-confidences, depth - 1, axis=1)[:, :depth]
+        top_conf = np.take_along_axis(confidences, top_indices, axis=1)
+        order = np.argsort(-top_conf, axis=1)
+        top_indices = np.take_along_axis(top_indices, order, axis=1)
+        top_conf = np.take_along_axis(top_conf, order, axis=1) * 100
+        is_healthy = self.healthy_classes[top_indices]
+
+        # Logic: Find the first NON-HEALTHY prediction if symptoms are present
+        needs_alternative = np.asarray(has_symptoms, dtype=bool) & is_healthy[:, 0]
+        alt_ok = ~is_healthy[:, 1:] & (top_conf[:, 1:] > 10.0)
+        has_alt = alt_ok.any(axis=1)
+        alt_rank = np.argmax(alt_ok, axis=1) + 1 if depth > 1 else np.zeros(len(top_indices), dtype=int)
+
+        pattern_match = needs_alternative & has_alt
+        unknown = needs_alternative & ~has_alt
+        rank = np.where(pattern_match, alt_rank, 0)
+        rows = np.arange(len(top_indices))
+        prediction = np.where(unknown, -1, top_indices[rows, rank])
+        # Non-zero to show it exists but is low
+        confidence = np.where(unknown, 0.1, top_conf[rows, rank])
+        return {
+            'top_indices': top_indices,
+            'top_conf': top_conf,
+            'prediction': prediction,
+            'confidence': confidence,
+            'pattern_match': pattern_match,
+            'unknown_infection': unknown,
+            # If it's really low, don't say 0%, say the value but warn
+            'low_confidence': (confidence < 30.0) & ~unknown,
+        }
+
+    def summarize_predictions(self, confidences, cases):
+        """Turn a (cases x classes) probability matrix into /predict response bodies."""
+        ranked = self.rank_predictions(confidences, [bool(case['symptoms']) for case in cases])
+        depth = ranked['top_indices'].shape[1]
+        top_names = self.class_names[ranked['top_indices']]
+        top_conf = ranked['top_conf']
+
+        results = []
+        for row, case in enumerate(cases):
+            if ranked['unknown_infection'][row]:
+                final_prediction = "Unknown Infection"
+                note = " (Vitals check out, but symptoms persist)"
+            else:
+                final_prediction = self.class_names[ranked['prediction'][row]]
+                note = " (Pattern Match)" if ranked['pattern_match'][row] else ""
+            final_conf = ranked['confidence'][row]
+
+            # Normalize Confidence Display
+            if ranked['low_confidence'][row]:
+                note += " [Low Confidence]"
+
+            # Generate "Why" (Reasoning)
+            reasoning = []
+            if case['symptoms']:
+                reasoning.append(f"Symptoms: {', '.join(case['symptoms'])}")
+            else:
+                reasoning.append("No active symptoms")
+
+            if case['temp'] > 40.0:
+                reasoning.append("High Fever")
+
+            results.append({
+                'status': 'success',
+                'prediction': str(final_prediction).upper(),
+                'confidence': f"{final_conf:.1f}%",
+                'reasoning': " | ".join(reasoning) + note,
+                'top_predictions': [
+                    {"disease": top_names[row, i], "confidence": f"{top_conf[row, i]:.1f}%"}
+                    for i in range(min(3, depth))
+                ],
+            })
+        return results
+
+    def smoke_test(self):
+        """Score the parity probe with every tier and sanity-check the output; also warms the engines."""
+        probe = parity_probe(self.features)
+        for tier in self.tiers.values():
+            confidences = np.asarray(tier.scorer(probe))
+            if confidences.shape != (len(probe), len(self.class_names)):
+                raise ValueError(f"Tier '{tier.name}' smoke prediction returned shape {confidences.shape}")
+            if not np.all(np.isfinite(confidences)) or not np.allclose(confidences.sum(axis=1), 1.0, atol=1e-3):
+                raise ValueError(f"Tier '{tier.name}' smoke prediction returned invalid probabilities")
+
+
+def read_manifest(bundle_dir):
+    """Manifest of the fast-start bundle, or None when only the legacy pickles exist."""
+    path = os.path.join(bundle_dir, 'manifest.json')
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as handle:
+        manifest = json.load(handle)
+    if manifest.get('format_version') != BUNDLE_FORMAT_VERSION:
+        raise ValueError(f"Unsupported model bundle format: {manifest.get('format_version')}")
+    return manifest
+
+
+def load_booster(model_path):
+    # Deferred: importing xgboost also imports scipy, pandas and scikit-learn (with joblib) whenever they are
+    # installed, so only the native engine keeps a process free of them
+    import xgboost as xgb
+    loaded = xgb.Booster()
+    loaded.load_model(model_path)
+    return loaded
+
+
+def load_legacy_artifacts():
+    """(booster, features, classes, metrics) from the joblib pickles."""
+    import joblib  # unpickling the XGBClassifier/LabelEncoder also imports scikit-learn
+    model = joblib.load('animal_model.pkl')
+    le = joblib.load('label_encoder.pkl')
+    features = joblib.load('model_features.pkl')
+    try:
+        with open('training_metrics.json', 'r', encoding='utf-8') as handle:
+            metrics = json.load(handle)
+    except Exception:
+        metrics = None
+    return model.get_booster(), list(features), le.classes_, metrics
+
+
+class NativeScorer:
+    """Native engine scorer: the flattened forest for up to `max_rows` rows, XGBoost for larger batches.
+
+    The level-by-level NumPy walk wins for a row or two but is several times slower than XGBoost's predictor on
+    batches of hundreds, so those go to the booster, loaded on first use (the forest serves them if xgboost is
+    not installed).
+    """
+
+    def __init__(self, forest, load_batch_booster, max_rows=NATIVE_BATCH_ROWS):
+        self.forest = forest
+        self.max_rows = max_rows
+        self._load_batch_booster = load_batch_booster
+        self._batch_scorer = None
+        self._lock = threading.Lock()
+
+    def batch_scorer(self):
+        if self._batch_scorer is None:
+            with self._lock:
+                if self._batch_scorer is None:
+                    try:
+                        self._batch_scorer = self._load_batch_booster().inplace_predict
+                    except ImportError as e:
+                        print(f"[!] XGBoost unavailable, large batches stay on the native engine: {e}")
+                        self._batch_scorer = self.forest.predict
+        return self._batch_scorer
+
+    def __call__(self, X):
+        if self.max_rows and len(X) > self.max_rows:
+            return self.batch_scorer()(X)
+        return self.forest.predict(X)
+
+
+def select_engine(engine, features, manifest, bundle_dir, booster=None, nthread=None,
+                  native_batch_rows=NATIVE_BATCH_ROWS):
+    """(engine name, scoring function); the native engine must match the booster on a probe set first.
+
+    `manifest` is the bundle manifest or one of its tier entries (anything with the model/forest/parity file names).
+    `nthread` caps XGBoost's prediction threads (default: all cores). With the native engine, batches of more than
+    `native_batch_rows` rows are scored by XGBoost (see NativeScorer).
+    """
+    def load_xgboost():
+        loaded = booster if booster is not None else load_booster(os.path.join(bundle_dir, manifest['model_file']))
+        if nthread:
+            loaded.set_param({'nthread': int(nthread)})
+        return loaded
+
+    if engine == 'native':
+        try:
+            probe = parity_probe(features)
+            if booster is not None:
+                forest = FlatForest.from_booster(booster)
+                diff = check_parity(booster, forest, probe)
+            else:
+                # Bundles ship pre-flattened trees and the booster's answers for the probe
+                forest_file = manifest.get('forest_file')
+                if forest_file and os.path.exists(os.path.join(bundle_dir, forest_file)):
+                    forest = FlatForest.load(os.path.join(bundle_dir, forest_file))
+                else:
+                    forest = FlatForest.from_file(os.path.join(bundle_dir, manifest['model_file']))
+                expected = np.load(os.path.join(bundle_dir, manifest['parity_file']))
+                diff = compare_probabilities(expected, forest.predict(probe))
+            print(f"[+] Native tree engine active ({forest.num_trees} trees, parity {diff:.1e})")
+            return 'native', NativeScorer(forest, load_xgboost, native_batch_rows)
+        except (ValueError, AssertionError, KeyError, OSError) as e:
+            print(f"[!] Native engine unavailable, falling back to XGBoost: {e}")
+    elif engine != 'xgboost':
+        print(f"[!] Unknown inference engine '{engine}', using XGBoost")
+    return 'xgboost', load_xgboost().inplace_predict
+
+
+class ShardLoader:
+    """Loads shard models on demand with the bundle's engine choice."""
+
+    def __init__(self, engine, features, bundle_dir, nthread=None, native_batch_rows=NATIVE_BATCH_ROWS):
+        self.engine = engine
+        self.features = features
+        self.bundle_dir = bundle_dir
+        self.nthread = nthread
+        self.native_batch_rows = native_batch_rows
+
+    def __call__(self, entry):
+        return select_engine(self.engine, self.features, entry, self.bundle_dir, nthread=self.nthread,
+                             native_batch_rows=self.native_batch_rows)
+
+
+def load_model_bundle(bundle_dir=DEFAULT_BUNDLE_DIR, engine='xgboost', cache_size=0, shards=True, nthread=None,
+                      native_batch_rows=NATIVE_BATCH_ROWS):
+    """Load the artifacts on disk into a fresh ModelBundle (bundle first, legacy pickles as fallback).
+
+    Species shards in the manifest are registered but not loaded; `shards=False` ignores them.
+    """
+    started = time.perf_counter()
+    manifest = read_manifest(bundle_dir)
+    tiers = {}
+    species_shards = {}
+    if manifest is not None:
+        features = manifest['features']
+        classes = manifest['classes']
+        metrics = manifest.get('metrics')
+        default_tier = manifest.get('default_tier', DEFAULT_TIER)
+        # Bundles written before tiers existed describe a single model at the top level
+        for name, entry in (manifest.get('tiers') or {default_tier: manifest}).items():
+            tier_engine, scorer = select_engine(engine, features, entry, bundle_dir, nthread=nthread,
+                                                native_batch_rows=native_batch_rows)
+            tiers[name] = ModelTier(name, tier_engine, scorer, version=entry.get('version'), info=entry,
+                                    cache_size=cache_size)
+        if shards and manifest.get('shards'):
+            loader = ShardLoader(engine, features, bundle_dir, nthread, native_batch_rows)
+            class_positions = {name: i for i, name in enumerate(classes)}
+            for species, entry in manifest['shards'].items():
+                positions = [class_positions[name] for name in entry['classes']]
+                species_shards[species] = ModelShard(species, entry, positions, len(classes), loader, cache_size)
+    else:
+        booster, features, classes, metrics = load_legacy_artifacts()
+        default_tier = DEFAULT_TIER
+        tier_engine, scorer = select_engine(engine, features, None, bundle_dir, booster, nthread, native_batch_rows)
+        tiers[default_tier] = ModelTier(default_tier, tier_engine, scorer, info={'metrics': metrics},
+                                        cache_size=cache_size)
+
+    return ModelBundle(
+        features,
+        classes,
+        tiers,
+        default_tier=default_tier,
+        metrics=metrics,
+        version=manifest.get('version') if manifest else None,
+        load_info={
+            'format': 'bundle' if manifest else 'pickle',
+            'version': manifest.get('version') if manifest else None,
+            'tiers': list(tiers),
+            'shards': list(species_shards),
+            'load_seconds': round(time.perf_counter() - started, 4),
+            'heavy_modules': [name for name in HEAVY_MODULES if name in sys.modules],
+        },
+        shards=species_shards,
+    )
@@ -0,0 +1,271 @@
+"""Request metrics in Prometheus text format, aggregated across server processes.
+
+Counters and histograms live in the process that records them. With a
+metrics directory configured, every process writes a JSON snapshot of its own
+series to `<dir>/<server id>/worker-<pid>.json` (about once a second and on
+every scrape), and `/metrics` sums the snapshots of all workers of the same
+server. The server id is the gunicorn master's pid, exported to the workers
+by gunicorn.conf.py through `start_server_group()`, or the process's own pid
+when it serves alone. Snapshots of exited workers are kept so counters never
+go backwards; a group is cleared when its server starts and removed once that
+server is no longer running.
+"""
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+# Request and stage latency buckets in seconds
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5,
+                   5.0, 10.0)
+FLUSH_INTERVAL = 1.0
+DEFAULT_DIR = os.path.join(tempfile.gettempdir(), "a_vital_metrics")
+# Set by start_server_group() and inherited by forked workers
+GROUP_ENV = "AVITAL_METRICS_GROUP"
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._series = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def snapshot(self):
+        with self._lock:
+            series = [[list(key), value if self.kind == "counter" else list(value)]
+                      for key, value in self._series.items()]
+        return {"type": self.kind, "help": self.documentation, "labels": list(self.labelnames), "series": series}
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            # Per-bucket (not cumulative) counts, then sum and count
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            index = 0
+            while index < len(self.buckets) and value > self.buckets[index]:
+                index += 1
+            series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def snapshot(self):
+        return dict(super().snapshot(), buckets=list(self.buckets))
+
+
+class StageTimer:
+    """Accumulates named stage durations for one request: `with timer.stage("parse"): ...`."""
+
+    def __init__(self):
+        self.stages = {}
+        self.started = time.perf_counter()
+
+    def stage(self, name):
+        return _Stage(self, name)
+
+    def add(self, name, seconds):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+
+class _Stage:
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.timer.add(self.name, time.perf_counter() - self.started)
+        return False
+
+
+REGISTRY = []
+
+
+def snapshot():
+    return {metric.name: metric.snapshot() for metric in REGISTRY}
+
+
+def merge(snapshots):
+    """Sum the series of several snapshots (counters add, histogram buckets add)."""
+    merged = {}
+    for snap in snapshots:
+        for name, metric in snap.items():
+            target = merged.setdefault(name, dict(metric, series={}))
+            if target.get("buckets") != metric.get("buckets"):
+                continue
+            for labels, value in metric["series"]:
+                key = tuple(labels)
+                if metric["type"] == "counter":
+                    target["series"][key] = target["series"].get(key, 0) + value
+                else:
+                    current = target["series"].get(key)
+                    target["series"][key] = value if current is None else [a + b for a, b in zip(current, value)]
+    return merged
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in list(zip(names, values)) + list(extra)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render(merged):
+    """Prometheus text exposition format (version 0.0.4)."""
+    lines = []
+    for name, metric in sorted(merged.items()):
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['type']}")
+        for labels, value in sorted(metric["series"].items()):
+            if metric["type"] == "counter":
+                lines.append(f"{name}{_labels(metric['labels'], labels)} {_number(value)}")
+                continue
+            cumulative = 0
+            for bound, count in zip(list(metric["buckets"]) + [float("inf")], value[:-2]):
+                cumulative += count
+                le = _number(float(bound))
+                lines.append(f"{name}_bucket{_labels(metric['labels'], labels, [('le', le)])} {cumulative}")
+            lines.append(f"{name}_sum{_labels(metric['labels'], labels)} {_number(float(value[-2]))}")
+            lines.append(f"{name}_count{_labels(metric['labels'], labels)} {value[-1]}")
+    return "\n".join(lines) + "\n"
+
+
+def clear_group(directory, group):
+    shutil.rmtree(os.path.join(directory, str(group)), ignore_errors=True)
+
+
+def start_server_group(directory):
+    """Call once in the server's main process before workers fork: exports its id and clears stale snapshots."""
+    group = str(os.getpid())
+    os.environ[GROUP_ENV] = group
+    clear_group(directory, group)
+    return group
+
+
+class MultiProcessCollector:
+    """Writes this process's snapshot to a shared directory and merges every worker's for a scrape."""
+
+    def __init__(self, directory, interval=FLUSH_INTERVAL):
+        self.root = directory
+        self.interval = interval
+        self._pid = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+    @property
+    def group(self):
+        return os.environ.get(GROUP_ENV) or str(os.getpid())
+
+    @property
+    def group_dir(self):
+        return os.path.join(self.root, self.group)
+
+    def _path(self):
+        return os.path.join(self.group_dir, f"worker-{os.getpid()}.json")
+
+    def flush(self):
+        path = self._path()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        staging = f"{path}.tmp"
+        # The flusher thread and a scrape may flush at the same time
+        with self._flush_lock:
+            with open(staging, "w", encoding="utf-8") as handle:
+                json.dump(snapshot(), handle)
+            os.replace(staging, path)
+
+    def ensure_started(self):
+        """Start this process's flusher thread (once per pid, so forked workers get their own)."""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            if GROUP_ENV not in os.environ:
+                # Serving alone: a previous process with the same pid must not leak into this one
+                clear_group(self.root, self.group)
+            self._remove_dead_groups()
+            threading.Thread(target=self._run, name="metrics-flush", daemon=True).start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.flush()
+            except OSError as e:
+                print(f"[!] Metrics flush failed: {e}")
+
+    def _remove_dead_groups(self):
+        try:
+            groups = os.listdir(self.root)
+        except OSError:
+            return
+        for group in groups:
+            if not group.isdigit() or group == self.group:
+                continue
+            try:
+                os.kill(int(group), 0)
+            except ProcessLookupError:
+                clear_group(self.root, group)
+            except (PermissionError, OSError):
+                pass
+
+    def collect(self):
+        self.flush()
+        snapshots = []
+        for name in os.listdir(self.group_dir):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.group_dir, name), "r", encoding="utf-8") as handle:
+                    snapshots.append(json.load(handle))
+            except (OSError, ValueError):
+                continue
+        return merge(snapshots)
+
+
+def collect(collector=None):
+    """Merged series of every worker (or just this process without a collector)."""
+    return collector.collect() if collector is not None else merge([snapshot()])
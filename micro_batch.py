@@ -0,0 +1,135 @@
+"""In-process micro-batcher: coalesces concurrent single-row predictions into one model call.
+
+Request threads hand a feature row to `MicroBatcher.submit()` and block until
+their confidence row comes back. A single dispatcher thread drains the queue,
+waits up to `max_wait_ms` for more rows only when other requests are already
+queued, and scores up to `max_batch_size` rows per call. An idle server
+therefore pays only a thread handoff, never the wait. Each row carries the
+scoring function of the model bundle its request started on, so a hot reload
+never scores an in-flight row with the wrong model.
+"""
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+# Batch-size histogram buckets (upper bounds, inclusive)
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+
+class MicroBatcher:
+    def __init__(self, max_batch_size=32, max_wait_ms=2.0):
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self._queue = queue.Queue()
+        # Guards worker start-up and the stats, which submitters and the dispatcher both update
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._stats = {
+            'batches': 0,
+            'rows': 0,
+            'errors': 0,
+            'max_queue_depth': 0,
+            'queue_wait_seconds': 0.0,
+        }
+        self._histogram = [0] * (len(BATCH_BUCKETS) + 1)
+
+    def submit(self, row, score_fn):
+        """Score one float32 feature row with `score_fn`; returns its confidence row."""
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((row, future, time.perf_counter(), score_fn))
+        depth = self._queue.qsize()
+        with self._lock:
+            self._stats['max_queue_depth'] = max(self._stats['max_queue_depth'], depth)
+        return future.result()
+
+    def _ensure_worker(self):
+        # Started lazily (and restarted after fork) so pre-forking servers get one thread per worker
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._queue = queue.Queue()
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name='micro-batcher', daemon=True)
+                self._thread.start()
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+                continue
+            except queue.Empty:
+                pass
+            # A lone request is dispatched immediately; only wait when traffic is concurrent
+            remaining = deadline - time.perf_counter()
+            if len(batch) == 1 or remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            started = time.perf_counter()
+            # Rows queued across a model reload are scored by their own model
+            groups = {}
+            for item in batch:
+                groups.setdefault(item[3], []).append(item)
+            for score_fn, items in groups.items():
+                self._dispatch(score_fn, items, started)
+
+    def _dispatch(self, score_fn, batch, started):
+        futures = [item[1] for item in batch]
+        try:
+            confidences = score_fn(np.stack([item[0] for item in batch]))
+        except Exception as e:
+            with self._lock:
+                self._stats['errors'] += 1
+            for future in futures:
+                future.set_exception(e)
+            return
+        self._record(batch, started)
+        for future, conf in zip(futures, confidences):
+            future.set_result(conf)
+
+    def _record(self, batch, started):
+        size = len(batch)
+        wait = sum(started - item[2] for item in batch)
+        bucket = next((i for i, bound in enumerate(BATCH_BUCKETS) if size <= bound), len(BATCH_BUCKETS))
+        with self._lock:
+            self._stats['batches'] += 1
+            self._stats['rows'] += size
+            self._stats['queue_wait_seconds'] += wait
+            self._histogram[bucket] += 1
+
+    def stats(self):
+        # One consistent snapshot: counters and histogram from the same moment
+        with self._lock:
+            counters = dict(self._stats)
+            histogram = list(self._histogram)
+        batches = counters['batches']
+        rows = counters['rows']
+        labels = [str(bound) for bound in BATCH_BUCKETS] + [f'>{BATCH_BUCKETS[-1]}']
+        return {
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait * 1000.0,
+            'queue_depth': self._queue.qsize(),
+            'max_queue_depth': counters['max_queue_depth'],
+            'batches': batches,
+            'rows': rows,
+            'errors': counters['errors'],
+            'avg_batch_size': round(rows / batches, 3) if batches else 0.0,
+            'avg_queue_wait_ms': round(counters['queue_wait_seconds'] / rows * 1000.0, 4) if rows else 0.0,
+            'batch_size_histogram': dict(zip(labels, histogram)),
+        }
@@ -0,0 +1,257 @@
+"""Opt-in sampling profiler for selected requests, with collapsed-stack output.
+
+Requests picked at `sample_rate` are sampled: while at least one of them is
+in flight, a sampler thread records the stack of each such request thread
+every `interval_ms` (via sys._current_frames). Stacks are aggregated in the
+collapsed format used by flamegraph.pl and speedscope ("a;b;c count"), and
+every `flush_seconds` the new samples are written to
+`<output_dir>/<pid>-<timestamp>.collapsed`.
+
+A single request is usually shorter than a few sampling intervals, so a
+request sent with `X-Profile: 1` and a valid admin token is traced instead:
+every call and return in its thread is timed (sys.setprofile) and the
+request's own `request-...collapsed` file is weighted in microseconds.
+
+When profiling is off the middleware is not installed at all; when it is on
+but a request is not selected, the cost is one random draw.
+"""
+import hmac
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+
+PROFILE_HEADER = "HTTP_X_PROFILE"
+TOKEN_HEADER = "HTTP_X_ADMIN_TOKEN"
+
+
+def _frame_name(code):
+    module = os.path.splitext(os.path.basename(code.co_filename))[0]
+    return f"{module}:{code.co_name}"
+
+
+def collapse(frame):
+    """Root-first `module:function` frames joined with ';'."""
+    names = []
+    while frame is not None:
+        names.append(_frame_name(frame.f_code))
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+def write_collapsed(stacks, path):
+    staging = f"{path}.tmp"
+    with open(staging, "w", encoding="utf-8") as handle:
+        for stack, count in stacks.most_common():
+            handle.write(f"{stack} {count}\n")
+    os.replace(staging, path)
+
+
+class RequestTracer:
+    """Time-weighted stacks (microseconds) for the calling thread, from profile events."""
+
+    def __init__(self):
+        self.seconds = Counter()
+        self._last = time.perf_counter()
+
+    def __call__(self, frame, event, arg):
+        now = time.perf_counter()
+        # The time since the previous event belongs to whatever was running until now
+        if event == "call":
+            running = collapse(frame.f_back)
+        elif event == "c_return" or event == "c_exception":
+            running = f"{collapse(frame)};{getattr(arg, '__qualname__', 'builtin')}"
+        else:
+            running = collapse(frame)
+        if running:
+            self.seconds[running] += now - self._last
+        self._last = time.perf_counter()
+
+    def __enter__(self):
+        self._last = time.perf_counter()
+        sys.setprofile(self)
+        return self
+
+    def __exit__(self, *exc):
+        sys.setprofile(None)
+        return False
+
+    def stacks(self):
+        return Counter({stack: round(seconds * 1e6) for stack, seconds in self.seconds.items()
+                        if seconds >= 0.5e-6})
+
+
+class SamplingProfiler:
+    def __init__(self, output_dir="profiles", sample_rate=0.0, interval_ms=1.0, flush_seconds=60.0):
+        self.output_dir = output_dir
+        self.sample_rate = max(0.0, min(1.0, float(sample_rate)))
+        self.interval = max(0.0001, float(interval_ms) / 1000.0)
+        self.flush_seconds = float(flush_seconds)
+        self._active = {}
+        self._window = Counter()
+        self._total = Counter()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._pid = None
+        self.requests = 0
+        self.samples = 0
+        self.files_written = 0
+        self.traced = 0
+
+    def selected(self):
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def _ensure_threads(self):
+        # Started lazily per pid so each forked worker gets its own sampler
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._active.clear()
+            threading.Thread(target=self._sample_loop, name="profile-sampler", daemon=True).start()
+            threading.Thread(target=self._flush_loop, name="profile-flush", daemon=True).start()
+
+    def begin(self):
+        self._ensure_threads()
+        with self._lock:
+            self._active[threading.get_ident()] = Counter()
+            self._wake.set()
+
+    def end(self):
+        """Stop sampling this thread; returns the request's own stacks."""
+        with self._lock:
+            stacks = self._active.pop(threading.get_ident(), Counter())
+            if not self._active:
+                self._wake.clear()
+            self._window.update(stacks)
+            self._total.update(stacks)
+            self.requests += 1
+            self.samples += sum(stacks.values())
+        return stacks
+
+    def _sample_loop(self):
+        me = threading.get_ident()
+        while True:
+            # Sleeps until a profiled request starts; no sampling cost otherwise
+            self._wake.wait()
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            with self._lock:
+                for ident, stacks in self._active.items():
+                    frame = frames.get(ident)
+                    if frame is not None and ident != me:
+                        stacks[collapse(frame)] += 1
+            del frames
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_seconds)
+            self.flush()
+
+    def flush(self):
+        """Write the samples collected since the last flush; returns the file path or None."""
+        with self._lock:
+            window, self._window = self._window, Counter()
+        if not window:
+            return None
+        stamp = time.strftime("%Y%m%dT%H%M%S", time.gmtime())
+        return self._write(window, f"{os.getpid()}-{stamp}.collapsed")
+
+    def write_request(self, stacks):
+        stamp = time.strftime("%Y%m%dT%H%M%S", time.gmtime())
+        self.traced += 1
+        return self._write(stacks, f"request-{os.getpid()}-{stamp}-{self.traced}.collapsed")
+
+    def _write(self, stacks, name):
+        try:
+            os.makedirs(self.output_dir, exist_ok=True)
+            path = os.path.join(self.output_dir, name)
+            write_collapsed(stacks, path)
+        except OSError as e:
+            print(f"[!] Profile write failed: {e}")
+            return None
+        self.files_written += 1
+        return path
+
+    def collapsed(self):
+        with self._lock:
+            return Counter(self._total)
+
+    def reset(self):
+        with self._lock:
+            self._total.clear()
+            self._window.clear()
+            self.requests = 0
+            self.samples = 0
+
+    def top_functions(self, limit=20):
+        """Hottest functions by self samples (leaf frame) and total samples (anywhere on the stack)."""
+        stacks = self.collapsed()
+        own, total = Counter(), Counter()
+        for stack, count in stacks.items():
+            frames = stack.split(";")
+            own[frames[-1]] += count
+            for name in set(frames):
+                total[name] += count
+        samples = sum(stacks.values()) or 1
+        return [
+            {
+                "function": name,
+                "self_samples": own[name],
+                "self_pct": round(own[name] * 100.0 / samples, 2),
+                "total_samples": total[name],
+                "total_pct": round(total[name] * 100.0 / samples, 2),
+            }
+            for name, _ in own.most_common(limit)
+        ]
+
+    def stats(self):
+        return {
+            "sample_rate": self.sample_rate,
+            "interval_ms": self.interval * 1000.0,
+            "output_dir": self.output_dir,
+            "requests_profiled": self.requests,
+            "samples": self.samples,
+            "requests_traced": self.traced,
+            "files_written": self.files_written,
+        }
+
+
+class ProfilingMiddleware:
+    """WSGI wrapper so profiles include Flask's own request handling, not just the view."""
+
+    def __init__(self, app, profiler, admin_token=None, path_prefix="/predict"):
+        self.app = app
+        self.profiler = profiler
+        self.admin_token = admin_token
+        self.path_prefix = path_prefix
+
+    def _requested(self, environ):
+        if not self.admin_token or environ.get(PROFILE_HEADER) != "1":
+            return False
+        return hmac.compare_digest(environ.get(TOKEN_HEADER, ""), self.admin_token)
+
+    def __call__(self, environ, start_response):
+        if not environ.get("PATH_INFO", "").startswith(self.path_prefix):
+            return self.app(environ, start_response)
+        if self._requested(environ):
+            with RequestTracer() as tracer:
+                # Drain the body inside the profiled region
+                body = list(self.app(environ, start_response))
+            stacks = tracer.stacks()
+            path = self.profiler.write_request(stacks)
+            print(f"[*] Traced {environ.get('PATH_INFO')}: {sum(stacks.values())} us -> {path}")
+            return body
+        if not self.profiler.selected():
+            return self.app(environ, start_response)
+
+        self.profiler.begin()
+        try:
+            body = list(self.app(environ, start_response))
+        finally:
+            self.profiler.end()
+        return body
@@ -1,12 +1,19 @@
-import requests
+import argparse
+import itertools
 import json
-import time
-import numpy as np
+import math
+import os
+import queue
 import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
 
-print("=========================================")
-print("   A-VITAL SYSTEM DIAGNOSTIC (STRESS TEST)    ")
-print("=========================================")
+import requests
+import requests.adapters
 
 BASE_URL = "http://localhost:10000"
 
@@ -149,51 +156,441 @@ def generate_case(target_name):
         "symptoms": symptoms
     }, target_name
 
-# 1. Check Server
-try:
-    print(f"[*] Ping {BASE_URL}/status...")
-    requests.get(f"{BASE_URL}/status")
-except:
-    print(f"[X] Server at {BASE_URL} is offline. Run 'start_app.bat' or 'python app.py' first.")
-    exit()
-
-# 2. Run Tests
-print("\n[2/3] Running 50 Validation Scenarios...")
-success_count = 0
-matches = 0
-
-start_time = time.time()
-
-for i in range(50):
-    # Pick a random target
-    target_disease = random.choice(TARGETS)
-    payload, expected = generate_case(target_disease)
-    
+def check_server(base_url):
     try:
-        r = requests.post(f"{BASE_URL}/predict", json=payload)
-        
-        if r.status_code == 200:
-            data = r.json()
-            pred = data['prediction']
-            conf = data['confidence']
-            
-            # Loose matching (Case insensitive, partial)
-            is_match = expected.upper() in pred or pred in expected.upper()
-            if expected == 'Healthy' and 'HEALTHY' in pred: is_match = True
-            
-            match_icon = "[OK]" if is_match else "[MISMATCH]"
-            if is_match: matches += 1
-            
-            print(f"Test #{i+1:02}: Expect={expected[:20]:<20} -> Got={pred[:20]:<20} ({conf}) {match_icon}")
-            success_count += 1
+        print(f"[*] Ping {base_url}/status...")
+        requests.get(f"{base_url}/status", timeout=10)
+        return True
+    except Exception:
+        print(f"[X] Server at {base_url} is offline. Run 'start_app.bat' or 'python app.py' first.")
+        return False
+
+def run_validation(base_url, count=50):
+    """The original functional check: `count` random scenarios, one request at a time."""
+    print(f"\n[2/3] Running {count} Validation Scenarios...")
+    success_count = 0
+    matches = 0
+
+    start_time = time.time()
+
+    for i in range(count):
+        # Pick a random target
+        target_disease = random.choice(TARGETS)
+        payload, expected = generate_case(target_disease)
+
+        try:
+            r = requests.post(f"{base_url}/predict", json=payload)
+
+            if r.status_code == 200:
+                data = r.json()
+                pred = data['prediction']
+                conf = data['confidence']
+
+                # Loose matching (Case insensitive, partial)
+                is_match = expected.upper() in pred or pred in expected.upper()
+                if expected == 'Healthy' and 'HEALTHY' in pred: is_match = True
+
+                match_icon = "[OK]" if is_match else "[MISMATCH]"
+                if is_match: matches += 1
+
+                print(f"Test #{i+1:02}: Expect={expected[:20]:<20} -> Got={pred[:20]:<20} ({conf}) {match_icon}")
+                success_count += 1
+            else:
+                print(f"Test #{i+1:02}: SERVER ERROR {r.status_code} - {r.text}")
+
+        except Exception as e:
+            print(f"Test #{i+1:02}: REQUEST FAILED {e}")
+
+    print("-" * 40)
+    print(f"API Connectivity: {success_count}/{count}")
+    print(f"Functional Pass Rate: {matches}/{count}")
+    print(f"Duration: {time.time() - start_time:.2f}s")
+    print("=========================================")
+
+# --- LOAD TEST ---
+
+class LatencyHistogram:
+    """HDR-style log-linear histogram of latencies in microseconds.
+
+    Values below 2**(SUB_BUCKET_BITS + 1) us are exact; above that each power of
+    two is split into 2**SUB_BUCKET_BITS buckets, so any reported value is
+    within 1/128 (0.8%) of the recorded one regardless of magnitude.
+    """
+    SUB_BUCKET_BITS = 7
+
+    def __init__(self):
+        self.counts = {}
+        self.total = 0
+        self.sum = 0
+        self.min = None
+        self.max = 0
+
+    def _bucket(self, value):
+        shift = max(0, value.bit_length() - self.SUB_BUCKET_BITS - 1)
+        low = (value >> shift) << shift
+        return low, low + (1 << shift) - 1
+
+    def record(self, seconds):
+        value = max(0, int(seconds * 1e6))
+        low, _ = self._bucket(value)
+        self.counts[low] = self.counts.get(low, 0) + 1
+        self.total += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = max(self.max, value)
+
+    def merge(self, other):
+        for low, count in other.counts.items():
+            self.counts[low] = self.counts.get(low, 0) + count
+        self.total += other.total
+        self.sum += other.sum
+        if other.min is not None:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def percentile(self, pct):
+        """Highest value equivalent to the bucket holding the pct-th percentile (like HdrHistogram)."""
+        if not self.total:
+            return None
+        target = max(1, math.ceil(self.total * pct / 100.0))
+        seen = 0
+        for low in sorted(self.counts):
+            seen += self.counts[low]
+            if seen >= target:
+                return min(self._bucket(low)[1], self.max)
+        return self.max
+
+    def to_dict(self):
+        # Percentile ticks halve the remaining distance to 100% each step, as in HdrHistogram's output
+        ticks, pct = [], 0.0
+        while pct < 99.9999:
+            ticks.append(round(pct, 6))
+            pct += (100.0 - pct) / 2
+        ticks.append(100.0)
+        return {
+            'unit': 'us',
+            'sub_bucket_bits': self.SUB_BUCKET_BITS,
+            'total': self.total,
+            'min': self.min,
+            'max': self.max,
+            'mean': round(self.sum / self.total, 1) if self.total else None,
+            'percentiles': [[tick, self.percentile(tick)] for tick in ticks],
+            'buckets': [[low, self.counts[low]] for low in sorted(self.counts)],
+        }
+
+def build_payloads(count, seed):
+    """A fixed pool of case payloads from generate_case(); the same seed gives the same pool."""
+    state = random.getstate()
+    random.seed(seed)
+    try:
+        return [generate_case(random.choice(TARGETS))[0] for _ in range(count)]
+    finally:
+        random.setstate(state)
+
+class LoadWorker:
+    """Per-thread state: a keep-alive session (one pooled connection) and private result counters."""
+
+    def __init__(self, base_url, payloads, batch_size, timeout):
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=1)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.url = f"{base_url}/predict/batch" if batch_size > 1 else f"{base_url}/predict"
+        self.payloads = payloads
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.latency = LatencyHistogram()
+        self.service = LatencyHistogram()
+        self.ok = 0
+        self.errors = {}
+
+    def body(self, index):
+        if self.batch_size > 1:
+            start = index * self.batch_size
+            return {'cases': [self.payloads[(start + i) % len(self.payloads)] for i in range(self.batch_size)]}
+        return self.payloads[index % len(self.payloads)]
+
+    def send(self, index, intended=None):
+        """One request; latency counts from `intended` (the scheduled start in open loop) when given."""
+        started = time.perf_counter()
+        try:
+            r = self.session.post(self.url, json=self.body(index), timeout=self.timeout)
+            r.content  # read the whole body before stopping the clock
+            kind = None if r.status_code == 200 else f"http_{r.status_code}"
+        except requests.RequestException as e:
+            kind = type(e).__name__
+        finished = time.perf_counter()
+        if kind is None:
+            self.ok += 1
+            self.latency.record(finished - (intended if intended is not None else started))
+            self.service.record(finished - started)
         else:
-            print(f"Test #{i+1:02}: SERVER ERROR {r.status_code} - {r.text}")
-            
-    except Exception as e:
-        print(f"Test #{i+1:02}: REQUEST FAILED {e}")
-
-print("-" * 40)
-print(f"API Connectivity: {success_count}/50")
-print(f"Functional Pass Rate: {matches}/50")
-print(f"Duration: {time.time() - start_time:.2f}s")
-print("=========================================")
+            self.errors[kind] = self.errors.get(kind, 0) + 1
+
+def run_closed_loop(workers, duration, max_requests):
+    """Each worker sends its next request as soon as the previous one answers."""
+    counter = itertools.count()
+    deadline = time.perf_counter() + duration
+
+    def loop(worker):
+        while time.perf_counter() < deadline:
+            index = next(counter)
+            if max_requests and index >= max_requests:
+                return
+            worker.send(index)
+
+    threads = [threading.Thread(target=loop, args=(w,), daemon=True) for w in workers]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return {}
+
+def run_open_loop(workers, duration, max_requests, rate, arrival, seed):
+    """Requests arrive on a fixed schedule whether or not earlier ones have answered.
+
+    Latency is measured from each request's scheduled start, so time spent
+    queued behind a slow server counts (no coordinated omission).
+    """
+    rng = random.Random(seed)
+    jobs = queue.Queue()
+    lag = [0.0]
+
+    def consume(worker):
+        while True:
+            job = jobs.get()
+            if job is None:
+                return
+            index, intended = job
+            lag[0] = max(lag[0], time.perf_counter() - intended)
+            worker.send(index, intended)
+
+    threads = [threading.Thread(target=consume, args=(w,), daemon=True) for w in workers]
+    for t in threads:
+        t.start()
+
+    start = time.perf_counter()
+    intended = start
+    index = 0
+    while intended < start + duration and not (max_requests and index >= max_requests):
+        delay = intended - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        jobs.put((index, intended))
+        index += 1
+        intended += rng.expovariate(rate) if arrival == 'poisson' else 1.0 / rate
+    for _ in threads:
+        jobs.put(None)
+    for t in threads:
+        t.join()
+    return {'scheduled': index, 'max_start_lag_ms': round(lag[0] * 1000, 3)}
+
+def git_commit():
+    try:
+        out = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, timeout=5,
+                             cwd=os.path.dirname(os.path.abspath(__file__)))
+        return out.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+def run_load_test(args, base_url):
+    payloads = build_payloads(args.payloads, args.seed)
+    workers_needed = args.concurrency
+    mode = f"open loop at {args.rate:g} req/s ({args.arrival})" if args.mode == 'open' else "closed loop"
+    print(f"\n[*] Load test: {mode}, {args.concurrency} connection(s), {args.duration:g}s"
+          + (f" after {args.warmup:g}s warm-up" if args.warmup else ""))
+
+    def run(duration, max_requests, seed):
+        workers = [LoadWorker(base_url, payloads, args.batch_size, args.timeout) for _ in range(workers_needed)]
+        started = time.perf_counter()
+        if args.mode == 'open':
+            extra = run_open_loop(workers, duration, max_requests, args.rate, args.arrival, seed)
+        else:
+            extra = run_closed_loop(workers, duration, max_requests)
+        return workers, time.perf_counter() - started, extra
+
+    if args.warmup:
+        run(args.warmup, 0, args.seed + 1)
+    workers, elapsed, extra = run(args.duration, args.requests, args.seed)
+
+    latency, service = LatencyHistogram(), LatencyHistogram()
+    errors = {}
+    for w in workers:
+        latency.merge(w.latency)
+        service.merge(w.service)
+        for kind, count in w.errors.items():
+            errors[kind] = errors.get(kind, 0) + count
+    ok = sum(w.ok for w in workers)
+    total = ok + sum(errors.values())
+
+    def summary(hist):
+        return {name: (hist.percentile(p) / 1000.0 if hist.total else None)
+                for name, p in (('p50', 50), ('p90', 90), ('p99', 99), ('p99.9', 99.9), ('max', 100))}
+
+    try:
+        server = requests.get(f"{base_url}/status", timeout=10).json()
+    except Exception:
+        server = {}
+    report = {
+        'config': {
+            'mode': args.mode,
+            'concurrency': args.concurrency,
+            'rate': args.rate if args.mode == 'open' else None,
+            'arrival': args.arrival if args.mode == 'open' else None,
+            'duration_s': args.duration,
+            'warmup_s': args.warmup,
+            'max_requests': args.requests,
+            'batch_size': args.batch_size,
+            'payloads': args.payloads,
+            'seed': args.seed,
+            'local_server': args.local,
+        },
+        'commit': git_commit(),
+        'server': {key: server.get(key) for key in ('version', 'commit', 'model_version', 'engine', 'default_tier')},
+        'started_at': datetime.utcnow().isoformat() + "Z",
+        'requests': total,
+        'ok': ok,
+        'errors': errors,
+        'error_rate': round(1 - ok / total, 6) if total else None,
+        'elapsed_s': round(elapsed, 3),
+        'throughput_rps': round(ok / elapsed, 2) if elapsed else None,
+        'cases_per_s': round(ok * args.batch_size / elapsed, 2) if elapsed else None,
+        'latency_ms': summary(latency),
+        'histogram': latency.to_dict(),
+        **extra,
+    }
+    if args.mode == 'open':
+        report['service_latency_ms'] = summary(service)
+        report['service_histogram'] = service.to_dict()
+    return report
+
+def print_report(report, baseline=None):
+    print("-" * 40)
+    print(f"Requests: {report['requests']} ({report['ok']} ok, error rate {(report['error_rate'] or 0) * 100:.2f}%)")
+    for kind, count in sorted(report['errors'].items()):
+        print(f"   -> {kind}: {count}")
+    print(f"Throughput: {report['throughput_rps']} req/s ({report['cases_per_s']} cases/s)")
+    if 'max_start_lag_ms' in report:
+        print(f"Max start lag: {report['max_start_lag_ms']} ms")
+    previous = (baseline or {}).get('latency_ms', {})
+    for name, value in report['latency_ms'].items():
+        if value is None:
+            continue
+        line = f"Latency {name:<6} {value:9.3f} ms"
+        if previous.get(name):
+            line += f"   ({(value / previous[name] - 1) * 100:+.1f}% vs baseline)"
+        print(line)
+    if baseline and baseline.get('throughput_rps'):
+        change = (report['throughput_rps'] / baseline['throughput_rps'] - 1) * 100
+        print(f"Throughput vs baseline ({baseline.get('commit')}): {change:+.1f}%")
+        if baseline.get('config') != report['config']:
+            print("[!] Baseline was recorded with a different configuration")
+    print("=========================================")
+
+# --- LOCAL SERVER ---
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def start_local_server(server, workers, threads, log_path, env=None):
+    """Start app.py on a free local port; returns (process, base_url) once /status answers.
+
+    `env` replaces the server's environment (default: this process's).
+    """
+    port = free_port()
+    here = os.path.dirname(os.path.abspath(__file__))
+    if server == 'gunicorn':
+        cmd = [sys.executable, '-m', 'gunicorn', 'app:app', '--bind', f'127.0.0.1:{port}',
+               '--workers', str(workers), '--threads', str(threads)]
+    else:
+        cmd = [sys.executable, '-m', 'flask', '--app', 'app', 'run', '--port', str(port),
+               '--no-reload', '--no-debugger', '--with-threads']
+    log = open(log_path, 'w') if log_path else subprocess.DEVNULL
+    proc = subprocess.Popen(cmd, cwd=here, env=env, stdout=log, stderr=subprocess.STDOUT)
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 120
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"Local server exited with code {proc.returncode}")
+        try:
+            if requests.get(f"{base_url}/status", timeout=2).json().get('model_loaded'):
+                print(f"[+] Local {server} server ready on {base_url}")
+                return proc, base_url
+        except (requests.RequestException, ValueError):
+            pass
+        time.sleep(0.25)
+    proc.terminate()
+    raise RuntimeError("Local server did not become ready within 120s")
+
+def stop_local_server(proc):
+    proc.terminate()
+    try:
+        proc.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Validate a running A-VITAL server, or load-test it.")
+    parser.add_argument('--url', default=os.environ.get('A_VITAL_URL', BASE_URL), help="Server base URL.")
+    parser.add_argument('--scenarios', type=int, default=50, help="Validation scenarios (without --load).")
+    parser.add_argument('--load', action='store_true', help="Run the load test instead of the validation scenarios.")
+    parser.add_argument('--mode', choices=('closed', 'open'), default='closed',
+                        help="closed: each connection waits for its answer; open: fixed arrival rate.")
+    parser.add_argument('--concurrency', type=int, default=8, help="Connections (worker threads).")
+    parser.add_argument('--rate', type=float, default=100.0, help="Requests per second with --mode open.")
+    parser.add_argument('--arrival', choices=('poisson', 'uniform'), default='poisson',
+                        help="Inter-arrival times with --mode open.")
+    parser.add_argument('--duration', type=float, default=30.0, help="Measured seconds.")
+    parser.add_argument('--warmup', type=float, default=2.0, help="Unmeasured seconds before the run.")
+    parser.add_argument('--requests', type=int, default=0, help="Stop after this many requests (0: duration only).")
+    parser.add_argument('--batch-size', type=int, default=1, help="Cases per request; >1 uses /predict/batch.")
+    parser.add_argument('--payloads', type=int, default=1000, help="Size of the generated payload pool.")
+    parser.add_argument('--seed', type=int, default=42, help="Seed for payloads and arrival times.")
+    parser.add_argument('--timeout', type=float, default=30.0, help="Per-request timeout in seconds.")
+    parser.add_argument('--output', default='load_report.json', help="Where to write the JSON report.")
+    parser.add_argument('--compare', help="Earlier JSON report to compare against.")
+    parser.add_argument('--local', action='store_true', help="Start app.py on a free local port for the run.")
+    parser.add_argument('--server', choices=('gunicorn', 'flask'), default='gunicorn' if os.name != 'nt' else 'flask',
+                        help="Local server type with --local.")
+    parser.add_argument('--server-workers', type=int, default=1, help="gunicorn workers with --local.")
+    parser.add_argument('--server-threads', type=int, default=4, help="gunicorn threads per worker with --local.")
+    parser.add_argument('--server-log', help="File for the local server's output.")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    print("=========================================")
+    print("   A-VITAL SYSTEM DIAGNOSTIC (STRESS TEST)    ")
+    print("=========================================")
+
+    proc = None
+    base_url = args.url.rstrip('/')
+    if args.local:
+        proc, base_url = start_local_server(args.server, args.server_workers, args.server_threads, args.server_log)
+    try:
+        # 1. Check Server
+        if not check_server(base_url):
+            return 1
+        if not args.load:
+            run_validation(base_url, args.scenarios)
+            return 0
+
+        # 2. Load Test
+        report = run_load_test(args, base_url)
+        baseline = None
+        if args.compare:
+            with open(args.compare, 'r', encoding='utf-8') as handle:
+                baseline = json.load(handle)
+        print_report(report, baseline)
+        with open(args.output, 'w', encoding='utf-8') as handle:
+            json.dump(report, handle, indent=2)
+        print(f"   -> Report written to {args.output}")
+        return 0
+    finally:
+        if proc is not None:
+            stop_local_server(proc)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,37 @@
+import shutil
+import sys
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+DATASET = ROOT / "enhanced_animal_disease.csv"
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """A scratch working directory: the scripts read and write their artifacts relative to the cwd."""
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def split_dataset(workdir):
+    """(reference dataset, new rows) CSVs cut from the bundled sample dataset."""
+    df = pd.read_csv(DATASET)
+    reference, new_rows = workdir / "reference.csv", workdir / "new_rows.csv"
+    df.iloc[:6000].to_csv(reference, index=False)
+    df.iloc[6000:].to_csv(new_rows, index=False)
+    return str(reference), str(new_rows)
+
+
+@pytest.fixture
+def serving_dir(workdir):
+    """The committed bundle and pickles, copied so app.py can load them from the scratch directory."""
+    shutil.copytree(ROOT / "model_bundle", workdir / "model_bundle")
+    for name in ("animal_model.pkl", "label_encoder.pkl", "model_features.pkl", "training_metrics.json"):
+        shutil.copy(ROOT / name, workdir / name)
+    return workdir
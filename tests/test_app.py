@@ -0,0 +1,62 @@
+import pytest
+
+
+@pytest.fixture
+def client(serving_dir):
+    import app
+    app.app.config["TESTING"] = True
+    return app.app.test_client()
+
+
+CASE = {"species": "Dog", "temp": 39.8, "hr": 120, "resp": 30, "activity": 40, "symptoms": ["Vomiting", "Diarrhea"]}
+
+
+def test_batch_reports_malformed_items_individually(client):
+    items = [
+        CASE,
+        {"symptoms": [["Vomiting"]]},
+        {"temp": "inf"},
+        {"temp": float("nan")},
+        {"hr": 10 ** 400},
+        {"hr": "fast"},
+        "not a case",
+        dict(CASE, species="Cat"),
+    ]
+    response = client.post("/predict/batch", json={"cases": items})
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body["count"] == len(items)
+    assert body["errors"] == 6
+    statuses = [result["status"] for result in body["results"]]
+    assert statuses == ["success", "error", "error", "error", "error", "error", "error", "success"]
+    messages = [result.get("message") for result in body["results"]]
+    assert messages[1] == "Symptoms must be strings"
+    assert messages[2] == messages[3] == messages[4] == "Vitals must be finite numbers"
+    assert messages[5] == "Vitals must be numeric values"
+
+
+def test_batch_of_valid_items_matches_single_predictions(client):
+    items = [CASE, dict(CASE, species="Cat", symptoms=["Sneezing"])]
+    batch = client.post("/predict/batch", json=items).get_json()["results"]
+    for item, result in zip(items, batch):
+        single = client.post("/predict", json=item).get_json()
+        assert result["prediction"] == single["prediction"]
+        assert result["confidence"] == single["confidence"]
+
+
+def test_non_finite_temp_is_a_client_error(client):
+    response = client.post("/predict", json=dict(CASE, temp="nan"))
+    assert response.status_code == 400
+    assert response.get_json()["message"] == "Vitals must be finite numbers"
+
+
+def test_temp_is_scored_on_the_tenth_degree_grid(client):
+    from inference import parse_case
+    assert parse_case(dict(CASE, temp=39.84))["temp"] == 39.8
+    assert parse_case(dict(CASE, temp="39.76"))["temp"] == 39.8
+    rounded = client.post("/predict", json=dict(CASE, temp=39.8)).get_json()
+    for temp in (39.84, 39.76):
+        result = client.post("/predict", json=dict(CASE, temp=temp)).get_json()
+        assert (result["prediction"], result["confidence"]) == (rounded["prediction"], rounded["confidence"])
+    fever = client.post("/predict", json=dict(CASE, temp=40.04)).get_json()
+    assert "High Fever" not in fever["reasoning"]
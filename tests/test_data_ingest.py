@@ -0,0 +1,71 @@
+import sys
+
+import pandas as pd
+import pytest
+
+import data_ingest
+
+ROWS = pd.DataFrame({
+    "Animal_Type": ["Dog", "Cat", "Dog"],
+    "Disease_Prediction": ["Parvovirus", "Cat Flu (URI)", "Healthy"],
+    "Body_Temperature": [39.5, 38.9, 38.5],
+    "Heart_Rate": [120, 180, 90],
+    "Respiratory_Rate": [30, 40, 20],
+    "Activity_Level": [20, 50, 90],
+    "Vomiting": [1, 0, 0],
+    "Hiccups": [0, 1, 0],
+})
+
+
+@pytest.fixture
+def sources(workdir):
+    ROWS.to_csv("clinic.csv", index=False)
+    return [{"name": "clinic", "url": "clinic.csv", "symptom_columns": ["Vomiting", "Hiccups"]}]
+
+
+def test_normalize_drops_unknown_symptoms(sources, capsys):
+    df = data_ingest.normalize_dataset(ROWS, sources[0])
+    assert "Hiccups" not in df.columns and df["Vomiting"].tolist() == [1, 0, 0]
+    assert "Hiccups" in capsys.readouterr().out
+    with pytest.raises(ValueError, match="Hiccups"):
+        data_ingest.normalize_dataset(ROWS, sources[0], strict=True)
+
+
+def test_ingest_drops_unknown_symptoms(sources):
+    for cache_dir in (None, "cache"):
+        combined = data_ingest.ingest_sources(sources, cache_dir=cache_dir)
+        assert "Hiccups" not in combined.columns and len(combined) == 3
+    with pytest.raises(ValueError, match="Hiccups"):
+        data_ingest.ingest_sources(sources, strict=True)
+
+
+def test_stream_warns_once_per_source(sources, workdir, capsys):
+    rows = data_ingest.stream_sources(sources, workdir / "out", chunk_rows=1)
+    assert rows == 3
+    out = capsys.readouterr().out
+    assert out.count("Hiccups") == 1
+    part = pd.read_csv(workdir / "out" / "source=clinic" / "part-00000.csv")
+    assert "Hiccups" not in part.columns
+
+
+def test_object_store_sources_go_through_fsspec(workdir):
+    fsspec = pytest.importorskip("fsspec")
+    store = fsspec.filesystem("memory")
+    with store.open(f"/{workdir.name}/clinic.csv", "w") as handle:
+        ROWS.to_csv(handle, index=False)
+    source = {"name": "bucket", "url": f"memory://{workdir.name}/clinic.csv", "symptom_columns": ["Vomiting"]}
+
+    assert len(data_ingest.ingest_sources([source], cache_dir="cache")) == 3
+    with store.open(f"/{workdir.name}/clinic.csv", "w") as handle:
+        ROWS.iloc[:1].to_csv(handle, index=False)
+    # The changed object is downloaded again rather than served from the raw cache
+    assert len(data_ingest.ingest_sources([source], cache_dir="cache")) == 1
+
+
+def test_object_store_sources_without_fsspec_fail_early(workdir, monkeypatch):
+    monkeypatch.setitem(sys.modules, "fsspec", None)
+    sources = [{"name": "local", "url": "missing.csv"}, {"name": "bucket", "url": "s3://bucket/clinic.csv"}]
+    with pytest.raises(RuntimeError, match="fsspec"):
+        data_ingest.ingest_sources(sources, cache_dir="cache")
+    with pytest.raises(RuntimeError, match="fsspec"):
+        data_ingest.stream_sources(sources, workdir / "out")
@@ -0,0 +1,23 @@
+import numpy as np
+
+import inference
+
+
+def test_native_engine_hands_large_batches_to_xgboost(serving_dir):
+    bundle = inference.load_model_bundle(engine="native")
+    assert bundle.engine == "native"
+    scorer = bundle.scorer
+    X = np.random.default_rng(0).random((64, len(bundle.features)), dtype=np.float32)
+
+    assert scorer._batch_scorer is None
+    scorer(X[:inference.NATIVE_BATCH_ROWS])
+    assert scorer._batch_scorer is None
+    batch = scorer(X)
+    assert scorer._batch_scorer is not None
+    np.testing.assert_allclose(batch, scorer.forest.predict(X), atol=1e-5)
+
+
+def test_native_batch_rows_zero_keeps_batches_native(serving_dir):
+    bundle = inference.load_model_bundle(engine="native", native_batch_rows=0)
+    bundle.scorer(np.zeros((16, len(bundle.features)), dtype=np.float32))
+    assert bundle.scorer._batch_scorer is None
@@ -0,0 +1,31 @@
+import threading
+import time
+
+import numpy as np
+
+from micro_batch import MicroBatcher
+
+
+def test_stats_stay_consistent_under_concurrent_submits():
+    batcher = MicroBatcher(max_batch_size=8, max_wait_ms=1.0)
+
+    def score(X):
+        time.sleep(0.001)
+        return X * 2
+
+    def client():
+        for value in range(50):
+            row = np.full(3, value, dtype=np.float32)
+            assert (batcher.submit(row, score) == row * 2).all()
+
+    threads = [threading.Thread(target=client) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    stats = batcher.stats()
+    assert stats["rows"] == 8 * 50
+    assert sum(stats["batch_size_histogram"].values()) == stats["batches"]
+    assert 1 <= stats["max_queue_depth"] <= 8
+    assert stats["avg_batch_size"] > 1
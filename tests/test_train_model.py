@@ -0,0 +1,27 @@
+import json
+
+import joblib
+import numpy as np
+import pandas as pd
+
+import train_model
+from conftest import DATASET
+
+
+def test_streaming_keeps_test_only_labels_and_writes_pickles(workdir, monkeypatch):
+    df = pd.read_csv(DATASET, nrows=3000)
+    first_test_row = int(np.flatnonzero(train_model.test_split_mask(np.arange(len(df))))[0])
+    df.loc[first_test_row, "Disease_Prediction"] = "Rare Disease"
+    df.to_csv("dataset.csv", index=False)
+    monkeypatch.setattr(train_model, "NUM_BOOST_ROUND", 10)
+
+    train_model.train_streaming("dataset.csv", chunk_rows=1000)
+
+    with open("model_bundle/manifest.json", "r", encoding="utf-8") as handle:
+        manifest = json.load(handle)
+    assert "Rare Disease" in manifest["classes"]
+    assert manifest["classes"] == sorted(df["Disease_Prediction"].unique())
+    model = joblib.load("animal_model.pkl")
+    assert model.get_booster().num_boosted_rounds() == 10
+    assert list(joblib.load("label_encoder.pkl").classes_) == manifest["classes"]
+    assert joblib.load("model_features.pkl") == manifest["features"]
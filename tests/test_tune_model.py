@@ -0,0 +1,29 @@
+import json
+
+import joblib
+
+import tune_model
+from train_model import read_bundle
+
+
+def test_export_keeps_tiers_and_rewrites_pickles(serving_dir):
+    booster, features, classes, metrics, tiers, shards = read_bundle()
+    selected = tiers["compact"][0]
+
+    tune_model.export_selected(selected, features, classes, dict(metrics, tuned=True))
+
+    with open("model_bundle/manifest.json", "r", encoding="utf-8") as handle:
+        manifest = json.load(handle)
+    assert sorted(manifest["tiers"]) == sorted(["full", *tiers])
+    assert sorted(manifest["shards"]) == sorted(shards)
+    assert manifest["metrics"]["tuned"]
+    model = joblib.load("animal_model.pkl")
+    assert model.get_booster().num_boosted_rounds() == selected.num_boosted_rounds()
+    assert list(joblib.load("label_encoder.pkl").classes_) == classes
+    assert joblib.load("model_features.pkl") == features
+
+
+def test_export_drops_tiers_of_another_schema(serving_dir):
+    _, features, classes, _, tiers, _ = read_bundle()
+    assert tune_model.existing_extras(features, classes[:-1]) == ({}, {})
+    assert sorted(tune_model.existing_extras(features, classes)[0]) == sorted(tiers)
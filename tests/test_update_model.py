@@ -0,0 +1,37 @@
+import json
+
+import xgboost as xgb
+
+import train_model
+import update_model
+
+
+def manifest():
+    with open("model_bundle/manifest.json", "r", encoding="utf-8") as handle:
+        return json.load(handle)
+
+
+def test_update_continues_from_streamed_bundle(split_dataset, monkeypatch):
+    reference, new_rows = split_dataset
+    monkeypatch.setattr(train_model, "NUM_BOOST_ROUND", 20)
+    train_model.train_streaming(reference, chunk_rows=2000)
+    streamed = manifest()
+    # A stale pickle from some other model must not be what the update starts from
+    with open("animal_model.pkl", "wb") as handle:
+        handle.write(b"stale")
+
+    assert update_model.update_model(new_rows, dataset_path=reference, rounds=5, retrain=False, cache_dir=None)
+
+    updated = manifest()
+    assert updated["version"] != streamed["version"]
+    assert updated["features"] == streamed["features"]
+    assert updated["classes"] == streamed["classes"]
+    booster = xgb.Booster(model_file=f"model_bundle/{updated['model_file']}")
+    assert booster.num_boosted_rounds() == 20 + 5
+
+
+def test_load_current_model_falls_back_to_pickles(serving_dir):
+    (serving_dir / "model_bundle" / "manifest.json").unlink()
+    booster, classes, features, _, tiers, shards = update_model.load_current_model()
+    assert len(features) == booster.num_features()
+    assert classes and not tiers and not shards
@@ -0,0 +1,146 @@
+"""Serving topology: how many CPUs this process may use and how they are split across gunicorn workers.
+
+Every worker gets an equal share of the usable CPUs as its XGBoost thread
+budget, so `workers x model threads` does not exceed the machine (by default
+each booster would start one thread per core in every worker). With
+PIN_WORKERS=1 each worker is also bound to its own slice of cores.
+
+gunicorn.conf.py calls `configure_worker()` right after each fork, before
+app.py is imported, so OpenMP/BLAS thread pools start with the right size
+and the worker's `layout()` knows its slot. Without gunicorn (python app.py)
+the process is treated as the only worker.
+"""
+import math
+import os
+
+# Read by OpenMP/BLAS when their thread pools start
+THREAD_ENV_VARS = ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS")
+# Set by configure_worker() for app.py
+SLOT_ENV = "AVITAL_WORKER_SLOT"
+WORKERS_ENV = "AVITAL_WORKERS"
+# CPUs seen before pinning, as "<count>:<source>", so a pinned worker still sizes its share from the whole machine
+CPUS_ENV = "AVITAL_CPUS"
+
+
+def _cgroup_cpu_limit():
+    """CPU quota of the container (cgroup v2, then v1), or None when unlimited."""
+    try:
+        with open("/sys/fs/cgroup/cpu.max", "r", encoding="utf-8") as handle:
+            quota, period = handle.read().split()[:2]
+        if quota != "max":
+            return int(quota) / int(period)
+        return None
+    except (OSError, ValueError):
+        pass
+    try:
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us", "r", encoding="utf-8") as handle:
+            quota = int(handle.read())
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us", "r", encoding="utf-8") as handle:
+            period = int(handle.read())
+        return quota / period if quota > 0 and period > 0 else None
+    except (OSError, ValueError):
+        return None
+
+
+def cpu_set():
+    """Sorted CPU ids this process may run on (all CPUs where affinity is unsupported)."""
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def available_cpus():
+    """(usable CPUs, source): the affinity mask, capped by a container CPU quota."""
+    recorded = os.environ.get(CPUS_ENV, "")
+    if ":" in recorded:
+        count, source = recorded.split(":", 1)
+        if count.isdigit():
+            return int(count), source
+    cpus, source = len(cpu_set()), "affinity" if hasattr(os, "sched_getaffinity") else "cpu_count"
+    limit = _cgroup_cpu_limit()
+    if limit is not None and math.ceil(limit) < cpus:
+        cpus, source = max(1, math.ceil(limit)), "cgroup_quota"
+    return cpus, source
+
+
+def worker_count():
+    """gunicorn workers sharing this machine (gunicorn.conf.py, else WEB_CONCURRENCY, else 1)."""
+    for name in (WORKERS_ENV, "WEB_CONCURRENCY"):
+        try:
+            return max(1, int(os.environ[name]))
+        except (KeyError, ValueError):
+            continue
+    return 1
+
+
+def model_threads(cpus=None, workers=None):
+    """XGBoost threads per worker: MODEL_THREADS if set (>0), else an equal share of the CPUs."""
+    try:
+        override = int(os.environ.get("MODEL_THREADS", 0))
+    except ValueError:
+        override = 0
+    if override > 0:
+        return override
+    cpus = cpus or available_cpus()[0]
+    return max(1, cpus // (workers or worker_count()))
+
+
+def pinning_enabled():
+    return os.environ.get("PIN_WORKERS", "0").lower() in ("1", "true", "yes")
+
+
+def slot_cpus(slot, threads, cpus):
+    """The `threads` CPUs of worker `slot`, in order, wrapping around when slots outnumber the cores."""
+    start = (slot * threads) % len(cpus)
+    return [cpus[(start + i) % len(cpus)] for i in range(min(threads, len(cpus)))]
+
+
+def free_slot(used):
+    """Lowest slot number not held by a running worker (slots are reused when workers restart)."""
+    used = set(used)
+    slot = 0
+    while slot in used:
+        slot += 1
+    return slot
+
+
+def configure_worker(slot, workers):
+    """Size thread pools and optionally pin this (freshly forked) worker; returns its layout."""
+    os.environ[SLOT_ENV] = str(slot)
+    os.environ[WORKERS_ENV] = str(workers)
+    cpus, source = available_cpus()
+    os.environ[CPUS_ENV] = f"{cpus}:{source}"
+    threads = model_threads(workers=workers)
+    for name in THREAD_ENV_VARS:
+        # An explicit setting from the environment wins
+        os.environ.setdefault(name, str(threads))
+    if pinning_enabled():
+        if hasattr(os, "sched_setaffinity"):
+            cores = slot_cpus(slot, threads, cpu_set())
+            os.sched_setaffinity(0, cores)
+        else:
+            print("[!] PIN_WORKERS is not supported on this platform, workers are not pinned")
+    current = layout()
+    pinned = f", pinned to CPUs {current['affinity']}" if current["pinned"] else ""
+    print(f"[*] Worker {slot} (pid {os.getpid()}): {current['model_threads']} model thread(s){pinned}")
+    return current
+
+
+def layout():
+    """This process's view of the serving topology, as reported on /status."""
+    cpus, source = available_cpus()
+    workers = worker_count()
+    threads = model_threads(cpus, workers)
+    slot = os.environ.get(SLOT_ENV)
+    return {
+        "pid": os.getpid(),
+        "worker_slot": int(slot) if slot is not None else None,
+        "workers": workers,
+        "available_cpus": cpus,
+        "cpu_source": source,
+        "model_threads": threads,
+        "thread_budget": workers * threads,
+        "oversubscribed": workers * threads > cpus,
+        "pinned": pinning_enabled() and hasattr(os, "sched_setaffinity"),
+        "affinity": cpu_set(),
+    }
@@ -1,5 +1,11 @@
 import argparse
+import contextlib
+import hashlib
 import json
+import os
+import shutil
+import tempfile
+import time
 from pathlib import Path
 from datetime import datetime
 
@@ -10,97 +16,711 @@ from sklearn.metrics import accuracy_score, balanced_accuracy_score, f1_score
 from sklearn.model_selection import train_test_split
 from sklearn.preprocessing import LabelEncoder
 from sklearn.utils.class_weight import compute_sample_weight
+import xgboost as xgb
 from xgboost import XGBClassifier
 
+from feature_schema import (
+    MASK_COLUMN,
+    SPECIES,
+    SPECIES_PREFIX,
+    SYMPTOMS,
+    VITAL_COLUMNS,
+    to_packed,
+    unpack_symptom_mask,
+)
+from inference import peak_rss_mb
+from tree_engine import FlatForest, parity_probe
+
 DEFAULT_DATASET = "enhanced_animal_disease.csv"
 COMBINED_DATASET = Path("data") / "combined_dataset.csv"
+BUNDLE_DIR = Path("model_bundle")
+BUNDLE_FORMAT_VERSION = 1
+DEFAULT_CHUNK_ROWS = 100_000
+TEST_SIZE = 0.15
+SPLIT_SEED = 42
+
+# Shared by the in-memory XGBClassifier and the streaming xgb.train path
+XGB_PARAMS = {
+    "learning_rate": 0.05,
+    "max_depth": 7,
+    "min_child_weight": 2,
+    "subsample": 0.9,
+    "colsample_bytree": 0.9,
+    "reg_alpha": 0.0,
+    "reg_lambda": 1.0,
+    "objective": "multi:softprob",
+    "tree_method": "hist",
+    "eval_metric": "mlogloss",
+}
+NUM_BOOST_ROUND = 700
+
+# Serving tiers: parameter overrides and round counts on top of XGB_PARAMS.
+# "full" is the default model; "compact" trades a little accuracy for much cheaper predictions.
+DEFAULT_TIER = "full"
+TIERS = {
+    "full": {"params": {}, "rounds": NUM_BOOST_ROUND},
+    "compact": {"params": {"max_depth": 4, "learning_rate": 0.3}, "rounds": 60},
+}
+LATENCY_REPEATS = 200
+
+# Prepared (encoded and split) training data, memory-mapped on repeat runs
+TRAIN_CACHE_DIR = Path(".train_cache")
+TRAIN_CACHE_FORMAT = 2
+MAX_CACHED_DATASETS = 4
+# Compact columns (float32 vitals, packed symptoms, int8 species and int16 label codes) plus the split indices
+PREPARED_ARRAYS = ("vitals", "symptom_mask", "species", "labels", "train_idx", "test_idx")
+# Rows expanded at a time when building a dense model matrix, to bound temporaries
+EXPAND_BLOCK_ROWS = 65_536
+# Vital bucket widths for `--dedup near`, in VITAL_COLUMNS order (°C, bpm, breaths/min, activity points)
+NEAR_DUP_BUCKETS = (0.2, 4, 2, 5)
+DEDUP_MODES = ("exact", "near", "off")
+
+
+def _reset_peak_rss():
+    # Linux: writing 5 to clear_refs resets VmHWM, the process's peak RSS
+    try:
+        with open("/proc/self/clear_refs", "w") as handle:
+            handle.write("5")
+    except OSError:
+        pass
+
+
+def _stage_peak_rss_mb():
+    try:
+        with open("/proc/self/status", "r") as handle:
+            for line in handle:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return peak_rss_mb()
+
+
+class StageMemory:
+    """Peak RSS (MiB) per pipeline stage: `with memory.stage("train"): ...`.
+
+    On Linux the peak is reset when each stage starts; elsewhere every value is
+    the process peak so far. Stages should not be nested.
+    """
+
+    def __init__(self):
+        self.peaks = {}
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        _reset_peak_rss()
+        try:
+            yield
+        finally:
+            self.peaks[name] = _stage_peak_rss_mb()
+
+
+def _untracked(name):
+    return contextlib.nullcontext()
+
+
+def default_dataset() -> str:
+    """data_ingest.py's combined dataset when it exists, else the bundled sample."""
+    return str(COMBINED_DATASET if COMBINED_DATASET.exists() else DEFAULT_DATASET)
 
 
 def parse_args():
     parser = argparse.ArgumentParser(description="Train the animal disease prediction model.")
     parser.add_argument(
         "--dataset",
-        default=str(COMBINED_DATASET if COMBINED_DATASET.exists() else DEFAULT_DATASET),
-        help="Path to the training dataset CSV.",
+        default=default_dataset(),
+        help="Path to the training dataset CSV, or a partitioned dataset directory with --stream.",
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Train out-of-core: stream chunks through an XGBoost data iterator instead of loading the dataset.",
+    )
+    parser.add_argument("--chunk-rows", type=int, default=DEFAULT_CHUNK_ROWS, help="Rows per chunk with --stream.")
+    parser.add_argument(
+        "--external-memory",
+        action="store_true",
+        help="With --stream, page the quantized matrix to disk (ExtMemQuantileDMatrix) instead of keeping it in RAM.",
+    )
+    parser.add_argument(
+        "--tiers",
+        default=",".join(TIERS),
+        help=f"Comma-separated serving tiers to train ({', '.join(TIERS)}); '{DEFAULT_TIER}' is always included.",
+    )
+    parser.add_argument(
+        "--species-shards",
+        action="store_true",
+        help="Also train one model per species over only that species' diseases (served lazily by app.py).",
+    )
+    parser.add_argument(
+        "--dedup",
+        choices=DEDUP_MODES,
+        default="off",
+        help="Collapse duplicate training rows (same label, species, symptoms and vitals) into one weighted row; "
+             f"'near' compares vitals in buckets of {NEAR_DUP_BUCKETS} (default: off, every row is trained on).",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help=f"Re-parse and re-encode the dataset instead of using the prepared matrices in {TRAIN_CACHE_DIR}/.",
+    )
+    parser.add_argument(
+        "--export-bundle",
+        action="store_true",
+        help=f"Skip training; convert the existing .pkl artifacts into {BUNDLE_DIR}/.",
     )
     return parser.parse_args()
 
-def build_and_train(dataset_path: str):
+
+def measure_latency(booster, rows, repeats=LATENCY_REPEATS):
+    """Median and p95 single-row inplace_predict latency in milliseconds, single-threaded like a serving worker."""
+    booster.set_param({"nthread": 1})
+    for row in rows[:10]:
+        booster.inplace_predict(row)
+    timings = []
+    for i in range(repeats):
+        row = rows[i % len(rows)]
+        started = time.perf_counter()
+        booster.inplace_predict(row)
+        timings.append(time.perf_counter() - started)
+    timings = np.array(timings) * 1000.0
+    return float(np.percentile(timings, 50)), float(np.percentile(timings, 95))
+
+
+def write_tier(booster, feature_names, bundle_dir: Path) -> dict:
+    """Write one tier's payload files (content-hashed names) and measure its latency."""
+    raw = bytes(booster.save_raw(raw_format="ubj"))
+    digest = hashlib.sha256(raw).hexdigest()
+    version = digest[:12]
+    model_file = f"model-{version}.ubj"
+    staging = bundle_dir / "model.ubj.tmp"
+    staging.write_bytes(raw)
+    os.replace(staging, bundle_dir / model_file)
+
+    # Pre-flattened trees let the native engine start without parsing the model
+    forest = FlatForest.from_booster(booster)
+    forest_file = f"forest-{version}.npz"
+    forest.save(bundle_dir / forest_file)
+
+    # Expected probabilities for tree_engine.parity_probe(features), checked by the native engine
+    probe = parity_probe(list(feature_names))
+    parity_file = f"parity-{version}.npy"
+    np.save(bundle_dir / parity_file, booster.inplace_predict(probe))
+
+    p50, p95 = measure_latency(booster, [probe[i:i + 1] for i in range(len(probe))])
+    return {
+        "version": version,
+        "model_file": model_file,
+        "model_sha256": digest,
+        "forest_file": forest_file,
+        "parity_file": parity_file,
+        "num_trees": forest.num_trees,
+        "latency_p50_ms": round(p50, 4),
+        "latency_p95_ms": round(p95, 4),
+    }
+
+
+def export_bundle(booster, feature_names, classes, metrics, bundle_dir=BUNDLE_DIR, tiers=None, shards=None):
+    """Write the fast-start bundle: per tier a UBJSON booster, flattened forest and parity probe, plus a JSON manifest.
+
+    `booster` is the default ("full") tier; `tiers` maps further tier names to
+    (booster, metrics) and `shards` maps species to (booster, class names, metrics).
+    Payload files are named by content hash and the manifest is replaced last,
+    so a reader never sees a manifest pointing at a half-written model.
+    """
+    bundle_dir = Path(bundle_dir)
+    bundle_dir.mkdir(parents=True, exist_ok=True)
+
+    entries = {}
+    for name, (tier_booster, tier_metrics) in {DEFAULT_TIER: (booster, metrics), **(tiers or {})}.items():
+        entries[name] = dict(write_tier(tier_booster, feature_names, bundle_dir), metrics=tier_metrics)
+        print(f"   -> Tier '{name}': {entries[name]['num_trees']} trees, "
+              f"p50 {entries[name]['latency_p50_ms']:.3f} ms")
+    default = entries[DEFAULT_TIER]
+
+    shard_entries = {}
+    for species, (shard_booster, shard_classes, shard_metrics) in (shards or {}).items():
+        shard_entries[species] = dict(
+            write_tier(shard_booster, feature_names, bundle_dir),
+            classes=[str(c) for c in shard_classes],
+            metrics=shard_metrics,
+        )
+        print(f"   -> Shard '{species}': {len(shard_classes)} classes, {shard_entries[species]['num_trees']} trees, "
+              f"p50 {shard_entries[species]['latency_p50_ms']:.3f} ms")
+
+    manifest = {
+        "format_version": BUNDLE_FORMAT_VERSION,
+        "version": default["version"],
+        "model_file": default["model_file"],
+        "model_sha256": default["model_sha256"],
+        "forest_file": default["forest_file"],
+        "parity_file": default["parity_file"],
+        "features": list(feature_names),
+        "classes": [str(c) for c in classes],
+        "metrics": metrics,
+        "default_tier": DEFAULT_TIER,
+        "tiers": entries,
+        "shards": shard_entries,
+        "created_at": datetime.utcnow().isoformat() + "Z",
+    }
+    staging = bundle_dir / "manifest.json.tmp"
+    with open(staging, "w", encoding="utf-8") as handle:
+        json.dump(manifest, handle, indent=2)
+    os.replace(staging, bundle_dir / "manifest.json")
+
+    keep = {
+        entry[key]
+        for entry in [*entries.values(), *shard_entries.values()]
+        for key in ("model_file", "forest_file", "parity_file")
+    }
+    for stale in bundle_dir.glob("*-*.*"):
+        if stale.name not in keep:
+            stale.unlink()
+    print(f"   -> Bundle {default['version']} written to {bundle_dir}/")
+    return manifest
+
+
+def save_legacy_artifacts(booster, feature_names, classes):
+    """Write the joblib pickles (XGBClassifier, LabelEncoder, feature list) from a booster, for the pickle fallback."""
+    model = XGBClassifier()
+    model.load_model(bytearray(booster.save_raw(raw_format="ubj")))
+    le = LabelEncoder()
+    le.classes_ = np.array([str(c) for c in classes], dtype=object)
+    joblib.dump(model, 'animal_model.pkl', compress=3)
+    joblib.dump(le, 'label_encoder.pkl')
+    joblib.dump(list(feature_names), 'model_features.pkl')
+
+
+def read_bundle(bundle_dir=BUNDLE_DIR):
+    """(booster, features, classes, metrics, extra tiers, shards) of an exported bundle; None without a manifest.
+
+    Tiers and shards come back in the shapes export_bundle() takes.
+    """
+    bundle_dir = Path(bundle_dir)
+    manifest_path = bundle_dir / "manifest.json"
+    if not manifest_path.exists():
+        return None
+    with open(manifest_path, "r", encoding="utf-8") as handle:
+        manifest = json.load(handle)
+    booster = xgb.Booster(model_file=str(bundle_dir / manifest["model_file"]))
+    tiers, shards = {}, {}
+    for name, entry in (manifest.get("tiers") or {}).items():
+        if name != manifest.get("default_tier", DEFAULT_TIER):
+            tiers[name] = (xgb.Booster(model_file=str(bundle_dir / entry["model_file"])), entry.get("metrics"))
+    for species, entry in (manifest.get("shards") or {}).items():
+        shard_booster = xgb.Booster(model_file=str(bundle_dir / entry["model_file"]))
+        shards[species] = (shard_booster, entry["classes"], entry.get("metrics") or {})
+    return booster, list(manifest["features"]), list(manifest["classes"]), manifest.get("metrics"), tiers, shards
+
+
+def export_existing_artifacts():
+    model = joblib.load('animal_model.pkl')
+    le = joblib.load('label_encoder.pkl')
+    feature_names = joblib.load('model_features.pkl')
+    try:
+        with open("training_metrics.json", "r", encoding="utf-8") as handle:
+            metrics = json.load(handle)
+    except FileNotFoundError:
+        metrics = None
+    export_bundle(model.get_booster(), feature_names, le.classes_, metrics)
+
+def load_dataset(dataset_path: str) -> pd.DataFrame:
+    """Read a wide or packed dataset into compact columns.
+
+    Symptoms come back as one uint64 Symptom_Mask column, vitals as float32,
+    species and labels as categoricals.
+    """
+    wanted = {"Animal_Type", "Disease_Prediction", *VITAL_COLUMNS, *SYMPTOMS, MASK_COLUMN}
+    dtypes = {name: "uint8" for name in SYMPTOMS}
+    dtypes.update({name: "float32" for name in VITAL_COLUMNS})
+    dtypes.update({"Animal_Type": "category", "Disease_Prediction": "category"})
+    df = pd.read_csv(dataset_path, usecols=lambda c: c in wanted, dtype=dtypes)
+    df = to_packed(df)
+    df[MASK_COLUMN] = df[MASK_COLUMN].astype("uint64")
+    return df
+
+
+def feature_layout(species_levels):
+    return list(VITAL_COLUMNS) + list(SYMPTOMS) + [f"{SPECIES_PREFIX}{s}" for s in species_levels]
+
+
+def observed_levels(series: pd.Series) -> list:
+    """Sorted distinct values as strings (LabelEncoder order), without materializing a string per row."""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return sorted(str(c) for c in series.cat.remove_unused_categories().cat.categories)
+    return sorted(series.astype(str).unique())
+
+
+def category_codes(series: pd.Series, levels, dtype=np.int16) -> np.ndarray:
+    """Position of each value in `levels`, -1 for values not in it."""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        lookup = np.append(pd.Index(levels).get_indexer(series.cat.categories.astype(str)), -1)
+        return lookup[series.cat.codes.to_numpy()].astype(dtype)
+    return pd.Categorical(series.astype(str), categories=levels).codes.astype(dtype)
+
+
+def assemble_features(vitals, masks, species_codes, n_species) -> np.ndarray:
+    """Dense float32 model matrix in feature_layout() order from compact columns; species code -1 is all-zero."""
+    n_vitals = len(VITAL_COLUMNS)
+    symptom_end = n_vitals + len(SYMPTOMS)
+    X = np.zeros((len(masks), symptom_end + n_species), dtype=np.float32)
+    for start in range(0, len(X), EXPAND_BLOCK_ROWS):
+        block = slice(start, start + EXPAND_BLOCK_ROWS)
+        X[block, :n_vitals] = vitals[block]
+        X[block, n_vitals:symptom_end] = unpack_symptom_mask(masks[block], np.float32)
+    codes = np.asarray(species_codes)
+    known = np.flatnonzero(codes >= 0)
+    X[known, symptom_end + codes[known]] = 1.0
+    return X
+
+
+def prepare_dataset(df: pd.DataFrame) -> dict:
+    """Encode a packed frame into compact training columns and a stratified train/test split.
+
+    The split is two index arrays over the same columns; dense float32 matrices
+    are only built (by split_matrix) where XGBoost needs them.
+    """
+    # 1. Feature layout: vitals, one column per registry symptom, one-hot 'Animal_Type'
+    species_levels = observed_levels(df['Animal_Type'])
+    feature_names = feature_layout(species_levels)
+
+    # 2. Encode Target (same sorted classes as LabelEncoder)
+    classes = observed_levels(df['Disease_Prediction'])
+    labels = category_codes(df['Disease_Prediction'], classes)
+    if (labels < 0).any():
+        raise ValueError("Dataset has rows without a Disease_Prediction label")
+
+    train_idx, test_idx = train_test_split(
+        np.arange(len(df), dtype=np.int32),
+        test_size=TEST_SIZE,
+        random_state=SPLIT_SEED,
+        stratify=labels,
+    )
+
+    # Symptoms stay packed; only the matrices handed to XGBoost are expanded
+    return {
+        "feature_names": feature_names,
+        "classes": classes,
+        "species_levels": species_levels,
+        "rows": int(len(df)),
+        "vitals": df[list(VITAL_COLUMNS)].to_numpy(dtype=np.float32),
+        "symptom_mask": df[MASK_COLUMN].to_numpy(dtype=np.uint64),
+        "species": category_codes(df['Animal_Type'], species_levels, np.int8),
+        "labels": labels,
+        "train_idx": train_idx,
+        "test_idx": test_idx,
+    }
+
+
+def split_matrix(prepared: dict, split: str, positions=None) -> np.ndarray:
+    """Dense float32 model matrix for the "train" or "test" rows (or `positions` within them)."""
+    rows = np.asarray(prepared[f"{split}_idx"])
+    if positions is not None:
+        rows = rows[positions]
+    return assemble_features(
+        np.asarray(prepared["vitals"])[rows],
+        np.asarray(prepared["symptom_mask"])[rows],
+        np.asarray(prepared["species"])[rows],
+        len(prepared["species_levels"]),
+    )
+
+
+def split_labels(prepared: dict, split: str) -> np.ndarray:
+    return np.asarray(prepared["labels"])[prepared[f"{split}_idx"]].astype(np.int32)
+
+
+def dedup_rows(prepared: dict, split: str = "train", buckets=None) -> dict:
+    """Collapse identical rows of a split (label, species, symptom mask, vitals) into one row per group.
+
+    With `buckets`, vitals are compared after flooring them to those widths and
+    each group keeps its mean vitals. Returns a row selection: "positions"
+    (first row of each group, within the split), "counts" (rows per group) and
+    "vitals" (None for exact groups).
+    """
+    rows = np.asarray(prepared[f"{split}_idx"])
+    vitals = np.asarray(prepared["vitals"])[rows]
+    if buckets is None:
+        vital_keys = vitals.view(np.int32)
+    else:
+        vital_keys = np.floor(vitals / np.asarray(buckets, dtype=np.float32)).astype(np.int64)
+    keys = pd.DataFrame({
+        "label": np.asarray(prepared["labels"])[rows],
+        "species": np.asarray(prepared["species"])[rows],
+        "mask": np.asarray(prepared["symptom_mask"])[rows].view(np.int64),
+        **{column: vital_keys[:, i] for i, column in enumerate(VITAL_COLUMNS)},
+    })
+    # Hash-based grouping; with sort=False groups are numbered in order of first appearance
+    group = keys.groupby(list(keys.columns), sort=False).ngroup().to_numpy()
+    _, positions = np.unique(group, return_index=True)
+    counts = np.bincount(group).astype(np.float32)
+    mean_vitals = None
+    if buckets is not None:
+        mean_vitals = np.column_stack([
+            np.bincount(group, weights=vitals[:, i]) / counts for i in range(len(VITAL_COLUMNS))
+        ]).astype(np.float32)
+    return {"positions": positions, "counts": counts, "vitals": mean_vitals}
+
+
+def all_rows(prepared: dict, split: str = "train") -> dict:
+    """Row selection of every row of a split, each counted once."""
+    rows = len(prepared[f"{split}_idx"])
+    return {"positions": np.arange(rows), "counts": np.ones(rows, dtype=np.float32), "vitals": None}
+
+
+def selection_matrix(prepared: dict, selection: dict, rows=None) -> np.ndarray:
+    """Dense training matrix of a row selection (or of `rows` within it)."""
+    rows = slice(None) if rows is None else rows
+    X = split_matrix(prepared, "train", selection["positions"][rows])
+    if selection["vitals"] is not None:
+        X[:, :len(VITAL_COLUMNS)] = selection["vitals"][rows]
+    return X
+
+
+def prepared_cache_key(dataset_path) -> str:
+    """Content hash of the dataset plus everything that shapes the encoded matrices."""
+    digest = hashlib.sha256()
+    with open(dataset_path, "rb") as handle:
+        for block in iter(lambda: handle.read(1 << 20), b""):
+            digest.update(block)
+    recipe = {
+        "data": digest.hexdigest(),
+        "vitals": list(VITAL_COLUMNS),
+        "symptoms": list(SYMPTOMS),
+        "species_prefix": SPECIES_PREFIX,
+        "split": [TEST_SIZE, SPLIT_SEED],
+        "format": TRAIN_CACHE_FORMAT,
+    }
+    return hashlib.sha256(json.dumps(recipe, sort_keys=True).encode("utf-8")).hexdigest()[:20]
+
+
+def save_prepared(prepared: dict, entry: Path) -> None:
+    staging = entry.with_name(f"{entry.name}.{os.getpid()}.tmp")
+    shutil.rmtree(staging, ignore_errors=True)
+    staging.mkdir(parents=True)
+    for name in PREPARED_ARRAYS:
+        np.save(staging / f"{name}.npy", np.ascontiguousarray(prepared[name]))
+    meta = {key: prepared[key] for key in ("feature_names", "classes", "species_levels", "rows")}
+    with open(staging / "meta.json", "w", encoding="utf-8") as handle:
+        json.dump(meta, handle, indent=2)
+    try:
+        os.replace(staging, entry)
+    except OSError:
+        # Another run published the same entry first
+        shutil.rmtree(staging, ignore_errors=True)
+
+
+def read_and_prepare(dataset_path: str, stage=_untracked) -> dict:
+    with stage("read"):
+        df = load_dataset(dataset_path)
+    with stage("encode"):
+        prepared = prepare_dataset(df)
+        del df
+    return prepared
+
+
+def load_prepared(dataset_path: str, cache_dir=TRAIN_CACHE_DIR, memory=None):
+    """Prepared columns for `dataset_path`, memory-mapped from the cache when the data and schema are unchanged.
+
+    Returns (prepared, cache_status) with status "hit", "miss" or None when caching is off.
+    A `memory` (StageMemory) records the "read", "encode" and "cache" stages.
+    """
+    stage = memory.stage if memory is not None else _untracked
+    if cache_dir is None:
+        return read_and_prepare(dataset_path, stage), None
+
+    cache_dir = Path(cache_dir)
+    entry = cache_dir / prepared_cache_key(dataset_path)
+    status = "hit"
+    if not (entry / "meta.json").exists():
+        status = "miss"
+        prepared = read_and_prepare(dataset_path, stage)
+        with stage("cache"):
+            save_prepared(prepared, entry)
+        del prepared
+        # Keep only the most recently used entries
+        entries = sorted((p for p in cache_dir.iterdir() if (p / "meta.json").exists()),
+                         key=lambda p: (p / "meta.json").stat().st_mtime, reverse=True)
+        for stale in entries[MAX_CACHED_DATASETS:]:
+            if stale != entry:
+                shutil.rmtree(stale, ignore_errors=True)
+
+    (entry / "meta.json").touch()
+    with open(entry / "meta.json", "r", encoding="utf-8") as handle:
+        prepared = json.load(handle)
+    for name in PREPARED_ARRAYS:
+        prepared[name] = np.load(entry / f"{name}.npy", mmap_mode="r")
+    return prepared, status
+
+
+def train_species_shards(prepared, full_booster, sample_weight, selection=None):
+    """One model per species over only the classes seen for it; species with a single class are skipped.
+
+    A shard is only kept if it is at least as accurate as the global model on
+    the species' test rows and its classes cover everything the global model
+    can answer for that species (its test predictions and Healthy).
+    Shards reuse the full tier's settings and feature layout, so serving builds one matrix for any model.
+    `selection` is the (deduplicated) training row selection `sample_weight` is aligned with.
+    """
+    selection = selection or all_rows(prepared)
+    feature_names = prepared["feature_names"]
+    classes = np.array(prepared["classes"], dtype=object)
+    y_train = split_labels(prepared, "train")[selection["positions"]]
+    y_test = split_labels(prepared, "test")
+    species_train = np.asarray(prepared["species"])[prepared["train_idx"]][selection["positions"]]
+    species_test = np.asarray(prepared["species"])[prepared["test_idx"]]
+    healthy = np.flatnonzero(np.char.find(np.char.upper(classes.astype(str)), "HEALTHY") >= 0)
+    tier = TIERS[DEFAULT_TIER]
+    shards = {}
+    for code, species in enumerate(prepared["species_levels"]):
+        train_rows = np.flatnonzero(species_train == code)
+        test_rows = np.flatnonzero(species_test == code)
+        local_classes = np.unique(y_train[train_rows])
+        if len(local_classes) < 2:
+            print(f"   -> Shard '{species}': {len(local_classes)} class(es), served by the global model")
+            continue
+
+        # Relabel to 0..k-1 over this species' classes
+        y_local = np.searchsorted(local_classes, y_train[train_rows])
+        shard = XGBClassifier(
+            n_estimators=tier["rounds"],
+            **dict(XGB_PARAMS, **tier["params"]),
+            # Set explicitly so two-class shards keep the softprob layout instead of switching to binary
+            num_class=len(local_classes),
+            random_state=42,
+            n_jobs=-1,
+        )
+        shard.fit(
+            pd.DataFrame(selection_matrix(prepared, selection, train_rows), columns=feature_names, copy=False),
+            y_local,
+            sample_weight=np.asarray(sample_weight)[train_rows],
+        )
+
+        if not len(test_rows):
+            print(f"   -> Shard '{species}': no test rows to check it against the global model, dropped")
+            continue
+        X_species = split_matrix(prepared, "test", test_rows)
+        preds = local_classes[shard.predict_proba(pd.DataFrame(X_species, columns=feature_names)).argmax(axis=1)]
+        global_preds = full_booster.inplace_predict(X_species).argmax(axis=1)
+        shard_metrics = {
+            "train_rows": int(len(train_rows)),
+            "test_rows": int(len(test_rows)),
+            "accuracy": float(accuracy_score(y_test[test_rows], preds)),
+            "global_accuracy": float(accuracy_score(y_test[test_rows], global_preds)),
+        }
+        summary = (f"   -> Shard '{species}': {len(local_classes)} classes, accuracy "
+                   f"{shard_metrics['accuracy'] * 100:.2f}% (global model {shard_metrics['global_accuracy'] * 100:.2f}%)")
+        uncovered = np.setdiff1d(np.union1d(global_preds, healthy), local_classes)
+        if len(uncovered):
+            print(f"{summary}, dropped: cannot answer {', '.join(map(str, classes[uncovered]))}")
+            continue
+        if shard_metrics["accuracy"] < shard_metrics["global_accuracy"]:
+            print(f"{summary}, dropped: less accurate than the global model")
+            continue
+        print(summary)
+        shards[species] = (shard.get_booster(), classes[local_classes], shard_metrics)
+    return shards
+
+
+def build_and_train(dataset_path: str, cache_dir=TRAIN_CACHE_DIR, tiers=tuple(TIERS), species_shards=False,
+                    dedup="off"):
     print(f"[1/5] Loading Dataset: {dataset_path}")
+
+    # --- PREPROCESSING ---
+    print("[2/5] Preprocessing & Encoding...")
+    memory = StageMemory()
     try:
-        df = pd.read_csv(dataset_path)
+        prepared, cache_status = load_prepared(dataset_path, cache_dir, memory)
     except FileNotFoundError:
         print(
             f"Error: '{dataset_path}' not found. "
             "Run generate_data.py or data_ingest.py first."
         )
         return
+    if cache_status:
+        print(f"   -> Prepared matrix cache {cache_status}")
 
-    # --- PREPROCESSING ---
-    print("[2/5] Preprocessing & Encoding...")
-    
-    # 1. Separate Target
-    y = df['Disease_Prediction']
-    
-    # 2. Separate Features
-    X_raw = df.drop('Disease_Prediction', axis=1)
-    
-    # One-Hot Encode 'Animal_Type'
-    X = pd.get_dummies(X_raw, columns=['Animal_Type'], drop_first=False)
-    
-    # Boolean to Int (for XGBoost)
-    bool_cols = X.select_dtypes(include=['bool']).columns
-    X[bool_cols] = X[bool_cols].astype(int)
-    
-    feature_names = X.columns.tolist()
-    
-    # Encode Target
+    feature_names = prepared["feature_names"]
     le = LabelEncoder()
-    y_encoded = le.fit_transform(y)
-    
+    le.classes_ = np.array(prepared["classes"], dtype=object)
+    y_all, y_test = split_labels(prepared, "train"), split_labels(prepared, "test")
+
     print(f"   -> Features: {len(feature_names)}")
-    
+
+    # Duplicate rows become one row weighted by their count (test rows are all kept)
+    dedup_report = None
+    if dedup != "off":
+        started = time.perf_counter()
+        with memory.stage("dedup"):
+            selection = dedup_rows(prepared, buckets=NEAR_DUP_BUCKETS if dedup == "near" else None)
+        kept = len(selection["positions"])
+        dedup_report = {
+            "mode": dedup,
+            "train_rows": int(len(y_all)),
+            "unique_rows": int(kept),
+            "ratio": round(len(y_all) / kept, 4) if kept else None,
+            "seconds": round(time.perf_counter() - started, 3),
+        }
+        print(f"   -> Dedup ({dedup}): {len(y_all):,} -> {kept:,} training rows ({dedup_report['ratio']}x)")
+    else:
+        selection = all_rows(prepared)
+    y_train = y_all[selection["positions"]]
+
     # --- TRAINING (XGBOOST) ---
     print("[3/5] Training XGBoost Classifier...")
-    
-    X_train, X_test, y_train, y_test = train_test_split(
-        X,
-        y_encoded,
-        test_size=0.15,
-        random_state=42,
-        stratify=y_encoded,
-    )
-    
-    # XGBoost Calculation
-    model = XGBClassifier(
-        n_estimators=700,
-        learning_rate=0.05,
-        max_depth=7,
-        min_child_weight=2,
-        subsample=0.9,
-        colsample_bytree=0.9,
-        reg_alpha=0.0,
-        reg_lambda=1.0,
-        objective="multi:softprob",
-        tree_method="hist",
-        eval_metric="mlogloss",
-        random_state=42,
-        n_jobs=-1,
-    )
-    
-    sample_weight = compute_sample_weight(class_weight="balanced", y=y_train)
-    model.fit(
-        X_train,
-        y_train,
-        sample_weight=sample_weight,
-    )
-    
+
+    # XGBoost Calculation: balanced class weights over every training row, times the rows each kept row stands for
+    sample_weight = compute_sample_weight(class_weight="balanced", y=y_all)[selection["positions"]] * selection["counts"]
+    models = {}
+    train_started = time.perf_counter()
+    with memory.stage("train"):
+        # The only dense copy of the training rows, named for XGBoost's feature_names and dropped after fitting
+        X_train = pd.DataFrame(selection_matrix(prepared, selection), columns=feature_names, copy=False)
+        for name in tiers:
+            tier = TIERS[name]
+            print(f"   -> Tier '{name}': {tier['rounds']} rounds {tier['params'] or ''}")
+            models[name] = XGBClassifier(
+                n_estimators=tier["rounds"],
+                **dict(XGB_PARAMS, **tier["params"]),
+                random_state=42,
+                n_jobs=-1,
+            )
+            models[name].fit(
+                X_train,
+                y_train,
+                sample_weight=sample_weight,
+            )
+        del X_train
+    model = models[DEFAULT_TIER]
+    train_seconds = time.perf_counter() - train_started
+    note = ""
+    if dedup_report:
+        # Hist training cost is roughly linear in rows, so the skipped duplicates would have cost this much more
+        dedup_report["train_seconds"] = round(train_seconds, 2)
+        dedup_report["estimated_seconds_saved"] = round(train_seconds * (dedup_report["ratio"] - 1), 2)
+        note = f" (dedup saved about {dedup_report['estimated_seconds_saved']}s)"
+    print(f"   -> Trained in {train_seconds:.1f}s{note}")
+
     # --- EVALUATION ---
     print("[4/5] Evaluating...")
-    preds = model.predict(X_test)
-    accuracy = accuracy_score(y_test, preds)
-    balanced = balanced_accuracy_score(y_test, preds)
-    macro_f1 = f1_score(y_test, preds, average="macro")
+    scores = {}
+    with memory.stage("evaluate"):
+        X_test = split_matrix(prepared, "test")
+        # Argmax of the class probabilities, as XGBClassifier.predict does
+        predictions = {name: tier_model.get_booster().inplace_predict(X_test).argmax(axis=1)
+                       for name, tier_model in models.items()}
+        del X_test
+    for name, tier_model in models.items():
+        preds = predictions[name]
+        scores[name] = {
+            "accuracy": float(accuracy_score(y_test, preds)),
+            "balanced_accuracy": float(balanced_accuracy_score(y_test, preds)),
+            "macro_f1": float(f1_score(y_test, preds, average="macro")),
+        }
+        if name != DEFAULT_TIER:
+            print(f"   -> Tier '{name}' Accuracy: {scores[name]['accuracy'] * 100:.2f}%")
+    accuracy = scores[DEFAULT_TIER]["accuracy"]
+    balanced = scores[DEFAULT_TIER]["balanced_accuracy"]
+    macro_f1 = scores[DEFAULT_TIER]["macro_f1"]
     print(f"   -> Accuracy: {accuracy * 100:.2f}%")
     print(f"   -> Balanced Accuracy: {balanced * 100:.2f}%")
     print(f"   -> Macro F1: {macro_f1 * 100:.2f}%")
@@ -112,15 +732,17 @@ def build_and_train(dataset_path: str):
     for i in range(5):
         print(f"    {i+1}. {feature_names[indices[i]]}: {importances[indices[i]]:.4f}")
 
+    shards = None
+    if species_shards:
+        print("   -> Training per-species shards...")
+        with memory.stage("shards"):
+            shards = train_species_shards(prepared, model.get_booster(), sample_weight, selection)
+
     # --- EXPORT ---
     print("\n[5/5] Exporting Artifacts...")
-    joblib.dump(model, 'animal_model.pkl', compress=3) 
-    joblib.dump(le, 'label_encoder.pkl')
-    joblib.dump(feature_names, 'model_features.pkl')
-
     metrics = {
         "dataset": dataset_path,
-        "rows": int(df.shape[0]),
+        "rows": prepared["rows"],
         "features": int(len(feature_names)),
         "classes": int(len(le.classes_)),
         "accuracy": float(accuracy),
@@ -128,11 +750,247 @@ def build_and_train(dataset_path: str):
         "macro_f1": float(macro_f1),
         "trained_at": datetime.utcnow().isoformat() + "Z",
     }
+    if dedup_report:
+        metrics["dedup"] = dedup_report
+    extra_tiers = {
+        name: (tier_model.get_booster(), dict(scores[name], rounds=TIERS[name]["rounds"], **TIERS[name]["params"]))
+        for name, tier_model in models.items()
+        if name != DEFAULT_TIER
+    }
+    with memory.stage("export"):
+        joblib.dump(model, 'animal_model.pkl', compress=3)
+        joblib.dump(le, 'label_encoder.pkl')
+        joblib.dump(feature_names, 'model_features.pkl')
+        export_bundle(model.get_booster(), feature_names, le.classes_, metrics, tiers=extra_tiers, shards=shards)
+
+    print("   -> Peak RSS by stage: " + ", ".join(f"{name} {mb} MB" for name, mb in memory.peaks.items()))
     with open("training_metrics.json", "w", encoding="utf-8") as handle:
-        json.dump(metrics, handle, indent=2)
-    
+        json.dump(dict(metrics, peak_rss_mb=memory.peaks), handle, indent=2)
+
+    print("Build Complete.")
+
+# --- OUT-OF-CORE TRAINING ---
+
+def dataset_files(dataset_path):
+    """A CSV file, or every part file of a partitioned dataset directory (data_ingest.py --stream)."""
+    path = Path(dataset_path)
+    if path.is_dir():
+        files = sorted(p for p in path.rglob("part-*") if p.suffix in (".csv", ".parquet"))
+        if not files:
+            raise FileNotFoundError(f"No part-*.csv or part-*.parquet files under '{dataset_path}'")
+        return files
+    if not path.exists():
+        raise FileNotFoundError(dataset_path)
+    return [path]
+
+
+def iter_dataset_chunks(dataset_path, chunk_rows=DEFAULT_CHUNK_ROWS, columns=None):
+    """Yield packed frames of at most `chunk_rows` rows (Parquet parts are yielded whole)."""
+    wanted = set(columns) if columns else {
+        "Animal_Type", "Disease_Prediction", *VITAL_COLUMNS, *SYMPTOMS, MASK_COLUMN,
+    }
+    dtypes = {name: "uint8" for name in SYMPTOMS}
+    dtypes.update({name: "float32" for name in VITAL_COLUMNS})
+    for path in dataset_files(dataset_path):
+        if path.suffix == ".parquet":
+            frames = [pd.read_parquet(path)]
+        else:
+            frames = pd.read_csv(path, chunksize=chunk_rows, usecols=lambda c: c in wanted, dtype=dtypes)
+        for frame in frames:
+            frame = frame[[c for c in frame.columns if c in wanted]]
+            if columns is None:
+                frame = to_packed(frame)
+                frame[MASK_COLUMN] = frame[MASK_COLUMN].astype("uint64")
+            yield frame
+
+
+def test_split_mask(row_ids, test_size=TEST_SIZE, seed=SPLIT_SEED):
+    """True for test rows: a splitmix64 hash of (seed, global row number), so any chunking gives the same split."""
+    z = np.asarray(row_ids, dtype=np.uint64) + np.uint64(seed * 0x9E3779B97F4A7C15 % (1 << 64))
+    with np.errstate(over="ignore"):
+        z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        z = z ^ (z >> np.uint64(31))
+    return (z >> np.uint64(11)).astype(np.float64) / float(1 << 53) < test_size
+
+
+def feature_matrix(frame: pd.DataFrame, species_levels=SPECIES) -> np.ndarray:
+    """float32 model matrix in feature_layout(species_levels) order; unknown species get an all-zero one-hot."""
+    return assemble_features(
+        frame[list(VITAL_COLUMNS)].to_numpy(dtype=np.float32),
+        frame[MASK_COLUMN].to_numpy(dtype=np.uint64),
+        category_codes(frame["Animal_Type"], list(species_levels)),
+        len(species_levels),
+    )
+
+
+class ChunkIter(xgb.DataIter):
+    """Feeds one side of the hash split to XGBoost, one chunk at a time."""
+
+    def __init__(self, dataset_path, chunk_rows, classes, class_weights, test=False, cache_prefix=None):
+        super().__init__(cache_prefix=cache_prefix)
+        self.dataset_path = dataset_path
+        self.chunk_rows = chunk_rows
+        self.classes = list(classes)
+        self.class_weights = class_weights
+        self.test = test
+        self._chunks = None
+        self._row = 0
+
+    def reset(self):
+        self._chunks = None
+        self._row = 0
+
+    def batches(self):
+        """(X, y) for this iterator's rows of every chunk."""
+        row = 0
+        for frame in iter_dataset_chunks(self.dataset_path, self.chunk_rows):
+            keep = test_split_mask(np.arange(row, row + len(frame))) == self.test
+            row += len(frame)
+            if not keep.any():
+                continue
+            frame = frame[keep]
+            y = pd.Categorical(frame["Disease_Prediction"].astype(str), categories=self.classes).codes
+            yield feature_matrix(frame), y.astype(np.int32)
+
+    def next(self, input_data):
+        if self._chunks is None:
+            self._chunks = self.batches()
+        batch = next(self._chunks, None)
+        if batch is None:
+            return False
+        X, y = batch
+        input_data(data=X, label=y, weight=self.class_weights[y])
+        return True
+
+
+def scan_labels(dataset_path, chunk_rows):
+    """First pass over the label and species columns: all labels, per-class train counts, species, row totals."""
+    counts = {}
+    labels = set()
+    species_seen = set()
+    rows = test_rows = 0
+    for frame in iter_dataset_chunks(dataset_path, chunk_rows, columns=("Animal_Type", "Disease_Prediction")):
+        is_test = test_split_mask(np.arange(rows, rows + len(frame)))
+        rows += len(frame)
+        test_rows += int(is_test.sum())
+        frame_labels = frame["Disease_Prediction"].astype(str)
+        labels.update(frame_labels.unique())
+        train_labels = frame_labels[~is_test]
+        for label, count in train_labels.value_counts().items():
+            counts[label] = counts.get(label, 0) + int(count)
+        species_seen.update(frame["Animal_Type"].astype(str).unique())
+    return labels, counts, species_seen, rows, test_rows
+
+
+def train_streaming(dataset_path: str, chunk_rows=DEFAULT_CHUNK_ROWS, external_memory=False):
+    """Out-of-core variant of build_and_train(): memory is bounded by one chunk plus the quantized matrix."""
+    print(f"[1/5] Scanning Dataset: {dataset_path}")
+    memory = StageMemory()
+    try:
+        with memory.stage("scan"):
+            labels, counts, species_seen, rows, test_rows = scan_labels(dataset_path, chunk_rows)
+    except FileNotFoundError:
+        print(
+            f"Error: '{dataset_path}' not found. "
+            "Run generate_data.py or data_ingest.py first."
+        )
+        return
+
+    # Every label gets a class, including ones whose rows all hashed into the test split
+    classes = sorted(labels)
+    test_only = sorted(labels - set(counts))
+    if test_only:
+        print(f"[!] Labels with no training rows (the model cannot predict them): {test_only}")
+    unknown = sorted(species_seen - set(SPECIES))
+    if unknown:
+        print(f"[!] Species not in feature_schema.SPECIES are encoded as all-zero: {unknown}")
+    feature_names = feature_layout(SPECIES)
+    # Same "balanced" weighting as compute_sample_weight, from the streamed train counts
+    train_rows = rows - test_rows
+    class_weights = np.array([train_rows / (len(classes) * max(counts.get(c, 0), 1)) for c in classes],
+                             dtype=np.float32)
+    print(f"   -> Rows: {rows} ({train_rows} train / {test_rows} test), Classes: {len(classes)}")
+
+    print("[2/5] Building Quantized Training Matrix...")
+    print(f"   -> Features: {len(feature_names)}")
+    with tempfile.TemporaryDirectory(prefix="xgb-extmem-") as cache_dir:
+        with memory.stage("quantize"):
+            if external_memory:
+                train_iter = ChunkIter(dataset_path, chunk_rows, classes, class_weights,
+                                       cache_prefix=os.path.join(cache_dir, "train"))
+                dtrain = xgb.ExtMemQuantileDMatrix(train_iter)
+            else:
+                train_iter = ChunkIter(dataset_path, chunk_rows, classes, class_weights)
+                dtrain = xgb.QuantileDMatrix(train_iter)
+            dtrain.feature_names = feature_names
+
+        print("[3/5] Training XGBoost Booster...")
+        with memory.stage("train"):
+            params = dict(XGB_PARAMS, num_class=len(classes), seed=42)
+            booster = xgb.train(params, dtrain, num_boost_round=NUM_BOOST_ROUND)
+            del dtrain
+
+    print("[4/5] Evaluating...")
+    y_true, y_pred = [], []
+    with memory.stage("evaluate"):
+        for X, y in ChunkIter(dataset_path, chunk_rows, classes, class_weights, test=True).batches():
+            y_true.append(y)
+            y_pred.append(booster.inplace_predict(X).argmax(axis=1))
+    y_test = np.concatenate(y_true) if y_true else np.zeros(0, dtype=np.int32)
+    preds = np.concatenate(y_pred) if y_pred else np.zeros(0, dtype=np.int64)
+    accuracy = accuracy_score(y_test, preds)
+    balanced = balanced_accuracy_score(y_test, preds)
+    macro_f1 = f1_score(y_test, preds, average="macro")
+    print(f"   -> Accuracy: {accuracy * 100:.2f}%")
+    print(f"   -> Balanced Accuracy: {balanced * 100:.2f}%")
+    print(f"   -> Macro F1: {macro_f1 * 100:.2f}%")
+
+    print("\n[!] Top 5 Key Predictors:")
+    gains = booster.get_score(importance_type="gain")
+    total = sum(gains.values()) or 1.0
+    for i, (name, gain) in enumerate(sorted(gains.items(), key=lambda item: -item[1])[:5]):
+        print(f"    {i+1}. {name}: {gain / total:.4f}")
+
+    print("\n[5/5] Exporting Artifacts...")
+    metrics = {
+        "dataset": dataset_path,
+        "rows": int(rows),
+        "features": int(len(feature_names)),
+        "classes": int(len(classes)),
+        "accuracy": float(accuracy),
+        "balanced_accuracy": float(balanced),
+        "macro_f1": float(macro_f1),
+        "mode": "external_memory" if external_memory else "stream",
+        "trained_at": datetime.utcnow().isoformat() + "Z",
+    }
+    with memory.stage("export"):
+        # The pickles are rebuilt from the booster so the pickle fallback never serves an older model
+        save_legacy_artifacts(booster, feature_names, classes)
+        export_bundle(booster, feature_names, classes, metrics)
+
+    print("   -> Peak RSS by stage: " + ", ".join(f"{name} {mb} MB" for name, mb in memory.peaks.items()))
+    with open("training_metrics.json", "w", encoding="utf-8") as handle:
+        json.dump(dict(metrics, peak_rss_mb=memory.peaks), handle, indent=2)
+
     print("Build Complete.")
 
+
 if __name__ == "__main__":
     args = parse_args()
-    build_and_train(args.dataset)
+    if args.export_bundle:
+        export_existing_artifacts()
+    elif args.stream:
+        train_streaming(args.dataset, chunk_rows=args.chunk_rows, external_memory=args.external_memory)
+    else:
+        tiers = [DEFAULT_TIER] + [t for t in args.tiers.split(",") if t and t != DEFAULT_TIER]
+        unknown = [t for t in tiers if t not in TIERS]
+        if unknown:
+            raise SystemExit(f"Unknown tier(s) {unknown}; choose from {list(TIERS)}")
+        build_and_train(
+            args.dataset,
+            cache_dir=None if args.no_cache else TRAIN_CACHE_DIR,
+            tiers=tiers,
+            species_shards=args.species_shards,
+            dedup=args.dedup,
+        )
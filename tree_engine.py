@@ -0,0 +1,364 @@
+"""Flattened, NumPy-only evaluator for the trained XGBoost booster.
+
+The booster's JSON model is unpacked into contiguous node arrays (feature
+index, threshold, child pointers, default direction and leaf value) so a
+prediction is a handful of vectorized gathers per tree level instead of a
+call into the general-purpose XGBoost predictor. Models saved as UBJSON
+(`model.ubj`) are decoded here directly, so serving with this engine does not
+import xgboost at all.
+
+Usage (parity + latency check against the shipped model):
+    python tree_engine.py --dataset enhanced_animal_disease.csv
+"""
+import argparse
+import json
+import struct
+import time
+
+import numpy as np
+
+from feature_schema import VITAL_COLUMNS
+
+SUPPORTED_OBJECTIVES = ("multi:softprob", "multi:softmax")
+PROBE_VITALS = (38.0, 80, 20, 100)
+
+# UBJSON scalar markers used by XGBoost (big-endian)
+_UBJ_TYPES = {
+    ord("i"): ">b", ord("U"): ">B", ord("I"): ">h", ord("l"): ">i",
+    ord("L"): ">q", ord("d"): ">f", ord("D"): ">d",
+}
+_UBJ_STRUCTS = {marker: struct.Struct(fmt) for marker, fmt in _UBJ_TYPES.items()}
+_UBJ_DTYPES = {marker: np.dtype(fmt) for marker, fmt in _UBJ_TYPES.items()}
+
+
+class FlatForest:
+    def __init__(self, feature, threshold, children, default_left, value,
+                 roots, tree_class, base_margin, max_depth):
+        self.feature = feature
+        self.threshold = threshold
+        # Interleaved (left, right) pairs: child of `node` is children[2 * node + go_right]
+        self.children = children
+        self.default_left = default_left
+        self.value = value
+        self.roots = roots
+        self.tree_class = tree_class
+        self.max_depth = max_depth
+        self.base_margin = base_margin
+        self.num_class = len(base_margin)
+        self.num_trees = len(roots)
+
+    @classmethod
+    def from_booster(cls, booster):
+        """Flatten every tree of a multi-class booster into shared node arrays."""
+        return cls.from_model(json.loads(booster.save_raw("json")))
+
+    @classmethod
+    def from_file(cls, path):
+        """Load a model saved with `Booster.save_model` (.ubj or .json) without xgboost."""
+        path = str(path)
+        if path.endswith(".json"):
+            with open(path, "r", encoding="utf-8") as handle:
+                return cls.from_model(json.load(handle))
+        with open(path, "rb") as handle:
+            return cls.from_model(load_ubjson(handle.read()))
+
+    @classmethod
+    def load(cls, path):
+        """Load arrays written by `save` (the fast-start path: no JSON/UBJSON parsing)."""
+        with np.load(path) as arrays:
+            return cls(
+                feature=arrays["feature"].astype(np.intp),
+                threshold=arrays["threshold"],
+                children=arrays["children"].astype(np.intp),
+                default_left=arrays["default_left"],
+                value=arrays["value"],
+                roots=arrays["roots"].astype(np.intp),
+                tree_class=arrays["tree_class"].astype(np.intp),
+                base_margin=arrays["base_margin"],
+                max_depth=int(arrays["max_depth"]),
+            )
+
+    def save(self, path):
+        with open(path, "wb") as handle:
+            np.savez_compressed(
+                handle,
+                feature=self.feature.astype(np.int32),
+                threshold=self.threshold,
+                children=self.children.astype(np.int32),
+                default_left=self.default_left,
+                value=self.value,
+                roots=self.roots.astype(np.int32),
+                tree_class=self.tree_class.astype(np.int32),
+                base_margin=self.base_margin,
+                max_depth=np.int32(self.max_depth),
+            )
+
+    @classmethod
+    def from_model(cls, model_json):
+        learner = model_json["learner"]
+        objective = learner["objective"]["name"]
+        if objective not in SUPPORTED_OBJECTIVES:
+            raise ValueError(f"Unsupported objective for native engine: {objective}")
+
+        model = learner["gradient_booster"]["model"]
+        trees = model["trees"]
+        num_class = int(learner["learner_model_param"]["num_class"])
+
+        feature, threshold, left, right, default_left, value, roots = [], [], [], [], [], [], []
+        max_depth = 0
+        offset = 0
+        for tree in trees:
+            if any(tree["split_type"]):
+                raise ValueError("Categorical splits are not supported by the native engine")
+
+            lc = np.asarray(tree["left_children"], dtype=np.int32)
+            rc = np.asarray(tree["right_children"], dtype=np.int32)
+            cond = np.asarray(tree["split_conditions"], dtype=np.float32)
+            is_leaf = lc == -1
+            own = np.arange(len(lc), dtype=np.int32)
+
+            # Leaves point at themselves so extra levels are a no-op
+            left.append(np.where(is_leaf, own, lc) + offset)
+            right.append(np.where(is_leaf, own, rc) + offset)
+            feature.append(np.where(is_leaf, 0, tree["split_indices"]).astype(np.int32))
+            threshold.append(np.where(is_leaf, 0.0, cond).astype(np.float32))
+            value.append(np.where(is_leaf, cond, 0.0).astype(np.float32))
+            default_left.append(np.asarray(tree["default_left"], dtype=bool))
+            roots.append(offset)
+            max_depth = max(max_depth, _tree_depth(lc, rc))
+            offset += len(lc)
+
+        return cls(
+            feature=np.concatenate(feature).astype(np.intp),
+            threshold=np.concatenate(threshold),
+            children=np.stack([np.concatenate(left), np.concatenate(right)], axis=1).ravel().astype(np.intp),
+            default_left=np.concatenate(default_left),
+            value=np.concatenate(value),
+            roots=np.asarray(roots, dtype=np.intp),
+            tree_class=np.asarray(model["tree_info"], dtype=np.intp),
+            base_margin=_parse_base_score(learner["learner_model_param"]["base_score"], num_class),
+            max_depth=max_depth,
+        )
+
+    def leaf_values(self, X):
+        """Walk all trees level by level; returns an (n_rows x n_trees) leaf value matrix."""
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X[None, :]
+        n_rows, n_features = X.shape
+        flat_X = X.ravel()
+        row_offset = (np.arange(n_rows, dtype=np.intp) * n_features)[:, None]
+        has_missing = bool(np.isnan(flat_X).any())
+
+        # np.take on flat arrays is markedly cheaper than 2-D fancy indexing
+        node = np.broadcast_to(self.roots, (n_rows, self.num_trees))
+        for _ in range(self.max_depth):
+            x = flat_X.take(row_offset + self.feature.take(node))
+            go_right = x >= self.threshold.take(node)
+            if has_missing:
+                go_right = np.where(np.isnan(x), ~self.default_left.take(node), go_right)
+            node = self.children.take(2 * node + go_right)
+        return self.value.take(node)
+
+    def predict_margin(self, X):
+        leaves = self.leaf_values(X)
+        n_rows = len(leaves)
+        slots = (np.arange(n_rows, dtype=np.intp)[:, None] * self.num_class + self.tree_class).ravel()
+        margin = np.bincount(slots, weights=leaves.ravel(), minlength=n_rows * self.num_class)
+        return margin.reshape(n_rows, self.num_class) + self.base_margin
+
+    def predict(self, X):
+        """Class probabilities, matching `Booster.predict` for multi:softprob."""
+        margin = self.predict_margin(X)
+        margin -= margin.max(axis=1, keepdims=True)
+        np.exp(margin, out=margin)
+        margin /= margin.sum(axis=1, keepdims=True)
+        return margin.astype(np.float32)
+
+
+def _tree_depth(left, right):
+    depth = np.zeros(len(left), dtype=np.int32)
+    # XGBoost numbers children after their parent, so one forward pass suffices
+    for node in range(len(left)):
+        if left[node] != -1:
+            depth[left[node]] = depth[right[node]] = depth[node] + 1
+    return int(depth.max())
+
+
+def _parse_base_score(raw, num_class):
+    # XGBoost >= 3 stores one intercept per class as "[a,b,...]"
+    values = np.asarray(json.loads(raw) if raw.startswith("[") else [float(raw)], dtype=np.float64)
+    return np.broadcast_to(values, (num_class,)).copy()
+
+
+class _UBJReader:
+    # Markers are compared as ints (bytes indexing) and scalars go through struct;
+    # both matter because a 14k-tree model holds hundreds of thousands of values
+    def __init__(self, data):
+        self.data = data
+        self.pos = 0
+
+    def _marker(self):
+        data, pos = self.data, self.pos
+        while data[pos] == 0x4E:  # 'N' no-op padding
+            pos += 1
+        self.pos = pos + 1
+        return data[pos]
+
+    def _scalar(self, marker):
+        unpacker = _UBJ_STRUCTS[marker]
+        value = unpacker.unpack_from(self.data, self.pos)[0]
+        self.pos += unpacker.size
+        return value
+
+    def _string(self):
+        size = self._scalar(self._marker())
+        start = self.pos
+        self.pos += size
+        return self.data[start:self.pos].decode("utf-8")
+
+    def value(self, marker=None):
+        if marker is None:
+            marker = self._marker()
+        if marker in _UBJ_STRUCTS:
+            return self._scalar(marker)
+        if marker == 0x53 or marker == 0x48:  # 'S' string, 'H' high-precision number
+            return self._string()
+        if marker == 0x7B:  # '{'
+            return self._object()
+        if marker == 0x5B:  # '['
+            return self._array()
+        if marker == 0x54:  # 'T'
+            return True
+        if marker == 0x46:  # 'F'
+            return False
+        if marker == 0x5A:  # 'Z'
+            return None
+        if marker == 0x43:  # 'C'
+            self.pos += 1
+            return chr(self.data[self.pos - 1])
+        raise ValueError(f"Unsupported UBJSON marker {chr(marker)!r} at offset {self.pos - 1}")
+
+    def _header(self):
+        item_type = count = None
+        if self.data[self.pos] == 0x24:  # '$'
+            item_type = self.data[self.pos + 1]
+            self.pos += 2
+        if self.data[self.pos] == 0x23:  # '#'
+            self.pos += 1
+            count = self._scalar(self._marker())
+        return item_type, count
+
+    def _array(self):
+        item_type, count = self._header()
+        if count is not None and item_type in _UBJ_DTYPES:
+            # Typed arrays (XGBoost's node vectors) decode straight into NumPy
+            dtype = _UBJ_DTYPES[item_type]
+            values = np.frombuffer(self.data, dtype=dtype, count=count, offset=self.pos)
+            self.pos += dtype.itemsize * count
+            return values
+        if count is not None:
+            return [self.value(item_type) for _ in range(count)]
+        items = []
+        while True:
+            marker = self._marker()
+            if marker == 0x5D:  # ']'
+                return items
+            items.append(self.value(marker))
+
+    def _object(self):
+        item_type, count = self._header()
+        result = {}
+        if count is not None:
+            for _ in range(count):
+                key = self._string()
+                result[key] = self.value(item_type)
+            return result
+        while self.data[self.pos] != 0x7D:  # '}'
+            key = self._string()
+            result[key] = self.value()
+        self.pos += 1
+        return result
+
+
+def load_ubjson(data):
+    """Decode the UBJSON subset XGBoost writes; typed arrays become (big-endian) NumPy views."""
+    return _UBJReader(bytes(data)).value()
+
+
+def parity_probe(features, extra_rows=32, seed=0):
+    """Deterministic probe matrix: one row per feature switched on, plus seeded random cases."""
+    n_features = len(features)
+    vital_cols = [features.index(col) for col in VITAL_COLUMNS]
+    flag_cols = [i for i in range(n_features) if i not in vital_cols]
+
+    X = np.zeros((n_features + extra_rows, n_features), dtype=np.float32)
+    X[:, vital_cols] = PROBE_VITALS
+    X[np.arange(n_features), np.arange(n_features)] = 1
+
+    rng = np.random.default_rng(seed)
+    random_rows = X[n_features:]
+    random_rows[:, vital_cols] = np.column_stack([
+        np.round(rng.uniform(36.0, 42.0, extra_rows), 1),
+        rng.integers(20, 240, extra_rows),
+        rng.integers(8, 90, extra_rows),
+        rng.integers(0, 101, extra_rows),
+    ])
+    random_rows[:, flag_cols] = rng.random((extra_rows, len(flag_cols))) < 0.1
+    return X
+
+
+def compare_probabilities(expected, actual, atol=1e-5):
+    """Max absolute difference between two probability matrices; raises if above `atol`."""
+    diff = float(np.abs(np.asarray(expected, dtype=np.float32) - actual).max())
+    if diff > atol:
+        raise AssertionError(f"Native engine diverges from booster.predict (max diff {diff:.2e})")
+    return diff
+
+
+def check_parity(booster, forest, X, atol=1e-5):
+    """Max absolute probability difference between the forest and `booster`; raises if above `atol`."""
+    X = np.asarray(X, dtype=np.float32)
+    return compare_probabilities(booster.inplace_predict(X), forest.predict(X), atol)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Check the native tree engine against XGBoost.")
+    parser.add_argument("--model", default="animal_model.pkl", help="Path to the pickled XGBClassifier.")
+    parser.add_argument("--features", default="model_features.pkl", help="Path to the feature list pickle.")
+    parser.add_argument("--dataset", default="enhanced_animal_disease.csv", help="CSV used as parity probe rows.")
+    parser.add_argument("--rows", type=int, default=2000, help="Number of dataset rows to compare.")
+    return parser.parse_args()
+
+
+def main():
+    import joblib
+    import pandas as pd
+
+    args = parse_args()
+    booster = joblib.load(args.model).get_booster()
+    features = joblib.load(args.features)
+
+    start = time.perf_counter()
+    forest = FlatForest.from_booster(booster)
+    print(f"[+] Flattened {forest.num_trees} trees ({len(forest.value)} nodes, depth {forest.max_depth}) "
+          f"in {time.perf_counter() - start:.2f}s")
+
+    df = pd.read_csv(args.dataset, nrows=args.rows)
+    X = pd.get_dummies(df.drop(columns="Disease_Prediction"), columns=["Animal_Type"])
+    X = X.reindex(columns=features, fill_value=0).to_numpy(dtype=np.float32)
+
+    diff = check_parity(booster, forest, X)
+    print(f"[+] Parity OK on {len(X)} rows (max abs diff {diff:.2e})")
+
+    row = X[:1]
+    for name, fn in (("xgboost", booster.inplace_predict), ("native", forest.predict)):
+        fn(row)
+        start = time.perf_counter()
+        for _ in range(200):
+            fn(row)
+        print(f"    {name:<8} single-row: {(time.perf_counter() - start) / 200 * 1e3:.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
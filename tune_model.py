@@ -0,0 +1,270 @@
+"""Successive-halving search over depth, learning rate and round count.
+
+Every candidate trains with early stopping on a validation split carved out of
+the training rows, on a process pool whose XGBoost threads share one CPU
+budget. Each trained model is then timed on single-row predictions, and the
+fastest model whose validation accuracy is within `--tolerance` of the best is
+selected. Test rows are only used for reporting.
+"""
+import argparse
+import itertools
+import json
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import numpy as np
+import xgboost as xgb
+from sklearn.metrics import accuracy_score
+from sklearn.model_selection import train_test_split
+from sklearn.utils.class_weight import compute_sample_weight
+
+from train_model import (
+    BUNDLE_DIR,
+    SPLIT_SEED,
+    TEST_SIZE,
+    TRAIN_CACHE_DIR,
+    XGB_PARAMS,
+    default_dataset,
+    export_bundle,
+    load_prepared,
+    measure_latency,
+    read_bundle,
+    save_legacy_artifacts,
+    split_labels,
+    split_matrix,
+)
+
+RESULTS_PATH = "tuning_results.json"
+
+# Per-worker training data, built once by the pool initializer
+_data = {}
+
+
+def parse_list(text, cast):
+    return [cast(item) for item in text.split(",") if item.strip()]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Tune model depth, learning rate and rounds for accuracy and latency.")
+    parser.add_argument("--dataset", default=default_dataset(), help="Training dataset CSV.")
+    parser.add_argument("--depths", default="3,4,5,6,7", help="Comma-separated max_depth values.")
+    parser.add_argument("--learning-rates", default="0.05,0.1,0.2,0.3", help="Comma-separated learning rates.")
+    parser.add_argument("--min-rounds", type=int, default=50, help="Round budget of the first rung.")
+    parser.add_argument("--max-rounds", type=int, default=700, help="Round budget of the last rung.")
+    parser.add_argument("--eta", type=int, default=3, help="Keep 1/eta of the candidates per rung and grow the budget eta-fold.")
+    parser.add_argument("--early-stopping", type=int, default=20, help="Rounds without validation improvement before stopping.")
+    parser.add_argument("--threads", type=int, default=os.cpu_count() or 1, help="Total XGBoost threads across workers.")
+    parser.add_argument("--workers", type=int, default=None, help="Parallel trainings (default: min(4, threads)).")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.005,
+        help="Accept models whose validation accuracy is within this much of the best (0.005 = 0.5 points).",
+    )
+    parser.add_argument("--output", default=RESULTS_PATH, help="Where to write the candidate table.")
+    parser.add_argument(
+        "--export",
+        action="store_true",
+        help="Make the selected model the default tier of model_bundle/ (and the pickles); other tiers and shards are kept.",
+    )
+    parser.add_argument("--no-cache", action="store_true", help="Do not use the prepared matrix cache.")
+    return parser.parse_args()
+
+
+def rung_budgets(min_rounds, max_rounds, eta):
+    budgets = []
+    rounds = min_rounds
+    while rounds < max_rounds:
+        budgets.append(rounds)
+        rounds *= eta
+    budgets.append(max_rounds)
+    return budgets
+
+
+def validation_split(y_train):
+    """Positions within the training rows: (fit, validation), stratified like the train/test split."""
+    return train_test_split(
+        np.arange(len(y_train)),
+        test_size=TEST_SIZE,
+        random_state=SPLIT_SEED,
+        stratify=np.asarray(y_train),
+    )
+
+
+def _init_worker(dataset_path, cache_dir, nthread):
+    prepared, _ = load_prepared(dataset_path, cache_dir)
+    y = split_labels(prepared, "train")
+    fit_idx, val_idx = validation_split(y)
+    names = prepared["feature_names"]
+    _data["dfit"] = xgb.DMatrix(
+        split_matrix(prepared, "train", fit_idx), label=y[fit_idx],
+        weight=compute_sample_weight("balanced", y[fit_idx]), feature_names=names,
+    )
+    _data["dval"] = xgb.DMatrix(split_matrix(prepared, "train", val_idx), label=y[val_idx], feature_names=names)
+    _data["y_val"] = y[val_idx]
+    _data["num_class"] = len(prepared["classes"])
+    _data["nthread"] = nthread
+
+
+def fit_candidate(config, budget, early_stopping):
+    """Train one configuration for at most `budget` rounds; returns its scores and the trimmed model."""
+    params = dict(XGB_PARAMS, **config, num_class=_data["num_class"], seed=42, nthread=_data["nthread"])
+    started = time.perf_counter()
+    booster = xgb.train(
+        params,
+        _data["dfit"],
+        num_boost_round=budget,
+        evals=[(_data["dval"], "val")],
+        early_stopping_rounds=early_stopping,
+        verbose_eval=False,
+    )
+    rounds = booster.best_iteration + 1
+    val_logloss = float(booster.best_score)
+    booster = booster[:rounds]
+    preds = booster.predict(_data["dval"]).argmax(axis=1)
+    return {
+        **config,
+        "budget": budget,
+        "rounds": rounds,
+        "stopped_early": rounds + early_stopping <= budget,
+        "val_logloss": val_logloss,
+        "val_accuracy": float(accuracy_score(_data["y_val"], preds)),
+        "train_seconds": round(time.perf_counter() - started, 3),
+        "model": bytes(booster.save_raw(raw_format="ubj")),
+    }
+
+
+def successive_halving(pool, configs, budgets, eta, early_stopping):
+    """Run every rung; returns every evaluated result (one per config and rung actually trained)."""
+    results = []
+    survivors = list(configs)
+    latest = {}
+    for rung, budget in enumerate(budgets):
+        print(f"[*] Rung {rung + 1}/{len(budgets)}: {len(survivors)} candidate(s) x {budget} rounds")
+        pending = {}
+        for config in survivors:
+            key = tuple(sorted(config.items()))
+            previous = latest.get(key)
+            # A run that already early-stopped would stop at the same round with a bigger budget
+            if previous is not None and previous["stopped_early"]:
+                continue
+            pending[key] = pool.submit(fit_candidate, config, budget, early_stopping)
+        for key, future in pending.items():
+            result = future.result()
+            latest[key] = result
+            results.append(result)
+            print(f"    depth={result['max_depth']} lr={result['learning_rate']}: {result['rounds']} rounds, "
+                  f"val logloss {result['val_logloss']:.4f}, val acc {result['val_accuracy'] * 100:.2f}%")
+        ranked = sorted(survivors, key=lambda config: latest[tuple(sorted(config.items()))]["val_logloss"])
+        survivors = ranked[:max(1, math.ceil(len(ranked) / eta))]
+    return results
+
+
+def existing_extras(feature_names, classes, bundle_dir=BUNDLE_DIR):
+    """(extra tiers, shards) of the current bundle, when it was trained on the same features and classes."""
+    bundle = read_bundle(bundle_dir)
+    if bundle is None:
+        return {}, {}
+    _, features, bundle_classes, _, tiers, shards = bundle
+    if features != list(feature_names) or bundle_classes != [str(c) for c in classes]:
+        if tiers or shards:
+            print(f"[!] {bundle_dir}/ was trained on other features or classes; dropping its tiers "
+                  f"{sorted(tiers)} and shards {sorted(shards)} (retrain them with train_model.py)")
+        return {}, {}
+    return tiers, shards
+
+
+def export_selected(booster, feature_names, classes, metrics):
+    """Replace the default tier, keeping the bundle's other tiers and shards, and rewrite the pickles to match."""
+    tiers, shards = existing_extras(feature_names, classes)
+    if tiers or shards:
+        print(f"   -> Keeping tiers {sorted(tiers)} and shards {sorted(shards)} from the current bundle")
+    save_legacy_artifacts(booster, feature_names, classes)
+    with open("training_metrics.json", "w", encoding="utf-8") as handle:
+        json.dump(metrics, handle, indent=2)
+    export_bundle(booster, feature_names, classes, metrics, tiers=tiers, shards=shards)
+
+
+def main():
+    args = parse_args()
+    threads = max(1, args.threads)
+    workers = max(1, min(args.workers or min(4, threads), threads))
+    nthread = max(1, threads // workers)
+    cache_dir = None if args.no_cache else TRAIN_CACHE_DIR
+
+    print(f"[*] Preparing {args.dataset}")
+    prepared, _ = load_prepared(args.dataset, cache_dir)
+    X_test, y_test = split_matrix(prepared, "test"), split_labels(prepared, "test")
+    probe_rows = [X_test[i:i + 1] for i in range(min(len(X_test), 64))]
+
+    configs = [
+        {"max_depth": depth, "learning_rate": lr}
+        for depth, lr in itertools.product(parse_list(args.depths, int), parse_list(args.learning_rates, float))
+    ]
+    budgets = rung_budgets(args.min_rounds, args.max_rounds, args.eta)
+    print(f"[*] {len(configs)} configurations, budgets {budgets}, {workers} worker(s) x {nthread} thread(s)")
+
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker,
+        initargs=(args.dataset, cache_dir, nthread),
+    ) as pool:
+        results = successive_halving(pool, configs, budgets, args.eta, args.early_stopping)
+
+    # Time every trained model serially so the numbers don't compete with training threads
+    print("[*] Measuring single-row latency...")
+    models = {}
+    for index, result in enumerate(results):
+        booster = xgb.Booster(model_file=bytearray(result.pop("model")))
+        result["latency_p50_ms"], result["latency_p95_ms"] = measure_latency(booster, probe_rows)
+        result["test_accuracy"] = float(accuracy_score(y_test, booster.inplace_predict(X_test).argmax(axis=1)))
+        models[index] = booster
+
+    best = max(result["val_accuracy"] for result in results)
+    eligible = [i for i, result in enumerate(results) if result["val_accuracy"] >= best - args.tolerance]
+    chosen = min(eligible, key=lambda i: (results[i]["latency_p50_ms"], -results[i]["val_accuracy"]))
+    selected = results[chosen]
+
+    print("\n[+] Candidates (fastest first):")
+    for result in sorted(results, key=lambda r: r["latency_p50_ms"]):
+        marker = "*" if result is selected else " "
+        print(f"  {marker} depth={result['max_depth']} lr={result['learning_rate']} rounds={result['rounds']}: "
+              f"val {result['val_accuracy'] * 100:.2f}%, test {result['test_accuracy'] * 100:.2f}%, "
+              f"p50 {result['latency_p50_ms']:.3f} ms")
+    print(f"\n[+] Selected depth={selected['max_depth']} lr={selected['learning_rate']} rounds={selected['rounds']} "
+          f"(best val accuracy {best * 100:.2f}%, tolerance {args.tolerance * 100:.2f} points)")
+
+    report = {
+        "dataset": args.dataset,
+        "tolerance": args.tolerance,
+        "budgets": budgets,
+        "threads": threads,
+        "workers": workers,
+        "selected": selected,
+        "candidates": results,
+        "tuned_at": datetime.utcnow().isoformat() + "Z",
+    }
+    with open(args.output, "w", encoding="utf-8") as handle:
+        json.dump(report, handle, indent=2)
+    print(f"   -> Results written to {args.output}")
+
+    if args.export:
+        metrics = {
+            "dataset": args.dataset,
+            "rows": prepared["rows"],
+            "features": len(prepared["feature_names"]),
+            "classes": len(prepared["classes"]),
+            "accuracy": selected["test_accuracy"],
+            "params": {"max_depth": selected["max_depth"], "learning_rate": selected["learning_rate"],
+                       "rounds": selected["rounds"]},
+            "latency_p50_ms": selected["latency_p50_ms"],
+            "trained_at": report["tuned_at"],
+        }
+        export_selected(models[chosen], prepared["feature_names"], prepared["classes"], metrics)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,390 @@
+"""Incremental model refresh from newly ingested rows.
+
+Loads the current model from the bundle (default tier, extra tiers and
+species shards; the pickles only when there is no bundle) and updates it with only the new rows: either by boosting a
+few more rounds on top of the existing trees (`continue`) or by re-fitting the
+leaf values of the existing trees (`refresh`, same size and latency). The
+current model is scored on a held-out slice of the new rows and on the
+reference dataset's test split before and after, and both are recorded in
+training_metrics.json.
+
+Schema changes (new symptoms, species or diseases) and drifted inputs cannot be
+fixed by an update, so they fall back to a full `build_and_train()` over
+`--dataset`, which should already contain the new rows (data_ingest.py output).
+"""
+import argparse
+import json
+import time
+from datetime import datetime
+from pathlib import Path
+
+import joblib
+import numpy as np
+import xgboost as xgb
+from sklearn.metrics import accuracy_score, f1_score
+from sklearn.model_selection import train_test_split
+
+from feature_schema import SPECIES_PREFIX
+from train_model import (
+    BUNDLE_DIR,
+    DEFAULT_DATASET,
+    DEFAULT_TIER,
+    SPLIT_SEED,
+    TEST_SIZE,
+    TIERS,
+    TRAIN_CACHE_DIR,
+    XGB_PARAMS,
+    build_and_train,
+    export_bundle,
+    feature_layout,
+    feature_matrix,
+    load_dataset,
+    load_prepared,
+    read_bundle,
+    save_legacy_artifacts,
+    split_labels,
+    split_matrix,
+)
+
+UPDATE_ROUNDS = 50
+# Population stability index above which a feature counts as drifted
+DRIFT_PSI_THRESHOLD = 0.25
+# Drop of the current model's accuracy on new rows (vs its recorded accuracy) that counts as concept drift
+ACCURACY_DRIFT = 0.05
+# An update that loses more accuracy than this on either evaluation set is not exported
+MAX_REGRESSION = 0.01
+# Reference rows sampled for the drift check
+DRIFT_SAMPLE_ROWS = 200_000
+MAX_UPDATE_HISTORY = 20
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Update the current model with newly ingested rows.")
+    parser.add_argument("new_data", help="CSV of rows added since the last training run (wide or packed).")
+    parser.add_argument(
+        "--dataset",
+        default=None,
+        help="Reference dataset: drift baseline, regression check and full-retrain fallback "
+             "(default: the dataset recorded in training_metrics.json).",
+    )
+    parser.add_argument(
+        "--mode",
+        choices=("continue", "refresh"),
+        default="continue",
+        help="continue: boost extra rounds on the new rows; refresh: re-fit leaf values of the existing trees.",
+    )
+    parser.add_argument("--rounds", type=int, default=UPDATE_ROUNDS, help="Extra rounds with --mode continue.")
+    parser.add_argument("--drift-threshold", type=float, default=DRIFT_PSI_THRESHOLD, help="Max PSI per feature.")
+    parser.add_argument(
+        "--no-retrain",
+        action="store_true",
+        help="Stop instead of falling back to a full retrain when the schema changed or drift is detected.",
+    )
+    parser.add_argument("--no-cache", action="store_true", help="Do not use the prepared matrix cache.")
+    return parser.parse_args()
+
+
+def load_current_model(bundle_dir=BUNDLE_DIR):
+    """(booster, classes, features, metrics, extra tiers, shards) of the deployed model.
+
+    The bundle is what app.py serves, so it is read first; the pickles are only
+    used when there is no manifest (a model trained before bundles existed).
+    """
+    try:
+        with open("training_metrics.json", "r", encoding="utf-8") as handle:
+            metrics = json.load(handle)
+    except FileNotFoundError:
+        metrics = {}
+
+    bundle = read_bundle(bundle_dir)
+    if bundle is not None:
+        booster, features, classes, bundle_metrics, tiers, shards = bundle
+        return booster, classes, features, bundle_metrics or metrics, tiers, shards
+
+    print(f"   -> No bundle in {bundle_dir}/; updating the pickled model")
+    model = joblib.load("animal_model.pkl")
+    le = joblib.load("label_encoder.pkl")
+    features = list(joblib.load("model_features.pkl"))
+    return model.get_booster(), [str(c) for c in le.classes_], features, metrics, {}, {}
+
+
+def schema_problems(features, classes, df):
+    """Reasons the new rows cannot be scored by the current model's layout; empty when they can."""
+    problems = []
+    species_levels = [name[len(SPECIES_PREFIX):] for name in features if name.startswith(SPECIES_PREFIX)]
+    if feature_layout(species_levels) != features:
+        problems.append("feature layout differs from the model's features (symptom registry or vitals changed)")
+    new_species = sorted(set(df["Animal_Type"].astype(str)) - set(species_levels))
+    if new_species:
+        problems.append(f"unseen species {new_species}")
+    new_labels = sorted(set(df["Disease_Prediction"].astype(str)) - set(classes))
+    if new_labels:
+        problems.append(f"unseen diseases {new_labels}")
+    return species_levels, problems
+
+
+def population_stability(reference, current, bins=10):
+    """PSI of one feature: quantile bins from the reference, two bins for 0/1 features."""
+    if len(np.unique(reference)) <= 2:
+        edges = np.array([0.5])
+    else:
+        edges = np.unique(np.quantile(reference, np.linspace(0, 1, bins + 1)[1:-1]))
+    ref = np.bincount(np.searchsorted(edges, reference, side="right"), minlength=len(edges) + 1) / len(reference)
+    cur = np.bincount(np.searchsorted(edges, current, side="right"), minlength=len(edges) + 1) / len(current)
+    ref, cur = np.clip(ref, 1e-4, None), np.clip(cur, 1e-4, None)
+    return float(np.sum((cur - ref) * np.log(cur / ref)))
+
+
+def reference_sample(reference):
+    """Model matrix of at most DRIFT_SAMPLE_ROWS training rows, expanded from the prepared columns."""
+    rows = len(reference["train_idx"])
+    if rows <= DRIFT_SAMPLE_ROWS:
+        return split_matrix(reference, "train")
+    rng = np.random.default_rng(SPLIT_SEED)
+    return split_matrix(reference, "train", np.sort(rng.choice(rows, DRIFT_SAMPLE_ROWS, replace=False)))
+
+
+def drift_report(reference_X, new_X, features):
+    psi = {name: population_stability(reference_X[:, i], new_X[:, i]) for i, name in enumerate(features)}
+    worst = max(psi, key=psi.get)
+    return {
+        "max_psi": round(psi[worst], 4),
+        "feature": worst,
+        "top": {name: round(value, 4) for name, value in sorted(psi.items(), key=lambda item: -item[1])[:5]},
+    }
+
+
+def score(booster, X, y):
+    if len(y) == 0:
+        return None
+    preds = booster.inplace_predict(X).argmax(axis=1)
+    return {
+        "rows": int(len(y)),
+        "accuracy": float(accuracy_score(y, preds)),
+        "macro_f1": float(f1_score(y, preds, average="macro", zero_division=0)),
+    }
+
+
+def compare_update(old_booster, new_booster, eval_sets):
+    """(before, after, names of the evaluation sets where accuracy fell by more than MAX_REGRESSION)."""
+    before = {name: score(old_booster, X, y) for name, (X, y) in eval_sets.items()}
+    after = {name: score(new_booster, X, y) for name, (X, y) in eval_sets.items()}
+    regressed = [
+        name for name in eval_sets
+        if before[name] and after[name] and after[name]["accuracy"] < before[name]["accuracy"] - MAX_REGRESSION
+    ]
+    return before, after, regressed
+
+
+def species_eval_sets(eval_sets, column, local):
+    """The rows of one species in each evaluation set, labelled in its shard's classes (-1 = not a shard class)."""
+    sliced = {}
+    for name, (X, y) in eval_sets.items():
+        rows = np.flatnonzero(X[:, column] == 1)
+        sliced[name] = (X[rows], np.array([local.get(label, -1) for label in y[rows]], dtype=np.int64))
+    return sliced
+
+
+def update_booster(booster, dtrain, mode, rounds, num_class, params=None):
+    """A new booster: `rounds` more trees per class, or the same trees with leaves re-fitted on `dtrain`."""
+    params = dict(XGB_PARAMS, **(params or {}), num_class=num_class, seed=42)
+    if mode == "refresh":
+        params.update(process_type="update", updater="refresh", refresh_leaf=True)
+        params.pop("tree_method")
+        rounds = booster.num_boosted_rounds()
+    # xgb.train copies `xgb_model`, so the current booster stays usable for the before/after comparison
+    return xgb.train(params, dtrain, num_boost_round=rounds, xgb_model=booster)
+
+
+def class_weights(y, num_classes):
+    """Per-class weights equivalent to compute_sample_weight("balanced") over `y`."""
+    counts = np.bincount(y, minlength=num_classes).astype(np.float64)
+    return len(y) / (num_classes * np.maximum(counts, 1.0))
+
+
+def full_retrain(dataset_path, reason, tiers, shards, cache_dir):
+    print(f"[!] {reason}; falling back to a full retrain on {dataset_path}")
+    build_and_train(
+        dataset_path,
+        cache_dir=cache_dir,
+        tiers=[DEFAULT_TIER] + [name for name in tiers if name in TIERS],
+        species_shards=bool(shards),
+    )
+
+
+def update_model(new_data, dataset_path=None, mode="continue", rounds=UPDATE_ROUNDS,
+                 drift_threshold=DRIFT_PSI_THRESHOLD, retrain=True, cache_dir=TRAIN_CACHE_DIR):
+    started = time.perf_counter()
+    print(f"[1/5] Loading current model and new rows: {new_data}")
+    booster, classes, features, metrics, tiers, shards = load_current_model()
+    dataset_path = dataset_path or metrics.get("dataset") or DEFAULT_DATASET
+    df = load_dataset(new_data)
+    print(f"   -> {len(df):,} new rows; model has {len(features)} features, {len(classes)} classes")
+
+    print("[2/5] Checking schema and drift...")
+    species_levels, problems = schema_problems(features, classes, df)
+    if problems:
+        reason = "Schema changed: " + "; ".join(problems)
+        if retrain:
+            return full_retrain(dataset_path, reason, tiers, shards, cache_dir)
+        print(f"[!] {reason}; not updating")
+        return False
+
+    X_new = feature_matrix(df, species_levels)
+    class_index = {name: i for i, name in enumerate(classes)}
+    y_new = np.array([class_index[label] for label in df["Disease_Prediction"].astype(str)], dtype=np.int64)
+
+    reference = None
+    if Path(dataset_path).exists():
+        reference, _ = load_prepared(dataset_path, cache_dir)
+        if reference["feature_names"] != features or reference["classes"] != classes:
+            print(f"   -> {dataset_path} was encoded differently from the model; skipping reference checks")
+            reference = None
+    else:
+        print(f"   -> Reference dataset {dataset_path} not found; skipping the drift and regression checks")
+
+    drift = drift_report(reference_sample(reference), X_new, features) if reference else None
+    if drift:
+        print(f"   -> Max PSI {drift['max_psi']:.3f} ({drift['feature']})")
+
+    # Hold out part of the new rows to compare the model before and after the update
+    counts = np.bincount(y_new)
+    stratify = y_new if counts[counts > 0].min() >= 2 else None
+    fit_idx, holdout_idx = train_test_split(
+        np.arange(len(y_new)), test_size=TEST_SIZE, random_state=SPLIT_SEED, stratify=stratify,
+    )
+    eval_sets = {"new_holdout": (X_new[holdout_idx], y_new[holdout_idx])}
+    if reference:
+        eval_sets["reference_test"] = (split_matrix(reference, "test"), split_labels(reference, "test"))
+
+    before = {name: score(booster, X, y) for name, (X, y) in eval_sets.items()}
+    recorded = metrics.get("accuracy")
+    holdout_accuracy = before["new_holdout"]["accuracy"]
+    print(f"   -> Current model on new rows: {holdout_accuracy * 100:.2f}%")
+
+    reasons = []
+    if drift and drift["max_psi"] > drift_threshold:
+        reasons.append(f"input drift on {drift['feature']} (PSI {drift['max_psi']:.3f} > {drift_threshold})")
+    if recorded is not None and holdout_accuracy < recorded - ACCURACY_DRIFT:
+        reasons.append(f"accuracy on new rows fell to {holdout_accuracy * 100:.2f}% from {recorded * 100:.2f}%")
+    if reasons:
+        reason = "Drift detected: " + "; ".join(reasons)
+        if retrain:
+            return full_retrain(dataset_path, reason, tiers, shards, cache_dir)
+        print(f"[!] {reason}; not updating")
+        return False
+
+    print(f"[3/5] Updating ({mode}) on {len(fit_idx):,} rows...")
+    X_fit, y_fit = X_new[fit_idx], y_new[fit_idx]
+    # Weight classes like the original training run, not by their share of one day's rows
+    weights = class_weights(split_labels(reference, "train") if reference else y_fit, len(classes))
+    dtrain = xgb.DMatrix(X_fit, label=y_fit, weight=weights[y_fit], feature_names=features)
+    updated = update_booster(booster, dtrain, mode, rounds, len(classes))
+
+    # The compact tier is always leaf-refreshed so it keeps its size and latency
+    tier_candidates = {
+        name: update_booster(tier_booster, dtrain, "refresh", 0, len(classes), TIERS.get(name, {}).get("params"))
+        for name, (tier_booster, _) in tiers.items()
+    }
+
+    shard_candidates, dropped_shards = {}, set()
+    for species, (shard_booster, shard_classes, shard_metrics) in shards.items():
+        rows = np.flatnonzero(X_fit[:, features.index(f"{SPECIES_PREFIX}{species}")] == 1)
+        local = {classes.index(name): i for i, name in enumerate(shard_classes)}
+        if len(rows) and any(label not in local for label in y_fit[rows]):
+            # The species gained a disease its shard cannot output; the global model serves it until a full retrain
+            print(f"   -> Shard '{species}' dropped: new rows include diseases outside its classes")
+            dropped_shards.add(species)
+            continue
+        if len(rows):
+            y_local = np.array([local[label] for label in y_fit[rows]])
+            dshard = xgb.DMatrix(X_fit[rows], label=y_local, weight=weights[y_fit[rows]], feature_names=features)
+            shard_candidates[species] = (update_booster(shard_booster, dshard, mode, rounds, len(shard_classes)),
+                                         int(len(rows)))
+
+    print("[4/5] Evaluating...")
+    after = {name: score(updated, X, y) for name, (X, y) in eval_sets.items()}
+    for name in eval_sets:
+        print(f"   -> {name}: {before[name]['accuracy'] * 100:.2f}% -> {after[name]['accuracy'] * 100:.2f}% "
+              f"({before[name]['rows']:,} rows)")
+    regressed = [name for name in eval_sets if after[name]["accuracy"] < before[name]["accuracy"] - MAX_REGRESSION]
+    if regressed:
+        print(f"[!] Update lowered accuracy on {', '.join(regressed)} by more than "
+              f"{MAX_REGRESSION * 100:.1f} points; keeping the current model")
+        return False
+
+    # Tiers and shards are checked the same way; one that got worse keeps its current booster
+    checks = {}
+    updated_tiers = {}
+    for name, (tier_booster, tier_metrics) in tiers.items():
+        tier_before, tier_after, tier_regressed = compare_update(tier_booster, tier_candidates[name], eval_sets)
+        checks[f"tier:{name}"] = {"before": tier_before, "after": tier_after, "kept": not tier_regressed}
+        tier_metrics = dict(tier_metrics or {})
+        if tier_regressed:
+            print(f"[!] Tier '{name}' lowered accuracy on {', '.join(tier_regressed)}; keeping its current booster")
+        else:
+            tier_booster = tier_candidates[name]
+            if reference:
+                tier_metrics.update(tier_after["reference_test"])
+        updated_tiers[name] = (tier_booster, tier_metrics)
+
+    updated_shards = {}
+    for species, (shard_booster, shard_classes, shard_metrics) in shards.items():
+        if species in dropped_shards:
+            continue
+        if species not in shard_candidates:
+            # No new rows for this species
+            updated_shards[species] = (shard_booster, shard_classes, shard_metrics)
+            continue
+        candidate, update_rows = shard_candidates[species]
+        local = {classes.index(name): i for i, name in enumerate(shard_classes)}
+        slices = species_eval_sets(eval_sets, features.index(f"{SPECIES_PREFIX}{species}"), local)
+        shard_before, shard_after, shard_regressed = compare_update(shard_booster, candidate, slices)
+        checks[f"shard:{species}"] = {"before": shard_before, "after": shard_after, "kept": not shard_regressed}
+        if shard_regressed:
+            print(f"[!] Shard '{species}' lowered accuracy on {', '.join(shard_regressed)}; "
+                  "keeping its current booster")
+        else:
+            shard_booster = candidate
+            shard_metrics = dict(shard_metrics, update_rows=update_rows)
+        updated_shards[species] = (shard_booster, shard_classes, shard_metrics)
+
+    print("[5/5] Exporting Artifacts...")
+    final = after.get("reference_test") or after["new_holdout"]
+    update = {
+        "mode": mode,
+        "new_data": str(new_data),
+        "new_rows": int(len(df)),
+        "rounds_added": int(updated.num_boosted_rounds() - booster.num_boosted_rounds()),
+        "drift": drift,
+        "before": before,
+        "after": after,
+        # Per extra tier and shard: scores on its slice of the evaluation sets and whether the update was kept
+        "checks": checks,
+        "seconds": round(time.perf_counter() - started, 2),
+        "updated_at": datetime.utcnow().isoformat() + "Z",
+    }
+    metrics = dict(metrics, rows=int(metrics.get("rows", 0)) + int(len(df)), accuracy=final["accuracy"],
+                   macro_f1=final["macro_f1"], trained_at=update["updated_at"])
+    metrics["updates"] = (metrics.get("updates") or [])[-(MAX_UPDATE_HISTORY - 1):] + [update]
+
+    # Keep the pickles in step with the bundle so the pickle fallback in app.py serves the same model
+    save_legacy_artifacts(updated, features, classes)
+    with open("training_metrics.json", "w", encoding="utf-8") as handle:
+        json.dump(metrics, handle, indent=2)
+    export_bundle(updated, features, classes, metrics, tiers=updated_tiers, shards=updated_shards)
+    print(f"Update Complete in {update['seconds']:.1f}s.")
+    return True
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    update_model(
+        args.new_data,
+        dataset_path=args.dataset,
+        mode=args.mode,
+        rounds=args.rounds,
+        drift_threshold=args.drift_threshold,
+        retrain=not args.no_retrain,
+        cache_dir=None if args.no_cache else TRAIN_CACHE_DIR,
+    )